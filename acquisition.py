@@ -0,0 +1,91 @@
+# =============================================================================
+# SENTINEL PRO - WORKER DE ADQUISICIÓN OBD-II
+# Hilo dedicado que muestrea el adaptador a ritmo fijo y publica la última lectura
+# =============================================================================
+
+import threading
+import time
+from datetime import datetime
+
+class AcquisitionWorker:
+    """
+    Ejecuta `sample_fn` a intervalo fijo en un hilo propio.
+
+    Es el único que habla con el adaptador OBD-II: los endpoints HTTP solo leen
+    la última lectura publicada con get_snapshot(), que es O(1) y nunca toca el
+    puerto serie. Así el ritmo de muestreo no depende de cuántos clientes hagan
+    polling.
+    """
+
+    def __init__(self, sample_fn, interval=3.0, name="obd-acquisition", on_publish=None):
+        self.sample_fn = sample_fn
+        self.interval = interval
+        self.on_publish = on_publish  # Callback opcional con cada lectura publicada
+        self.name = name
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._sequence = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Arranca el hilo de adquisición (idempotente)"""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return False
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        print(f"[ACQUISITION] ✓ Worker iniciado (intervalo {self.interval}s)")
+        return True
+
+    def stop(self, timeout=None):
+        """Detiene el hilo y espera a que termine el ciclo en curso"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread and thread.is_alive() and thread is not threading.current_thread():
+            thread.join(timeout)
+        print("[ACQUISITION] Worker detenido")
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def get_snapshot(self):
+        """Devuelve una copia de la última lectura publicada (o None si aún no hay)"""
+        with self._lock:
+            return dict(self._snapshot) if self._snapshot is not None else None
+
+    def publish(self, reading):
+        """Publica una lectura como la nueva instantánea compartida"""
+        with self._lock:
+            self._sequence += 1
+            snapshot = dict(reading)
+            snapshot['sequence'] = self._sequence
+            snapshot['sampled_at'] = datetime.now().isoformat()
+            self._snapshot = snapshot
+
+        if self.on_publish:
+            try:
+                self.on_publish(dict(snapshot))
+            except Exception as e:
+                print(f"[ACQUISITION] Error notificando lectura: {e}")
+        return snapshot
+
+    def _run(self):
+        next_tick = time.monotonic()
+
+        while not self._stop_event.is_set():
+            try:
+                reading = self.sample_fn()
+                if reading is not None:
+                    self.publish(reading)
+            except Exception as e:
+                print(f"[ACQUISITION] Error en ciclo de muestreo: {e}")
+
+            # Ritmo fijo: si un ciclo se retrasa no se acumulan ráfagas de lecturas
+            next_tick += self.interval
+            delay = next_tick - time.monotonic()
+            if delay < 0:
+                next_tick = time.monotonic()
+                delay = 0
+            self._stop_event.wait(delay)
@@ -0,0 +1,146 @@
+# =============================================================================
+# SENTINEL PRO - CACHÉ DE RESPUESTAS DE GEMINI
+# LRU en memoria + tier persistente en SQLite, con TTL por endpoint
+# =============================================================================
+
+import json
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import database
+
+# Validez de las respuestas por endpoint (segundos)
+DEFAULT_TTLS = {
+    'common_failures': 30 * 86400,  # Las averías típicas de un modelo no cambian
+    'vehicle_valuation': 7 * 86400,  # Estable dentro de una franja de kilometraje
+    'predictive_analysis': 86400
+}
+
+MILEAGE_BUCKET_KM = 10000
+
+def mileage_bucket(mileage, size=MILEAGE_BUCKET_KM):
+    """Agrupa el kilometraje en franjas (p. ej. 123456 -> 120000)"""
+    try:
+        return int(float(mileage)) // size * size
+    except (TypeError, ValueError):
+        return None
+
+def round_to(value, step):
+    """Redondea un valor al múltiplo de `step` más cercano (para resumir estadísticas)"""
+    if value is None:
+        return None
+    return round(float(value) / step) * step
+
+def _normalize(value):
+    if isinstance(value, str):
+        value = ' '.join(value.lower().split())
+        # "2015" y 2015 deben dar la misma huella
+        return int(value) if value.isdigit() else value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_normalize(v) for v in value]
+    return value
+
+class ResponseCache:
+    """
+    Caché de respuestas de la IA indexada por una huella del prompt normalizado.
+
+    Se busca primero en un LRU en memoria y después en la tabla
+    ai_response_cache, que sobrevive a reinicios. Cada endpoint tiene su TTL.
+    """
+
+    def __init__(self, max_entries=512, ttls=None):
+        self.max_entries = max_entries
+        self.ttls = dict(DEFAULT_TTLS)
+        if ttls:
+            self.ttls.update(ttls)
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0, "evictions": 0, "purged": 0}
+
+    @staticmethod
+    def fingerprint(endpoint, key_fields):
+        """Hash estable de los campos que determinan la respuesta"""
+        normalized = json.dumps(
+            {"endpoint": endpoint, "key": _normalize(key_fields)},
+            sort_keys=True, ensure_ascii=False, separators=(',', ':')
+        )
+        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+    def get(self, endpoint, key_fields):
+        """Respuesta cacheada o None"""
+        key = self.fingerprint(endpoint, key_fields)
+        now = time.time()
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return json.loads(value)
+                del self._memory[key]
+
+        try:
+            row = database.get_cached_ai_response(key, now)
+        except Exception as e:
+            print(f"[AI-CACHE] Error leyendo caché en disco: {e}")
+            row = None
+
+        if row is None:
+            with self._lock:
+                self._stats["misses"] += 1
+            return None
+
+        value, expires_at = row
+        with self._lock:
+            self._stats["disk_hits"] += 1
+            self._remember(key, expires_at, value)
+        return json.loads(value)
+
+    def put(self, endpoint, key_fields, response):
+        """Guarda una respuesta en memoria y en disco"""
+        key = self.fingerprint(endpoint, key_fields)
+        expires_at = time.time() + self.ttls.get(endpoint, 86400)
+        value = json.dumps(response, ensure_ascii=False)
+
+        with self._lock:
+            self._stats["stores"] += 1
+            self._remember(key, expires_at, value)
+
+        try:
+            database.save_cached_ai_response(key, endpoint, value, expires_at)
+        except Exception as e:
+            print(f"[AI-CACHE] Error guardando caché en disco: {e}")
+
+    def _remember(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def purge_expired(self):
+        """Elimina las entradas caducadas de ambos niveles; devuelve las borradas del disco"""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (expires_at, _) in self._memory.items() if expires_at <= now]:
+                del self._memory[key]
+        deleted = database.delete_expired_ai_responses(now)
+        with self._lock:
+            self._stats["purged"] += deleted
+        return deleted
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else 0
+        return stats
@@ -0,0 +1,256 @@
+# =============================================================================
+# SENTINEL PRO - COPIAS DE SEGURIDAD EN CALIENTE
+# Instantáneas con la API de backup de SQLite, retención y copias incrementales
+# =============================================================================
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+from datetime import datetime
+
+import database
+from data_export import gzip_chunks
+
+SNAPSHOT_PREFIX = 'sentinel_pro_'
+DIGEST_SIZE = 16  # Bytes de la huella de cada página en el manifiesto (.pages)
+DELTA_MAGIC = b'SPDELTA1\n'
+STREAM_CHUNK = 1024 * 1024
+BACKUP_NAME = re.compile(r'^sentinel_pro_\d{8}_\d{6}(_\d+)?\.(db|db\.gz|delta\.gz)$')
+
+def _page_size(path):
+    """Tamaño de página leído de la cabecera de un fichero SQLite"""
+    with open(path, 'rb') as f:
+        header = f.read(100)
+    size = struct.unpack('>H', header[16:18])[0]
+    return 65536 if size == 1 else size
+
+def _read_chunks(path, opener=open):
+    with opener(path, 'rb') as f:
+        while True:
+            chunk = f.read(STREAM_CHUNK)
+            if not chunk:
+                return
+            yield chunk
+
+def apply_delta(base_path, delta_path, target_path):
+    """Reconstruye una instantánea a partir de la anterior (.db o .db.gz) y su delta"""
+    opener = gzip.open if base_path.endswith('.gz') else open
+    with opener(base_path, 'rb') as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, STREAM_CHUNK)
+
+    with gzip.open(delta_path, 'rb') as delta, open(target_path, 'r+b') as target:
+        if delta.readline() != DELTA_MAGIC:
+            raise ValueError("No es un fichero delta de SENTINEL PRO")
+        header = json.loads(delta.readline())
+        page_size = header["page_size"]
+        while True:
+            record = delta.read(4)
+            if not record:
+                break
+            page_number = struct.unpack('>I', record)[0]
+            target.seek((page_number - 1) * page_size)
+            target.write(delta.read(page_size))
+        target.truncate(header["page_count"] * page_size)
+    return target_path
+
+class BackupManager:
+    """
+    Instantáneas de la base de datos que no detienen la adquisición.
+
+    Cada copia se hace con database.backup_database en `folder`, se comprime
+    con gzip si `compress` y se guarda junto a un manifiesto con la huella de
+    cada página. Se conservan las `keep` instantáneas más recientes. En modo
+    incremental se genera además un delta con solo las páginas que cambiaron
+    desde la instantánea anterior (apply_delta lo aplica sobre ella): es lo
+    que se envía fuera de la máquina.
+    """
+
+    def __init__(self, folder, keep=7, pages_per_step=1024, step_pause=0.005, compress=True):
+        self.folder = folder
+        self.keep = keep
+        self.pages_per_step = pages_per_step
+        self.step_pause = step_pause
+        self.compress = compress
+        self._lock = threading.Lock()  # Una copia a la vez
+        self._stats = {
+            "snapshots": 0,
+            "incrementals": 0,
+            "last_backup": None,
+            "last_seconds": 0.0,
+            "last_error": None
+        }
+        os.makedirs(folder, exist_ok=True)
+
+    def create(self, incremental=False, progress=None):
+        """Crea una instantánea (y su delta si `incremental`); devuelve su resumen
+
+        `progress(copiadas, total)` recibe las páginas copiadas tras cada paso.
+        """
+        with self._lock:
+            started = time.time()
+            base = self._latest_snapshot() if incremental else None
+            name = self._new_name()
+            part = os.path.join(self.folder, name + '.db.part')
+            try:
+                database.backup_database(part, self.pages_per_step, self.step_pause, progress)
+                info = self._store(part, name, base)
+            except Exception as e:
+                self._stats["last_error"] = str(e)
+                if os.path.exists(part):
+                    os.remove(part)
+                raise
+            self._prune()
+
+            info["seconds"] = round(time.time() - started, 2)
+            self._stats["snapshots"] += 1
+            self._stats["incrementals"] += 1 if info.get("delta") else 0
+            self._stats["last_backup"] = info["snapshot"]
+            self._stats["last_seconds"] = info["seconds"]
+            self._stats["last_error"] = None
+
+        print(f"[BACKUP] ✓ Instantánea {info['snapshot']} en {info['seconds']}s"
+              + (f" (delta: {info['changed_pages']} páginas)" if info.get("delta") else ""))
+        return info
+
+    def list_backups(self):
+        """Instantáneas y deltas guardados, del más reciente al más antiguo"""
+        backups = []
+        for filename in sorted(os.listdir(self.folder), reverse=True):
+            if not BACKUP_NAME.match(filename):
+                continue
+            path = os.path.join(self.folder, filename)
+            backups.append({
+                "name": filename,
+                "kind": "delta" if filename.endswith('.delta.gz') else "snapshot",
+                "size_mb": round(os.path.getsize(path) / (1024 * 1024), 2),
+                "created": datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S')
+            })
+        return backups
+
+    def path_for(self, name):
+        """Ruta de una copia guardada, o None si el nombre no es válido o no existe"""
+        if not BACKUP_NAME.match(name or ''):
+            return None
+        path = os.path.join(self.folder, name)
+        return path if os.path.exists(path) else None
+
+    def stream(self, path, compress=False):
+        """Contenido de una copia en trozos, comprimido o no, sin cargarlo entero"""
+        stored_gzip = path.endswith('.gz')
+        if stored_gzip == compress:
+            return _read_chunks(path)
+        if stored_gzip:
+            return _read_chunks(path, gzip.open)
+        return gzip_chunks(_read_chunks(path))
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats["keep"] = self.keep
+        stats["stored"] = len(self._snapshots())
+        return stats
+
+    # -------------------------------------------------------------------------
+    # Internos (con self._lock tomado)
+    # -------------------------------------------------------------------------
+
+    def _snapshots(self):
+        """Nombres base de las instantáneas guardadas, de la más antigua a la más reciente"""
+        names = set()
+        for filename in os.listdir(self.folder):
+            if BACKUP_NAME.match(filename) and not filename.endswith('.delta.gz'):
+                names.add(filename.split('.', 1)[0])
+        return sorted(names)
+
+    def _latest_snapshot(self):
+        for name in reversed(self._snapshots()):
+            if os.path.exists(os.path.join(self.folder, name + '.pages')):
+                return name
+        return None
+
+    def _new_name(self):
+        base = SNAPSHOT_PREFIX + datetime.now().strftime('%Y%m%d_%H%M%S')
+        name, n = base, 1
+        while name in self._snapshots():
+            name, n = f"{base}_{n}", n + 1
+        return name
+
+    def _store(self, part, name, base):
+        """Una sola lectura de la copia: manifiesto, compresión y delta frente a `base`"""
+        page_size = _page_size(part)
+        previous = b''
+        if base:
+            with open(os.path.join(self.folder, base + '.pages'), 'rb') as f:
+                previous = f.read()
+
+        snapshot_path = os.path.join(self.folder, name + ('.db.gz' if self.compress else '.db'))
+        delta_path = os.path.join(self.folder, name + '.delta.gz') if base else None
+        target = gzip.open(snapshot_path, 'wb', compresslevel=6) if self.compress else None
+        delta = gzip.open(delta_path, 'wb', compresslevel=6) if base else None
+        digests = bytearray()
+        page_count = changed = 0
+
+        try:
+            with open(part, 'rb') as source:
+                if delta:
+                    delta.write(DELTA_MAGIC)
+                    delta.write(json.dumps({
+                        "base": base,
+                        "snapshot": name,
+                        "page_size": page_size,
+                        "page_count": os.path.getsize(part) // page_size
+                    }).encode('utf-8') + b'\n')
+
+                while True:
+                    page = source.read(page_size)
+                    if not page:
+                        break
+                    page_count += 1
+                    digest = hashlib.blake2b(page, digest_size=DIGEST_SIZE).digest()
+                    digests += digest
+                    if target:
+                        target.write(page)
+                    offset = (page_count - 1) * DIGEST_SIZE
+                    if delta and previous[offset:offset + DIGEST_SIZE] != digest:
+                        delta.write(struct.pack('>I', page_count) + page)
+                        changed += 1
+        finally:
+            if target:
+                target.close()
+            if delta:
+                delta.close()
+
+        with open(os.path.join(self.folder, name + '.pages'), 'wb') as f:
+            f.write(digests)
+        if self.compress:
+            os.remove(part)
+        else:
+            os.replace(part, snapshot_path)
+
+        info = {
+            "snapshot": os.path.basename(snapshot_path),
+            "size_mb": round(os.path.getsize(snapshot_path) / (1024 * 1024), 2),
+            "pages": page_count
+        }
+        if delta_path:
+            info.update({
+                "delta": os.path.basename(delta_path),
+                "base": base,
+                "changed_pages": changed,
+                "delta_mb": round(os.path.getsize(delta_path) / (1024 * 1024), 2)
+            })
+        return info
+
+    def _prune(self):
+        """Borra las instantáneas más antiguas que `keep` (con su manifiesto y su delta)"""
+        snapshots = self._snapshots()
+        for name in snapshots[:max(0, len(snapshots) - self.keep)]:
+            for suffix in ('.db', '.db.gz', '.pages', '.delta.gz'):
+                path = os.path.join(self.folder, name + suffix)
+                if os.path.exists(path):
+                    os.remove(path)
@@ -0,0 +1,198 @@
+# =============================================================================
+# SENTINEL PRO - IMPORTACIÓN DE CSV A telemetry_data
+# Lectura en streaming, validación por columna e inserción en bloques grandes
+# =============================================================================
+
+import csv
+import io
+import os
+import time
+from datetime import datetime, timezone
+
+import database
+
+# Columnas del registro CSV (csv_logger.CSV_HEADER) -> columna de telemetry_data
+DEFAULT_COLUMN_MAP = {
+    'timestamp': 'timestamp',
+    'rpm': 'rpm',
+    'speed_kmh': 'speed',
+    'throttle_pos': 'throttle_position',
+    'engine_load': 'engine_load',
+    'maf': 'maf',
+    'coolant_temp': 'coolant_temp',
+    'intake_temp': 'intake_temp',
+    'distance_km': 'distance'
+}
+
+# Mismo orden que las tuplas de database.save_telemetry_batch (tras vehicle_id y timestamp)
+TELEMETRY_FIELDS = ('rpm', 'speed', 'throttle_position', 'engine_load',
+                    'coolant_temp', 'intake_temp', 'maf', 'distance')
+
+# Rangos físicamente posibles (los del estándar OBD-II); fuera de ellos el valor se descarta
+FIELD_RANGES = {
+    'rpm': (0, 16383.75),
+    'speed': (0, 255),
+    'throttle_position': (0, 100),
+    'engine_load': (0, 100),
+    'coolant_temp': (-40, 215),
+    'intake_temp': (-40, 215),
+    'maf': (0, 655.35),
+    'distance': (0, 1000000)
+}
+
+IMPORT_BATCH_SIZE = 50000
+NAN = float('nan')
+EPOCH = datetime(1970, 1, 1)
+
+def resolve_column_map(header, column_map=None):
+    """Asocia cada columna del CSV a un campo de telemetría.
+
+    `column_map` ({columna_csv: campo}) se aplica sobre el mapa por defecto.
+    Lanza ValueError si no hay columna de tiempo o ninguna medida.
+    """
+    mapping = dict(DEFAULT_COLUMN_MAP)
+    if column_map:
+        mapping.update(column_map)
+
+    valid_fields = set(TELEMETRY_FIELDS) | {'timestamp'}
+    unknown = set(mapping.values()) - valid_fields - {None, ''}
+    if unknown:
+        raise ValueError(f"Campos desconocidos en el mapeo: {', '.join(sorted(unknown))}")
+
+    positions = {}
+    for index, name in enumerate(header):
+        field = mapping.get(name.strip())
+        if field and field not in positions:
+            positions[field] = index
+
+    if 'timestamp' not in positions:
+        raise ValueError("El CSV no tiene columna de fecha/hora (timestamp)")
+    if not any(field in positions for field in TELEMETRY_FIELDS):
+        raise ValueError("El CSV no tiene ninguna columna de telemetría reconocida")
+    return positions
+
+class TimestampParser:
+    """Convierte ISO 8601 o epoch (s o ms) a epoch en milisegundos (ts_ms).
+
+    Las fechas sin zona se interpretan como hora local (así las escribe
+    save_reading_to_csv) salvo que `assume_utc` sea True. El desfase local se
+    calcula una vez por hora de datos: astimezone() es lo más caro de la fila.
+    """
+
+    def __init__(self, assume_utc=False):
+        self.assume_utc = assume_utc
+        self._offsets = {}
+
+    def __call__(self, value):
+        value = value.strip()
+        if not value:
+            return None
+
+        if value[0].isdigit() and '-' not in value:
+            epoch = float(value)
+            if epoch <= 1e11:  # segundos (si no, ya son milisegundos)
+                epoch *= 1000
+            return int(round(epoch))
+
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+        elif not self.assume_utc:
+            offset = self._local_offset(value[:13], parsed)
+            if offset:
+                parsed -= offset
+
+        # Aritmética entera sobre el datetime ingenuo (UTC): más rápido que timestamp()
+        delta = parsed - EPOCH
+        return (delta.days * 86400 + delta.seconds) * 1000 + delta.microseconds // 1000
+
+    def _local_offset(self, hour_key, parsed):
+        offset = self._offsets.get(hour_key)
+        if offset is None:
+            hour = parsed.replace(minute=0, second=0, microsecond=0)
+            offset = self._offsets[hour_key] = hour.astimezone().utcoffset()
+        return offset
+
+def iter_telemetry_rows(reader, vehicle_id, positions, stats, assume_utc=False):
+    """Genera tuplas de telemetría válidas a partir de las filas del CSV"""
+    ts_index = positions['timestamp']
+    parse_timestamp = TimestampParser(assume_utc)
+    fields = [(slot, positions[field]) + FIELD_RANGES[field]
+              for slot, field in enumerate(TELEMETRY_FIELDS) if field in positions]
+    empty = [None] * len(TELEMETRY_FIELDS)
+
+    for record in reader:
+        stats['read'] += 1
+        try:
+            timestamp = parse_timestamp(record[ts_index])
+            values = empty.copy()
+            valid = False
+            for slot, index, low, high in fields:
+                raw = record[index]
+                if not raw:
+                    continue
+                try:
+                    value = float(raw)
+                except ValueError:
+                    value = NAN
+                if low <= value <= high:  # NaN nunca cumple el rango
+                    values[slot] = value
+                    valid = True
+                else:
+                    stats['invalid_values'] += 1
+        except (ValueError, IndexError, OverflowError, OSError):
+            timestamp = None
+
+        if timestamp is None or not valid:
+            stats['skipped'] += 1
+            continue
+
+        yield (vehicle_id, timestamp, *values)
+
+def import_csv(filepath, vehicle_id, column_map=None, assume_utc=False,
+               batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Importa un CSV completo en telemetry_data para un vehículo.
+
+    El fichero se lee fila a fila y se inserta en transacciones de
+    `batch_size` filas, con memoria constante sea cual sea su tamaño.
+    `progress(estado)` recibe tras cada bloque las filas leídas/importadas,
+    el porcentaje del fichero procesado y las filas por segundo.
+    Devuelve el resumen final con el mismo formato.
+    """
+    if not database.get_vehicle_by_id(vehicle_id):
+        raise ValueError(f"Vehículo {vehicle_id} no encontrado")
+
+    size = os.path.getsize(filepath)
+    started = time.time()
+    stats = {'read': 0, 'imported': 0, 'skipped': 0, 'invalid_values': 0}
+
+    with open(filepath, 'rb') as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        reader = csv.reader(text)
+        header = next(reader, None)
+        if not header:
+            raise ValueError("El CSV está vacío")
+        positions = resolve_column_map(header, column_map)
+
+        def report(inserted):
+            stats['imported'] = inserted
+            if progress:
+                progress(summary(raw.tell()))
+
+        def summary(position):
+            elapsed = time.time() - started
+            return {
+                **stats,
+                'percent': round(100 * position / size, 1) if size else 100.0,
+                'seconds': round(elapsed, 2),
+                'rows_per_second': int(stats['imported'] / elapsed) if elapsed > 0 else 0
+            }
+
+        rows = iter_telemetry_rows(reader, vehicle_id, positions, stats, assume_utc)
+        stats['imported'] = database.import_telemetry_rows(rows, batch_size, report)
+
+    result = summary(size)
+    print(f"[IMPORT] ✓ {result['imported']} filas importadas en {result['seconds']}s "
+          f"({result['rows_per_second']} filas/s, {result['skipped']} descartadas)")
+    return result
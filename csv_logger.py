@@ -0,0 +1,191 @@
+# =============================================================================
+# SENTINEL PRO - REGISTRO CSV CON BUFFER Y ROTACIÓN
+# Un fichero abierto por vehículo, volcado por intervalo/tamaño y rotación diaria
+# =============================================================================
+
+import csv
+import gzip
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+
+CSV_HEADER = [
+    'timestamp', 'date', 'time', 'vehicle_id',
+    'rpm', 'speed_kmh', 'throttle_pos', 'engine_load', 'maf',
+    'coolant_temp', 'intake_temp', 'distance_km'
+]
+
+class _Segment:
+    """Fichero CSV abierto de una partición"""
+
+    def __init__(self, path, day, buffer_bytes):
+        self.path = path
+        self.day = day
+        # Tamaño llevado a mano: tell() en modo texto vaciaría el buffer
+        self.size = os.path.getsize(path) if os.path.exists(path) else 0
+        self.handle = open(path, 'a', newline='', encoding='utf-8', buffering=buffer_bytes)
+        self.writer = csv.writer(self.handle)
+        if not self.size:
+            self.size += self.writer.writerow(CSV_HEADER)
+        self.pending_rows = 0
+        self.last_flush = time.monotonic()
+
+class CsvLogger:
+    """
+    Registro de lecturas en CSV sin abrir y cerrar el fichero en cada muestra.
+
+    Cada vehículo (o 'sin_vehiculo') escribe en su carpeta dentro de `folder`
+    un fichero por día, que se mantiene abierto con un buffer de
+    `buffer_bytes`. Se vuelca al disco cada `flush_rows` filas o
+    `flush_interval` segundos. Al cambiar de día o superar `max_bytes` el
+    segmento se cierra y, con `compress`, se comprime a .csv.gz en segundo
+    plano.
+    """
+
+    def __init__(self, folder, flush_interval=5, flush_rows=100, buffer_bytes=64 * 1024,
+                 max_bytes=50 * 1024 * 1024, compress=True):
+        self.folder = folder
+        self.flush_interval = flush_interval
+        self.flush_rows = flush_rows
+        self.buffer_bytes = buffer_bytes
+        self.max_bytes = max_bytes
+        self.compress = compress
+        self._segments = {}
+        self._compressing = set()
+        self._lock = threading.Lock()
+        self._stats = {"rows": 0, "flushes": 0, "rotations": 0, "compressed": 0}
+
+    @staticmethod
+    def partition(vehicle_id):
+        return f"vehiculo_{vehicle_id}" if vehicle_id else "sin_vehiculo"
+
+    def write(self, vehicle_id, row, now=None):
+        """Añade una fila a la partición del vehículo (rotando si toca)"""
+        now = now or datetime.now()
+        day = now.strftime('%Y%m%d')
+        key = self.partition(vehicle_id)
+
+        with self._lock:
+            segment = self._segments.get(key)
+            if segment is not None and (segment.day != day or segment.size >= self.max_bytes):
+                self._rotate(key, segment, by_size=segment.day == day)
+                segment = None
+            if segment is None:
+                segment = self._segments[key] = self._open(key, day)
+
+            segment.size += segment.writer.writerow(row)
+            segment.pending_rows += 1
+            self._stats["rows"] += 1
+
+            if segment.pending_rows >= self.flush_rows or \
+                    time.monotonic() - segment.last_flush >= self.flush_interval:
+                self._flush(segment)
+
+    def current_file(self, vehicle_id):
+        """Ruta del segmento en curso de un vehículo (volcado a disco), o None"""
+        with self._lock:
+            segment = self._segments.get(self.partition(vehicle_id))
+            if segment is None:
+                return None
+            self._flush(segment)
+            return segment.path
+
+    def list_files(self, vehicle_id=None):
+        """Segmentos guardados (todas las particiones o la de un vehículo)"""
+        self.flush()
+        partitions = [self.partition(vehicle_id)] if vehicle_id else sorted(os.listdir(self.folder))
+        files = []
+        for partition in partitions:
+            directory = os.path.join(self.folder, partition)
+            if not os.path.isdir(directory):
+                continue
+            for filename in sorted(os.listdir(directory)):
+                if filename.endswith(('.csv', '.csv.gz')):
+                    path = os.path.join(directory, filename)
+                    files.append({
+                        "path": f"{partition}/{filename}",
+                        "size_kb": round(os.path.getsize(path) / 1024, 2),
+                        "modified": datetime.fromtimestamp(os.path.getmtime(path)).strftime('%Y-%m-%d %H:%M:%S')
+                    })
+        return files
+
+    def flush(self):
+        with self._lock:
+            for segment in self._segments.values():
+                self._flush(segment)
+
+    def close(self):
+        """Vuelca y cierra todos los segmentos abiertos (sin rotarlos)"""
+        with self._lock:
+            for segment in self._segments.values():
+                segment.handle.close()
+            self._segments.clear()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["open_files"] = len(self._segments)
+        return stats
+
+    # -------------------------------------------------------------------------
+    # Internos (con self._lock tomado)
+    # -------------------------------------------------------------------------
+
+    def _open(self, key, day):
+        directory = os.path.join(self.folder, key)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"obd_{day}.csv")
+
+        # Segmentos de días anteriores que quedaron sin comprimir (p. ej. tras un reinicio)
+        if self.compress:
+            for filename in os.listdir(directory):
+                stale = os.path.join(directory, filename)
+                if filename.endswith('.csv') and stale != path:
+                    self._compress_later(stale)
+
+        return _Segment(path, day, self.buffer_bytes)
+
+    def _flush(self, segment):
+        if segment.pending_rows:
+            segment.handle.flush()
+            segment.pending_rows = 0
+            self._stats["flushes"] += 1
+        segment.last_flush = time.monotonic()
+
+    def _rotate(self, key, segment, by_size=False):
+        """Cierra el segmento; si rota por tamaño se renombra con la hora de cierre"""
+        segment.handle.close()
+        del self._segments[key]
+
+        closed_path = segment.path
+        if by_size:
+            base = segment.path[:-len('.csv')] + datetime.now().strftime('_%H%M%S')
+            closed_path, n = base + '.csv', 1
+            while os.path.exists(closed_path) or os.path.exists(closed_path + '.gz'):
+                closed_path, n = f"{base}_{n}.csv", n + 1
+            os.replace(segment.path, closed_path)
+        self._stats["rotations"] += 1
+
+        if self.compress:
+            self._compress_later(closed_path)
+
+    def _compress_later(self, path):
+        if path in self._compressing:
+            return
+        self._compressing.add(path)
+        threading.Thread(target=self._compress, args=(path,), name="csv-compress", daemon=True).start()
+
+    def _compress(self, path):
+        try:
+            with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(path)
+            with self._lock:
+                self._stats["compressed"] += 1
+        except Exception as e:
+            print(f"[CSV] Error comprimiendo {path}: {e}")
+        finally:
+            with self._lock:
+                self._compressing.discard(path)
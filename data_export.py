@@ -0,0 +1,84 @@
+# =============================================================================
+# SENTINEL PRO - EXPORTACIÓN EN STREAMING POR VEHÍCULO
+# CSV, CSV comprimido o ZIP generados al vuelo desde SQLite (sin ficheros temporales)
+# =============================================================================
+
+import csv
+import io
+import json
+import zipfile
+import zlib
+from datetime import datetime
+
+import database
+
+EXPORT_FORMATS = ('csv', 'csv.gz', 'zip')
+CHUNK_BYTES = 64 * 1024  # Tamaño aproximado de cada trozo enviado al cliente
+
+def csv_chunks(dataset, vehicle_id, start_epoch=None, end_epoch=None):
+    """Texto CSV de un conjunto (cabecera incluida) en trozos de ~CHUNK_BYTES"""
+    columns = database.EXPORT_DATASETS[dataset][3]
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    for row in database.iter_export_rows(dataset, vehicle_id, start_epoch, end_epoch):
+        writer.writerow(row)
+        if buffer.tell() >= CHUNK_BYTES:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode('utf-8')
+
+def gzip_chunks(chunks, level=6):
+    """Comprime un flujo de bytes en formato gzip sin acumularlo"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31 = cabecera gzip
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+class _ZipStream(io.RawIOBase):
+    """Destino de zipfile no posicionable: acumula lo escrito hasta que se recoge"""
+
+    def __init__(self):
+        self._pending = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._pending += data
+        return len(data)
+
+    def take(self):
+        data = bytes(self._pending)
+        self._pending.clear()
+        return data
+
+def zip_chunks(vehicle, datasets, start_epoch=None, end_epoch=None):
+    """ZIP con un CSV por conjunto y un vehicle.json, emitido a medida que se genera"""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', compression=zipfile.ZIP_DEFLATED) as bundle:
+        bundle.writestr('vehicle.json', json.dumps({
+            "vehicle": vehicle,
+            "from": start_epoch,
+            "to": end_epoch,
+            "exported_at": datetime.now().isoformat()
+        }, ensure_ascii=False, indent=2, default=str))
+        yield stream.take()
+
+        for dataset in datasets:
+            # force_zip64: el tamaño final no se conoce al abrir la entrada
+            with bundle.open(f'{dataset}.csv', 'w', force_zip64=True) as entry:
+                for chunk in csv_chunks(dataset, vehicle['id'], start_epoch, end_epoch):
+                    entry.write(chunk)
+                    data = stream.take()
+                    if data:
+                        yield data
+            yield stream.take()
+
+    yield stream.take()
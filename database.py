@@ -5,21 +5,145 @@
 
 import sqlite3
 import json
-from datetime import datetime
+import queue
+import threading
+import atexit
+import calendar
+import time
+import itertools
+from datetime import datetime, timedelta, timezone
 from contextlib import contextmanager
 import os
 
 DATABASE_NAME = 'sentinel_pro.db'
 
+# Configuración del pool de conexiones
+POOL_SIZE = 8  # Conexiones simultáneas máximas
+POOL_TIMEOUT = 30  # Segundos esperando una conexión libre / un lock de SQLite
+CACHE_SIZE_KB = 16384  # Caché de páginas por conexión (16 MB)
+MMAP_SIZE = 256 * 1024 * 1024  # E/S mapeada en memoria (256 MB)
+STATEMENT_CACHE_SIZE = 256  # Sentencias preparadas reutilizadas por conexión
+BACKUP_PAGES_PER_STEP = 1024  # Páginas copiadas por paso de la API de backup
+BACKUP_STEP_PAUSE = 0.005  # Segundos entre pasos de la copia
+
+# Agregados de telemetría por intervalo de tiempo (nombre -> segundos por bucket)
+ROLLUP_RESOLUTIONS = {'1m': 60, '1h': 3600, '1d': 86400}
+ROLLUP_METRICS = ('rpm', 'speed', 'throttle_position', 'engine_load',
+                  'coolant_temp', 'intake_temp', 'maf')
+RAW_SAMPLE_SECONDS = 3  # Periodo aproximado de muestreo, para decidir cuándo servir datos crudos
+
+# =============================================================================
+# POOL DE CONEXIONES (WAL)
+# =============================================================================
+
+class ConnectionPool:
+    """
+    Pool acotado de conexiones SQLite reutilizables entre hilos.
+
+    Cada conexión se configura una única vez al crearse (WAL, synchronous=NORMAL,
+    caché de páginas, mmap) y conserva su caché de sentencias preparadas, así que
+    las consultas repetidas no se vuelven a compilar. En modo WAL los lectores
+    no se bloquean mientras el escritor de telemetría está escribiendo.
+    """
+
+    def __init__(self, database_name, max_size=POOL_SIZE, timeout=POOL_TIMEOUT):
+        self.database_name = database_name
+        self.max_size = max_size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._all = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _create_connection(self):
+        conn = sqlite3.connect(
+            self.database_name,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=STATEMENT_CACHE_SIZE
+        )
+        conn.row_factory = sqlite3.Row  # Permite acceder a columnas por nombre
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f'PRAGMA cache_size=-{int(CACHE_SIZE_KB)}')
+        conn.execute(f'PRAGMA mmap_size={int(MMAP_SIZE)}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    def acquire(self):
+        """Obtiene una conexión libre (o crea una nueva si hay hueco en el pool)"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError(
+                f"Pool de conexiones agotado ({self.max_size} en uso durante {self.timeout}s)"
+            )
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            return self._create_connection()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def release(self, conn):
+        """Devuelve una conexión al pool"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            if self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        """Cierra todas las conexiones (al cerrar el último WAL se hace checkpoint)"""
+        self._closed = True
+        with self._lock:
+            connections, self._all = self._all, []
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Pool global; se recrea si cambia DATABASE_NAME"""
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.database_name != DATABASE_NAME:
+            if _pool is not None:
+                _pool.close_all()
+            _pool = ConnectionPool(DATABASE_NAME)
+        return _pool
+
+def close_pool():
+    """Cierra todas las conexiones del pool global"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close_all()
+            _pool = None
+
+atexit.register(close_pool)
+
 # =============================================================================
 # GESTOR DE CONEXIÓN A LA BASE DE DATOS
 # =============================================================================
 
 @contextmanager
 def get_db_connection():
-    """Context manager para gestionar conexiones a la base de datos"""
-    conn = sqlite3.connect(DATABASE_NAME)
-    conn.row_factory = sqlite3.Row  # Permite acceder a columnas por nombre
+    """Context manager que presta una conexión del pool y confirma la transacción"""
+    pool = get_pool()
+    conn = pool.acquire()
     try:
         yield conn
         conn.commit()
@@ -27,15 +151,20 @@ def get_db_connection():
         conn.rollback()
         raise e
     finally:
-        conn.close()
+        pool.release(conn)
 
 # =============================================================================
 # INICIALIZACIÓN DE BASE DE DATOS
 # =============================================================================
 
-def initialize_database():
-    """Crea todas las tablas necesarias si no existen"""
+def initialize_database(vacuum=True):
+    """Crea todas las tablas necesarias si no existen
+
+    Con vacuum=False no se lanza el VACUUM único que necesita una base ya
+    existente para pasar a auto_vacuum incremental (ver enable_incremental_vacuum).
+    """
     with get_db_connection() as conn:
+        _enable_incremental_vacuum(conn, vacuum)
         cursor = conn.cursor()
 
         # TABLA: vehicles (vehículos)
@@ -60,6 +189,7 @@ def initialize_database():
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 vehicle_id INTEGER NOT NULL,
                 timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                ts_ms INTEGER,
                 rpm REAL,
                 speed REAL,
                 throttle_position REAL,
@@ -85,26 +215,36 @@ def initialize_database():
             )
         ''')
 
-        # TABLA: ai_analysis (análisis de IA)
+        # TABLA: ai_analysis (análisis de IA; vehicle_id NULL = instantánea sin vehículo activo)
+        cursor.execute(f'CREATE TABLE IF NOT EXISTS ai_analysis ({_AI_ANALYSIS_COLUMNS})')
+
+        # Migración: vehicle_id pasa a admitir NULL
+        if _column_not_null(cursor, 'ai_analysis', 'vehicle_id'):
+            _rebuild_ai_analysis(cursor)
+            print("[DATABASE] ✓ ai_analysis admite instantáneas sin vehículo")
+
+        # Migración: hora de la muestra como entero (epoch en ms). Los filtros
+        # por rango comparan ts_ms directamente y usan el índice; `timestamp`
+        # se mantiene como texto derivado para la API
+        if _ensure_column(cursor, 'telemetry_data', 'ts_ms', 'INTEGER'):
+            cursor.execute('''
+                UPDATE telemetry_data
+                SET ts_ms = CAST(strftime('%s', timestamp) AS INTEGER) * 1000
+            ''')
+            print(f"[DATABASE] ✓ Migrados {cursor.rowcount} registros de telemetría a ts_ms")
+
+        # ÍNDICES para mejorar rendimiento
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS ai_analysis (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                vehicle_id INTEGER NOT NULL,
-                analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                health_score INTEGER,
-                engine_health INTEGER,
-                thermal_health INTEGER,
-                efficiency_health INTEGER,
-                predictions TEXT,
-                warnings TEXT,
-                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE
-            )
+            CREATE INDEX IF NOT EXISTS idx_telemetry_vehicle_time
+            ON telemetry_data(vehicle_id, ts_ms)
         ''')
+        # Sustituido por idx_telemetry_vehicle_time (nadie filtra ya por el texto)
+        cursor.execute('DROP INDEX IF EXISTS idx_telemetry_vehicle')
 
-        # ÍNDICES para mejorar rendimiento
+        # Paginación ascendente por id (after_id) sin ordenar en memoria
         cursor.execute('''
-            CREATE INDEX IF NOT EXISTS idx_telemetry_vehicle
-            ON telemetry_data(vehicle_id, timestamp DESC)
+            CREATE INDEX IF NOT EXISTS idx_telemetry_vehicle_id
+            ON telemetry_data(vehicle_id, id)
         ''')
 
         cursor.execute('''
@@ -117,9 +257,286 @@ def initialize_database():
             ON ai_analysis(vehicle_id, analysis_date DESC)
         ''')
 
+        # TABLA: telemetry_rollups (agregados min/max/suma/conteo por bucket de tiempo)
+        metric_columns = ',\n'.join(
+            f'''                {m}_count INTEGER NOT NULL DEFAULT 0,
+                {m}_sum REAL NOT NULL DEFAULT 0,
+                {m}_min REAL,
+                {m}_max REAL'''
+            for m in ROLLUP_METRICS
+        )
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS telemetry_rollups (
+                vehicle_id INTEGER NOT NULL,
+                resolution INTEGER NOT NULL,
+                bucket_start INTEGER NOT NULL,
+                sample_count INTEGER NOT NULL DEFAULT 0,
+{metric_columns},
+                distance_max REAL,
+                PRIMARY KEY (vehicle_id, resolution, bucket_start)
+            ) WITHOUT ROWID
+        ''')
+
+        # TABLA: retention_policies (días de telemetría cruda y agregados 1m por vehículo)
+        # Sin fila se aplica la política por defecto; NULL = conservar siempre
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS retention_policies (
+                vehicle_id INTEGER PRIMARY KEY,
+                raw_days INTEGER,
+                rollup_days INTEGER,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # TABLA: ai_response_cache (respuestas de Gemini reutilizables)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ai_response_cache (
+                cache_key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ai_cache_expiry
+            ON ai_response_cache(expires_at)
+        ''')
+
+        # TABLA: ai_jobs (análisis IA asíncronos y sus resultados)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ai_jobs (
+                id TEXT PRIMARY KEY,
+                vehicle_id INTEGER,
+                job_type TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE
+            )
+        ''')
+
+        # Migración: cola a la que pertenece cada trabajo (IA, importaciones, copias, informes)
+        if _ensure_column(cursor, 'ai_jobs', 'queue', "TEXT NOT NULL DEFAULT 'ai'"):
+            cursor.execute('''
+                UPDATE ai_jobs SET queue = CASE job_type
+                    WHEN 'csv_import' THEN 'import'
+                    WHEN 'backup' THEN 'backup'
+                    WHEN 'report_batch' THEN 'report'
+                    ELSE 'ai' END
+            ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_ai_jobs_vehicle
+            ON ai_jobs(vehicle_id, created_at DESC)
+        ''')
+
+        # Los trabajos que quedaron a medias en un reinicio ya no se van a completar
+        cursor.execute('''
+            UPDATE ai_jobs SET status = 'interrupted', finished_at = ?
+            WHERE status IN ('queued', 'running')
+        ''', (datetime.now().timestamp(),))
+
+        # TABLA: trips (un registro por viaje, escrito al detectar motor apagado)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS trips (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                vehicle_id INTEGER,
+                start_time TIMESTAMP NOT NULL,
+                end_time TIMESTAMP NOT NULL,
+                duration_s REAL NOT NULL,
+                distance_km REAL NOT NULL,
+                sample_count INTEGER NOT NULL,
+                rpm_avg REAL, rpm_max REAL,
+                speed_avg REAL, speed_max REAL,
+                throttle_avg REAL, throttle_max REAL,
+                load_avg REAL, load_max REAL,
+                maf_avg REAL, maf_max REAL,
+                coolant_avg REAL, coolant_max REAL,
+                intake_avg REAL, intake_max REAL,
+                FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE
+            )
+        ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_trips_vehicle
+            ON trips(vehicle_id, start_time DESC)
+        ''')
+
+        # Migración: columnas de actividad y estado en vehicles
+        added_last_seen = _ensure_column(cursor, 'vehicles', 'last_seen_at', 'TIMESTAMP')
+        added_warnings = _ensure_column(cursor, 'vehicles', 'has_warnings', 'INTEGER NOT NULL DEFAULT 0')
+
+        if added_last_seen:
+            cursor.execute('''
+                UPDATE vehicles SET last_seen_at = (
+                    SELECT MAX(timestamp) FROM telemetry_data WHERE vehicle_id = vehicles.id
+                )
+            ''')
+        if added_warnings:
+            cursor.execute(f'''
+                UPDATE vehicles SET has_warnings = COALESCE((
+                    SELECT {_HAS_WARNINGS_SQL.format(row='a')}
+                    FROM ai_analysis a
+                    WHERE a.vehicle_id = vehicles.id
+                    ORDER BY a.id DESC LIMIT 1
+                ), 0)
+            ''')
+
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_vehicles_last_seen
+            ON vehicles(last_seen_at)
+        ''')
+
+        # TABLA: fleet_summary (una sola fila mantenida por triggers)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS fleet_summary (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_vehicles INTEGER NOT NULL DEFAULT 0,
+                total_km INTEGER NOT NULL DEFAULT 0,
+                vehicles_with_warnings INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        _create_fleet_triggers(cursor)
+
+        cursor.execute('INSERT OR IGNORE INTO fleet_summary (id) VALUES (1)')
+        if cursor.rowcount:
+            _rebuild_fleet_summary(cursor)
+
+        # Migración: calcular los agregados de la telemetría que ya existía
+        has_rollups = cursor.execute('SELECT 1 FROM telemetry_rollups LIMIT 1').fetchone()
+        has_telemetry = cursor.execute('SELECT 1 FROM telemetry_data LIMIT 1').fetchone()
+        if has_telemetry and not has_rollups:
+            _rebuild_rollups(cursor)
+
         print("[DATABASE] ✓ Base de datos inicializada correctamente")
         return True
 
+def enable_incremental_vacuum():
+    """Pasa la base a auto_vacuum incremental (en una base existente, VACUUM completo una sola vez)"""
+    with get_db_connection() as conn:
+        _enable_incremental_vacuum(conn)
+
+def _enable_incremental_vacuum(conn, allow_vacuum=True):
+    """auto_vacuum=INCREMENTAL: las páginas libres se devuelven al disco por tandas
+
+    En una base nueva basta con el PRAGMA; una existente necesita un VACUUM
+    completo, una sola vez, para cambiar de modo (solo con `allow_vacuum`).
+    """
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        return
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+        # Sin tablas el VACUUM es inmediato; en una base con datos puede esperar
+        if not allow_vacuum and conn.execute('SELECT 1 FROM sqlite_master LIMIT 1').fetchone():
+            print("[DATABASE] auto_vacuum incremental pendiente (se activa al arrancar el servidor)")
+            return
+        print("[DATABASE] Activando auto_vacuum incremental (VACUUM único, puede tardar)...")
+        conn.execute('VACUUM')
+
+_AI_ANALYSIS_COLUMNS = '''
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vehicle_id INTEGER,
+    analysis_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    health_score INTEGER,
+    engine_health INTEGER,
+    thermal_health INTEGER,
+    efficiency_health INTEGER,
+    predictions TEXT,
+    warnings TEXT,
+    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE
+'''
+
+def _column_not_null(cursor, table, column):
+    """True si la columna existe y está declarada NOT NULL"""
+    return any(row[1] == column and row[3] for row in cursor.execute(f'PRAGMA table_info({table})'))
+
+def _rebuild_ai_analysis(cursor):
+    """Copia ai_analysis a una tabla con el esquema actual (SQLite no permite quitar un NOT NULL)
+
+    Su índice y su trigger desaparecen con la tabla antigua y se vuelven a
+    crear más adelante en initialize_database.
+    """
+    columns = ('id, vehicle_id, analysis_date, health_score, engine_health, '
+               'thermal_health, efficiency_health, predictions, warnings')
+    cursor.execute(f'CREATE TABLE ai_analysis_new ({_AI_ANALYSIS_COLUMNS})')
+    cursor.execute(f'INSERT INTO ai_analysis_new ({columns}) SELECT {columns} FROM ai_analysis')
+    cursor.execute('DROP TABLE ai_analysis')
+    cursor.execute('ALTER TABLE ai_analysis_new RENAME TO ai_analysis')
+
+def _ensure_column(cursor, table, column, definition):
+    """Añade una columna si la tabla aún no la tiene; devuelve True si la ha creado"""
+    columns = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    if column in columns:
+        return False
+    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return True
+
+# Un análisis "tiene advertencias" si su lista JSON de warnings no está vacía
+_HAS_WARNINGS_SQL = "({row}.warnings IS NOT NULL AND {row}.warnings NOT IN ('', '[]', 'null'))"
+
+def _create_fleet_triggers(cursor):
+    """Triggers que mantienen fleet_summary y vehicles.has_warnings al día"""
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_vehicle_insert
+        AFTER INSERT ON vehicles
+        BEGIN
+            UPDATE fleet_summary SET
+                total_vehicles = total_vehicles + 1,
+                total_km = total_km + NEW.mileage,
+                vehicles_with_warnings = vehicles_with_warnings + NEW.has_warnings
+            WHERE id = 1;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_vehicle_delete
+        AFTER DELETE ON vehicles
+        BEGIN
+            UPDATE fleet_summary SET
+                total_vehicles = total_vehicles - 1,
+                total_km = total_km - OLD.mileage,
+                vehicles_with_warnings = vehicles_with_warnings - OLD.has_warnings
+            WHERE id = 1;
+        END
+    ''')
+
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_fleet_vehicle_update
+        AFTER UPDATE OF mileage, has_warnings ON vehicles
+        BEGIN
+            UPDATE fleet_summary SET
+                total_km = total_km + NEW.mileage - OLD.mileage,
+                vehicles_with_warnings = vehicles_with_warnings + NEW.has_warnings - OLD.has_warnings
+            WHERE id = 1;
+        END
+    ''')
+
+    # El último análisis de cada vehículo decide si tiene advertencias
+    has_warnings = _HAS_WARNINGS_SQL.format(row='NEW')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_analysis_warnings
+        AFTER INSERT ON ai_analysis
+        BEGIN
+            UPDATE vehicles SET has_warnings = {has_warnings}
+            WHERE id = NEW.vehicle_id AND has_warnings != {has_warnings};
+        END
+    ''')
+
+def _rebuild_fleet_summary(cursor):
+    cursor.execute('''
+        UPDATE fleet_summary SET
+            total_vehicles = (SELECT COUNT(*) FROM vehicles),
+            total_km = (SELECT COALESCE(SUM(mileage), 0) FROM vehicles),
+            vehicles_with_warnings = (SELECT COUNT(*) FROM vehicles WHERE has_warnings = 1)
+        WHERE id = 1
+    ''')
+
 # =============================================================================
 # OPERACIONES CRUD - VEHÍCULOS
 # =============================================================================
@@ -178,67 +595,779 @@ def delete_vehicle(vehicle_id):
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('DELETE FROM vehicles WHERE id = ?', (vehicle_id,))
-        return cursor.rowcount > 0
+        deleted = cursor.rowcount > 0
+        if deleted:
+            # telemetry_rollups no tiene clave foránea: sus buckets se borran aquí
+            cursor.execute('DELETE FROM telemetry_rollups WHERE vehicle_id = ?', (vehicle_id,))
+        return deleted
 
 # =============================================================================
 # OPERACIONES - TELEMETRÍA
 # =============================================================================
 
+# Columna `timestamp` (texto) derivada de ts_ms para mantener el formato de la API
+TELEMETRY_INSERT_SQL = '''
+    INSERT INTO telemetry_data
+    (vehicle_id, ts_ms, timestamp, rpm, speed, throttle_position, engine_load,
+     coolant_temp, intake_temp, maf, distance)
+    VALUES (?1, ?2, strftime('%Y-%m-%d %H:%M:%S', ?2 / 1000, 'unixepoch'),
+            ?3, ?4, ?5, ?6, ?7, ?8, ?9, ?10)
+'''
+
+TELEMETRY_COLUMNS = ('id, timestamp, ts_ms, rpm, speed, throttle_position, engine_load, '
+                     'coolant_temp, intake_temp, maf, distance')
+
+MIN_TS_MS = -2 ** 63
+MAX_TS_MS = 2 ** 63 - 1
+
+def now_ms():
+    """Hora actual en epoch (milisegundos, UTC)"""
+    return int(datetime.now(timezone.utc).timestamp() * 1000)
+
+def _ms_to_timestamp(ts_ms):
+    """Epoch en ms -> 'YYYY-MM-DD HH:MM:SS' (UTC), el formato de la columna timestamp"""
+    return datetime.fromtimestamp(ts_ms // 1000, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def _ms_range(start_epoch=None, end_epoch=None):
+    """Rango [start_epoch, end_epoch] (epoch en segundos, inclusivo) en ms para ts_ms"""
+    start = MIN_TS_MS if start_epoch is None else int(start_epoch * 1000)
+    end = MAX_TS_MS if end_epoch is None else int(end_epoch * 1000) + 999
+    return start, end
+
 def save_telemetry(vehicle_id, rpm, speed, throttle_position, engine_load,
                    coolant_temp=None, intake_temp=None, maf=None, distance=None):
     """Guarda un registro de telemetría para un vehículo"""
+    row = (vehicle_id, now_ms(), rpm, speed, throttle_position, engine_load,
+           coolant_temp, intake_temp, maf, distance)
+
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO telemetry_data
-            (vehicle_id, rpm, speed, throttle_position, engine_load,
-             coolant_temp, intake_temp, maf, distance)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (vehicle_id, rpm, speed, throttle_position, engine_load,
-              coolant_temp, intake_temp, maf, distance))
+        cursor.execute(TELEMETRY_INSERT_SQL, row)
+        _update_rollups(cursor, [row])
+        _update_last_seen(cursor, [row])
         return cursor.lastrowid
 
-def get_telemetry_history(vehicle_id, limit=1000):
-    """Obtiene el historial de telemetría de un vehículo"""
+def save_telemetry_batch(rows):
+    """Guarda varios registros de telemetría en una sola transacción
+
+    Cada fila es una tupla (vehicle_id, ts_ms, rpm, speed, throttle_position,
+    engine_load, coolant_temp, intake_temp, maf, distance), con ts_ms la hora
+    de la muestra en epoch (ms). Si ts_ms es None se usa la hora actual. Los
+    agregados por bucket se actualizan en la misma transacción.
+    """
+    if not rows:
+        return 0
+
+    now = now_ms()
+    rows = [row if row[1] is not None else (row[0], now) + tuple(row[2:]) for row in rows]
+
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, timestamp, rpm, speed, throttle_position, engine_load,
-                   coolant_temp, intake_temp, maf, distance
+        cursor.executemany(TELEMETRY_INSERT_SQL, rows)
+        _update_rollups(cursor, rows)
+        _update_last_seen(cursor, rows)
+        return len(rows)
+
+def _update_last_seen(cursor, rows):
+    """Actualiza vehicles.last_seen_at con la muestra más reciente de cada vehículo"""
+    latest = {}
+    for row in rows:
+        vehicle_id, ts_ms = row[0], row[1]
+        if ts_ms > latest.get(vehicle_id, MIN_TS_MS):
+            latest[vehicle_id] = ts_ms
+
+    params = []
+    for vehicle_id, ts_ms in latest.items():
+        timestamp = _ms_to_timestamp(ts_ms)
+        params.append((timestamp, vehicle_id, timestamp))
+
+    cursor.executemany('''
+        UPDATE vehicles SET last_seen_at = ?
+        WHERE id = ? AND (last_seen_at IS NULL OR last_seen_at < ?)
+    ''', params)
+
+def import_telemetry_rows(rows, batch_size=50000, progress=None):
+    """Inserta telemetría en bloque desde un iterable (importación de CSV)
+
+    Las filas tienen el formato de save_telemetry_batch con ts_ms ya
+    calculado. Se consumen de `batch_size` en `batch_size`, con un commit por
+    bloque, así que la memoria no depende del tamaño del origen. Los
+    agregados se recalculan una sola vez al final, solo en el rango importado.
+    `progress(filas_insertadas)` se llama tras cada bloque.
+    """
+    rows = iter(rows)
+    inserted = 0
+    ranges = {}  # vehicle_id -> [ts_ms mínimo, ts_ms máximo]
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        try:
+            while True:
+                batch = list(itertools.islice(rows, batch_size))
+                if not batch:
+                    break
+
+                cursor.executemany(TELEMETRY_INSERT_SQL, batch)
+                conn.commit()
+
+                for row in batch:
+                    bounds = ranges.get(row[0])
+                    if bounds is None:
+                        ranges[row[0]] = [row[1], row[1]]
+                    elif row[1] < bounds[0]:
+                        bounds[0] = row[1]
+                    elif row[1] > bounds[1]:
+                        bounds[1] = row[1]
+
+                inserted += len(batch)
+                if progress:
+                    progress(inserted)
+        finally:
+            # También si la importación se corta: lo ya confirmado queda agregado.
+            # El bloque a medias se descarta y la reconstrucción se confirma aquí,
+            # antes de que get_db_connection haga rollback por la excepción
+            conn.rollback()
+            for vehicle_id, (first, last) in ranges.items():
+                _rebuild_rollups_range(cursor, vehicle_id, first // 1000, last // 1000)
+                _update_last_seen(cursor, [(vehicle_id, last)])
+            conn.commit()
+
+    return inserted
+
+def get_telemetry_history(vehicle_id, limit=1000, start_epoch=None, end_epoch=None):
+    """Historial de telemetría de un vehículo, de la más reciente a la más antigua
+
+    `start_epoch`/`end_epoch` (epoch en segundos, opcionales) acotan el rango
+    sobre idx_telemetry_vehicle_time.
+    """
+    start, end = _ms_range(start_epoch, end_epoch)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {TELEMETRY_COLUMNS}
             FROM telemetry_data
-            WHERE vehicle_id = ?
-            ORDER BY timestamp DESC
+            WHERE vehicle_id = ? AND ts_ms BETWEEN ? AND ?
+            ORDER BY ts_ms DESC, id DESC
             LIMIT ?
-        ''', (vehicle_id, limit))
+        ''', (vehicle_id, start, end, limit))
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
 
+def iter_telemetry_chunks(vehicle_id, start_epoch=None, end_epoch=None, chunk_size=50000):
+    """Recorre la telemetría de un vehículo en orden cronológico, por bloques
+
+    Cada bloque es una lista de tuplas (epoch, rpm, speed, throttle_position,
+    engine_load, coolant_temp, intake_temp, maf), con epoch en segundos
+    (fraccionarios); solo hay un bloque en memoria.
+    """
+    start, end = _ms_range(start_epoch, end_epoch)
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT ts_ms / 1000.0, rpm, speed, throttle_position,
+                   engine_load, coolant_temp, intake_temp, maf
+            FROM telemetry_data
+            WHERE vehicle_id = ? AND ts_ms BETWEEN ? AND ?
+            ORDER BY ts_ms, id
+        ''', (vehicle_id, start, end))
+
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield [tuple(row) for row in rows]
+
+def get_telemetry_page(vehicle_id, after_id=None, before_ts_ms=None, before_id=None, limit=500,
+                       start_epoch=None, end_epoch=None, before_timestamp=None):
+    """Una página de telemetría por keyset (sin OFFSET).
+
+    - after_id: filas con id > after_id en orden ascendente (exportación / seguimiento)
+    - before_ts_ms (+ before_id para desempatar): filas anteriores en orden
+      descendente, recorriendo idx_telemetry_vehicle_time
+    - sin cursor: las más recientes primero
+
+    `start_epoch`/`end_epoch` (epoch en segundos) limitan el rango en los tres
+    casos. `before_timestamp` ('YYYY-MM-DD HH:MM:SS') se acepta por
+    compatibilidad con los cursores anteriores a ts_ms.
+
+    Devuelve (filas, cursor_siguiente) donde el cursor es un dict con los
+    parámetros para pedir la página siguiente, o None si no hay más.
+    """
+    start, end = _ms_range(start_epoch, end_epoch)
+    if before_ts_ms is None and before_timestamp:
+        before_ts_ms = _timestamp_to_epoch(before_timestamp) * 1000
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+
+        if after_id is not None:
+            cursor.execute(f'''
+                SELECT {TELEMETRY_COLUMNS}
+                FROM telemetry_data
+                WHERE vehicle_id = ? AND id > ? AND ts_ms BETWEEN ? AND ?
+                ORDER BY id
+                LIMIT ?
+            ''', (vehicle_id, after_id, start, end, limit))
+        elif before_ts_ms is not None:
+            cursor.execute(f'''
+                SELECT {TELEMETRY_COLUMNS}
+                FROM telemetry_data
+                WHERE vehicle_id = ? AND ts_ms >= ? AND ts_ms <= ?
+                AND (ts_ms < ? OR id < ?)
+                ORDER BY ts_ms DESC, id DESC
+                LIMIT ?
+            ''', (vehicle_id, start, min(before_ts_ms, end), before_ts_ms,
+                  before_id if before_id is not None else MAX_TS_MS, limit))
+        else:
+            cursor.execute(f'''
+                SELECT {TELEMETRY_COLUMNS}
+                FROM telemetry_data
+                WHERE vehicle_id = ? AND ts_ms BETWEEN ? AND ?
+                ORDER BY ts_ms DESC, id DESC
+                LIMIT ?
+            ''', (vehicle_id, start, end, limit))
+
+        rows = [dict(row) for row in cursor.fetchall()]
+
+    if len(rows) < limit:
+        return rows, None
+
+    last = rows[-1]
+    if after_id is not None:
+        return rows, {'after_id': last['id']}
+    return rows, {'before_ts_ms': last['ts_ms'], 'before_id': last['id']}
+
+def iter_telemetry(vehicle_id, after_id=None, before_ts_ms=None, before_id=None,
+                   limit=None, chunk_size=1000, start_epoch=None, end_epoch=None,
+                   before_timestamp=None):
+    """Generador que recorre la telemetría página a página con memoria constante.
+
+    Cada página usa su propia conexión del pool, así un cliente lento no retiene
+    una conexión mientras consume el resultado.
+    """
+    cursor_args = {'after_id': after_id, 'before_ts_ms': before_ts_ms, 'before_id': before_id,
+                   'before_timestamp': before_timestamp}
+    remaining = limit
+
+    while True:
+        page_size = chunk_size if remaining is None else min(chunk_size, remaining)
+        if page_size <= 0:
+            return
+
+        rows, next_cursor = get_telemetry_page(vehicle_id, limit=page_size, start_epoch=start_epoch,
+                                               end_epoch=end_epoch, **cursor_args)
+        for row in rows:
+            yield row
+
+        if remaining is not None:
+            remaining -= len(rows)
+        if next_cursor is None:
+            return
+        cursor_args = {'after_id': None, 'before_ts_ms': None, 'before_id': None, **next_cursor}
+
 def get_recent_telemetry(vehicle_id, minutes=60):
     """Obtiene telemetría reciente (últimos N minutos)"""
     with get_db_connection() as conn:
         cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, timestamp, rpm, speed, throttle_position, engine_load,
-                   coolant_temp, intake_temp, maf, distance
+        cursor.execute(f'''
+            SELECT {TELEMETRY_COLUMNS}
             FROM telemetry_data
-            WHERE vehicle_id = ?
-            AND datetime(timestamp) >= datetime('now', '-' || ? || ' minutes')
-            ORDER BY timestamp DESC
-        ''', (vehicle_id, minutes))
+            WHERE vehicle_id = ? AND ts_ms >= ?
+            ORDER BY ts_ms DESC, id DESC
+        ''', (vehicle_id, now_ms() - int(minutes * 60000)))
         rows = cursor.fetchall()
         return [dict(row) for row in rows]
 
-def delete_old_telemetry(days=30):
-    """Elimina telemetría antigua (optimización de espacio)"""
+def delete_old_telemetry(days=30, batch_size=5000):
+    """Elimina telemetría antigua de todos los vehículos (optimización de espacio)
+
+    Se borra por lotes cortos con prune_telemetry_batch, así que el lock de
+    escritura nunca se retiene durante todo el borrado.
+    """
+    cutoff_ms = now_ms() - int(days * 86400000)
+    deleted = 0
+    for vehicle_id in get_telemetry_vehicle_ids():
+        while True:
+            count = prune_telemetry_batch(vehicle_id, cutoff_ms, batch_size)
+            deleted += count
+            if count < batch_size:
+                break
+    print(f"[DATABASE] Eliminados {deleted} registros antiguos de telemetría")
+    return deleted
+
+# =============================================================================
+# AGREGADOS DE TELEMETRÍA (ROLLUPS)
+# =============================================================================
+
+def _timestamp_to_epoch(timestamp):
+    """Convierte un timestamp de SQLite ('YYYY-MM-DD HH:MM:SS', UTC) a epoch en segundos"""
+    try:
+        return calendar.timegm(datetime.strptime(str(timestamp)[:19], '%Y-%m-%d %H:%M:%S').timetuple())
+    except ValueError:
+        parsed = datetime.fromisoformat(str(timestamp))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+
+def _rollup_upsert_sql():
+    columns = ['vehicle_id', 'resolution', 'bucket_start', 'sample_count']
+    updates = ['sample_count = sample_count + excluded.sample_count']
+    for m in ROLLUP_METRICS:
+        columns += [f'{m}_count', f'{m}_sum', f'{m}_min', f'{m}_max']
+        updates += [
+            f'{m}_count = {m}_count + excluded.{m}_count',
+            f'{m}_sum = {m}_sum + excluded.{m}_sum',
+            # MIN/MAX escalares devuelven NULL si algún argumento es NULL
+            f'{m}_min = MIN(COALESCE({m}_min, excluded.{m}_min), COALESCE(excluded.{m}_min, {m}_min))',
+            f'{m}_max = MAX(COALESCE({m}_max, excluded.{m}_max), COALESCE(excluded.{m}_max, {m}_max))',
+        ]
+    columns.append('distance_max')
+    updates.append('distance_max = MAX(COALESCE(distance_max, excluded.distance_max), '
+                   'COALESCE(excluded.distance_max, distance_max))')
+
+    return f'''
+        INSERT INTO telemetry_rollups ({', '.join(columns)})
+        VALUES ({', '.join('?' for _ in columns)})
+        ON CONFLICT(vehicle_id, resolution, bucket_start) DO UPDATE SET
+        {', '.join(updates)}
+    '''
+
+ROLLUP_UPSERT_SQL = _rollup_upsert_sql()
+
+def _update_rollups(cursor, rows):
+    """Acumula las filas de telemetría en sus buckets de cada resolución (upsert)"""
+    buckets = {}
+
+    for row in rows:
+        vehicle_id, epoch = row[0], row[1] // 1000
+        values = row[2:9]  # rpm ... maf, mismo orden que ROLLUP_METRICS
+        distance = row[9]
+
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            key = (vehicle_id, resolution, epoch - epoch % resolution)
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = {'count': 0, 'metrics': [[0, 0.0, None, None] for _ in ROLLUP_METRICS], 'distance': None}
+            bucket['count'] += 1
+            for stat, value in zip(bucket['metrics'], values):
+                if value is None:
+                    continue
+                stat[0] += 1
+                stat[1] += value
+                stat[2] = value if stat[2] is None or value < stat[2] else stat[2]
+                stat[3] = value if stat[3] is None or value > stat[3] else stat[3]
+            if distance is not None and (bucket['distance'] is None or distance > bucket['distance']):
+                bucket['distance'] = distance
+
+    params = []
+    for (vehicle_id, resolution, bucket_start), bucket in buckets.items():
+        values = [vehicle_id, resolution, bucket_start, bucket['count']]
+        for stat in bucket['metrics']:
+            values += stat
+        values.append(bucket['distance'])
+        params.append(values)
+
+    cursor.executemany(ROLLUP_UPSERT_SQL, params)
+
+def _rebuild_rollups(cursor, vehicle_id=None):
+    """Recalcula los agregados desde la telemetría cruda (migración o reparación)"""
+    where = 'WHERE vehicle_id = ?' if vehicle_id is not None else ''
+    args = (vehicle_id,) if vehicle_id is not None else ()
+
+    cursor.execute(f'DELETE FROM telemetry_rollups {where}', args)
+
+    select_metrics = ', '.join(
+        f'COUNT({m}), COALESCE(SUM({m}), 0), MIN({m}), MAX({m})' for m in ROLLUP_METRICS
+    )
+    insert_metrics = ', '.join(
+        f'{m}_count, {m}_sum, {m}_min, {m}_max' for m in ROLLUP_METRICS
+    )
+    for resolution in ROLLUP_RESOLUTIONS.values():
+        cursor.execute(f'''
+            INSERT INTO telemetry_rollups
+            (vehicle_id, resolution, bucket_start, sample_count, {insert_metrics}, distance_max)
+            SELECT vehicle_id, ?, bucket, COUNT(*), {select_metrics}, MAX(distance)
+            FROM (
+                SELECT *, (ts_ms / 1000 / ?) * ? AS bucket
+                FROM telemetry_data {where}
+            )
+            GROUP BY vehicle_id, bucket
+        ''', (resolution, resolution, resolution) + args)
+
+def _rebuild_rollups_range(cursor, vehicle_id, start_epoch, end_epoch):
+    """Recalcula los buckets de un vehículo que se solapan con [start_epoch, end_epoch]
+
+    Solo la resolución más fina se calcula desde la telemetría cruda; cada
+    resolución mayor se suma a partir de la anterior (los buckets se anidan).
+    """
+    select_metrics = ', '.join(
+        f'COUNT({m}), COALESCE(SUM({m}), 0), MIN({m}), MAX({m})' for m in ROLLUP_METRICS
+    )
+    merge_metrics = ', '.join(
+        f'SUM({m}_count), SUM({m}_sum), MIN({m}_min), MAX({m}_max)' for m in ROLLUP_METRICS
+    )
+    insert_metrics = ', '.join(
+        f'{m}_count, {m}_sum, {m}_min, {m}_max' for m in ROLLUP_METRICS
+    )
+
+    finer = None
+    for resolution in sorted(ROLLUP_RESOLUTIONS.values()):
+        first_bucket = start_epoch - start_epoch % resolution
+        last_bucket = end_epoch - end_epoch % resolution
+
+        cursor.execute('''
+            DELETE FROM telemetry_rollups
+            WHERE vehicle_id = ? AND resolution = ? AND bucket_start BETWEEN ? AND ?
+        ''', (vehicle_id, resolution, first_bucket, last_bucket))
+
+        if finer is None:
+            cursor.execute(f'''
+                INSERT INTO telemetry_rollups
+                (vehicle_id, resolution, bucket_start, sample_count, {insert_metrics}, distance_max)
+                SELECT vehicle_id, ?, bucket, COUNT(*), {select_metrics}, MAX(distance)
+                FROM (
+                    SELECT *, (ts_ms / 1000 / ?) * ? AS bucket
+                    FROM telemetry_data
+                    WHERE vehicle_id = ? AND ts_ms >= ? AND ts_ms < ?
+                )
+                GROUP BY vehicle_id, bucket
+            ''', (resolution, resolution, resolution, vehicle_id,
+                  first_bucket * 1000, (last_bucket + resolution) * 1000))
+        else:
+            cursor.execute(f'''
+                INSERT INTO telemetry_rollups
+                (vehicle_id, resolution, bucket_start, sample_count, {insert_metrics}, distance_max)
+                SELECT vehicle_id, ?, (bucket_start / ?) * ? AS bucket, SUM(sample_count),
+                       {merge_metrics}, MAX(distance_max)
+                FROM telemetry_rollups
+                WHERE vehicle_id = ? AND resolution = ? AND bucket_start >= ? AND bucket_start < ?
+                GROUP BY vehicle_id, bucket
+            ''', (resolution, resolution, resolution, vehicle_id, finer,
+                  first_bucket, last_bucket + resolution))
+        finer = resolution
+
+def rebuild_telemetry_rollups(vehicle_id=None):
+    """Recalcula los agregados de un vehículo (o de todos)"""
+    with get_db_connection() as conn:
+        _rebuild_rollups(conn.cursor(), vehicle_id)
+        print("[DATABASE] ✓ Agregados de telemetría recalculados")
+
+def choose_rollup_resolution(start_epoch, end_epoch, max_points=500):
+    """Elige 'raw' o la resolución más fina que devuelve como mucho max_points buckets"""
+    span = max(0, end_epoch - start_epoch)
+    if span <= max_points * RAW_SAMPLE_SECONDS:
+        return 'raw'
+    for name, seconds in sorted(ROLLUP_RESOLUTIONS.items(), key=lambda item: item[1]):
+        if span / seconds <= max_points:
+            return name
+    return max(ROLLUP_RESOLUTIONS, key=ROLLUP_RESOLUTIONS.get)
+
+def get_telemetry_rollups(vehicle_id, resolution, start_epoch, end_epoch):
+    """Buckets agregados de un vehículo en [start_epoch, end_epoch] (epoch en segundos, UTC)"""
+    seconds = ROLLUP_RESOLUTIONS[resolution]
     with get_db_connection() as conn:
         cursor = conn.cursor()
         cursor.execute('''
-            DELETE FROM telemetry_data
-            WHERE datetime(timestamp) < datetime('now', '-' || ? || ' days')
-        ''', (days,))
-        deleted = cursor.rowcount
-        print(f"[DATABASE] Eliminados {deleted} registros antiguos de telemetría")
-        return deleted
+            SELECT * FROM telemetry_rollups
+            WHERE vehicle_id = ? AND resolution = ?
+            AND bucket_start BETWEEN ? AND ?
+            ORDER BY bucket_start
+        ''', (vehicle_id, seconds, start_epoch - start_epoch % seconds, end_epoch))
+
+        results = []
+        for row in cursor.fetchall():
+            data = {
+                'bucket_start': row['bucket_start'],
+                'timestamp': datetime.fromtimestamp(row['bucket_start'], timezone.utc).strftime('%Y-%m-%d %H:%M:%S'),
+                'sample_count': row['sample_count'],
+                'distance_max': row['distance_max']
+            }
+            for m in ROLLUP_METRICS:
+                count = row[f'{m}_count']
+                data[f'{m}_min'] = row[f'{m}_min']
+                data[f'{m}_max'] = row[f'{m}_max']
+                data[f'{m}_avg'] = row[f'{m}_sum'] / count if count else None
+            results.append(data)
+        return results
+
+def get_telemetry_range(vehicle_id, start_epoch, end_epoch, limit=None):
+    """Telemetría cruda de un vehículo en [start_epoch, end_epoch] (usa idx_telemetry_vehicle_time)"""
+    start, end = _ms_range(start_epoch, end_epoch)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT {TELEMETRY_COLUMNS}
+            FROM telemetry_data
+            WHERE vehicle_id = ? AND ts_ms BETWEEN ? AND ?
+            ORDER BY ts_ms, id
+            LIMIT ?
+        ''', (vehicle_id, start, end, -1 if limit is None else limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+# =============================================================================
+# RETENCIÓN Y COMPACTACIÓN
+# =============================================================================
+
+def get_telemetry_vehicle_ids():
+    """vehicle_id con telemetría (incluidos vehículos ya borrados)
+
+    Se recorren saltando por idx_telemetry_vehicle_time, un MIN por vehículo,
+    en vez de leer la tabla entera.
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            WITH RECURSIVE ids(vehicle_id) AS (
+                SELECT MIN(vehicle_id) FROM telemetry_data
+                UNION ALL
+                SELECT (SELECT MIN(vehicle_id) FROM telemetry_data WHERE vehicle_id > ids.vehicle_id)
+                FROM ids WHERE ids.vehicle_id IS NOT NULL
+            )
+            SELECT vehicle_id FROM ids WHERE vehicle_id IS NOT NULL
+        ''')
+        return [row[0] for row in cursor.fetchall()]
+
+def get_rollup_coverage_ms(vehicle_id):
+    """Fin (epoch en ms) del último bucket de la resolución más fina, o None
+
+    La telemetría cruda anterior a este instante ya está agregada.
+    """
+    resolution = min(ROLLUP_RESOLUTIONS.values())
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT MAX(bucket_start) FROM telemetry_rollups
+            WHERE vehicle_id = ? AND resolution = ?
+        ''', (vehicle_id, resolution))
+        last_bucket = cursor.fetchone()[0]
+    return None if last_bucket is None else (last_bucket + resolution) * 1000
+
+def prune_telemetry_batch(vehicle_id, cutoff_ms, batch_size=5000):
+    """Borra hasta `batch_size` filas de un vehículo anteriores a cutoff_ms
+
+    Cada lote es una transacción corta sobre un rango de idx_telemetry_vehicle_time.
+    Devuelve las filas borradas (menos de batch_size = no quedan más).
+    """
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM telemetry_data WHERE id IN (
+                SELECT id FROM telemetry_data
+                WHERE vehicle_id = ? AND ts_ms < ?
+                ORDER BY ts_ms
+                LIMIT ?
+            )
+        ''', (vehicle_id, cutoff_ms, batch_size))
+        return cursor.rowcount
+
+def prune_rollups(vehicle_id, resolution, cutoff_epoch):
+    """Borra los buckets de una resolución anteriores a cutoff_epoch (segundos)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            DELETE FROM telemetry_rollups
+            WHERE vehicle_id = ? AND resolution = ? AND bucket_start < ?
+        ''', (vehicle_id, resolution, cutoff_epoch))
+        return cursor.rowcount
+
+def incremental_vacuum(pages=256):
+    """Devuelve al sistema hasta `pages` páginas libres; devuelve las que quedan libres"""
+    with get_db_connection() as conn:
+        # El PRAGMA libera una página por paso y execute() solo da el primero;
+        # executescript() lo ejecuta hasta el final
+        conn.executescript(f'PRAGMA incremental_vacuum({int(pages)})')
+        return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def checkpoint_wal():
+    """Vuelca el WAL al fichero principal y lo trunca"""
+    with get_db_connection() as conn:
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+def get_storage_stats():
+    """Tamaño de la base de datos y páginas libres pendientes de compactar"""
+    with get_db_connection() as conn:
+        page_size = conn.execute('PRAGMA page_size').fetchone()[0]
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        freelist = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        auto_vacuum = conn.execute('PRAGMA auto_vacuum').fetchone()[0]
+    return {
+        "size_mb": round(page_size * page_count / (1024 * 1024), 2),
+        "free_mb": round(page_size * freelist / (1024 * 1024), 2),
+        "free_pages": freelist,
+        "auto_vacuum": {0: 'none', 1: 'full', 2: 'incremental'}.get(auto_vacuum, auto_vacuum)
+    }
+
+def get_retention_policies():
+    """Políticas de retención explícitas, indexadas por vehicle_id"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT vehicle_id, raw_days, rollup_days, updated_at FROM retention_policies')
+        return {row['vehicle_id']: dict(row) for row in cursor.fetchall()}
+
+def get_retention_policy(vehicle_id):
+    """Política explícita de un vehículo, o None si usa la de por defecto"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT vehicle_id, raw_days, rollup_days, updated_at
+            FROM retention_policies WHERE vehicle_id = ?
+        ''', (vehicle_id,))
+        row = cursor.fetchone()
+        return dict(row) if row else None
+
+def set_retention_policy(vehicle_id, raw_days, rollup_days):
+    """Guarda la política de un vehículo (None = conservar siempre)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO retention_policies (vehicle_id, raw_days, rollup_days, updated_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(vehicle_id) DO UPDATE SET
+                raw_days = excluded.raw_days,
+                rollup_days = excluded.rollup_days,
+                updated_at = excluded.updated_at
+        ''', (vehicle_id, raw_days, rollup_days))
+
+def delete_retention_policy(vehicle_id):
+    """Vuelve a aplicar la política por defecto a un vehículo"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM retention_policies WHERE vehicle_id = ?', (vehicle_id,))
+        return cursor.rowcount > 0
+
+# =============================================================================
+# OPERACIONES - VIAJES
+# =============================================================================
+
+# Agregados por PID guardados en cada viaje: columna del buffer -> prefijo en trips
+TRIP_AGGREGATE_COLUMNS = {
+    'RPM': 'rpm',
+    'SPEED': 'speed',
+    'THROTTLE_POS': 'throttle',
+    'ENGINE_LOAD': 'load',
+    'MAF': 'maf',
+    'COOLANT_TEMP': 'coolant',
+    'INTAKE_TEMP': 'intake'
+}
+
+TRIP_FIELDS = ['start_time', 'end_time', 'duration_s', 'distance_km', 'sample_count'] + [
+    f'{prefix}_{agg}' for prefix in TRIP_AGGREGATE_COLUMNS.values() for agg in ('avg', 'max')
+]
+
+def save_trip(vehicle_id, trip):
+    """Guarda un viaje terminado (dict con las claves de TRIP_FIELDS)
+
+    start_time y end_time son epoch y se guardan como texto UTC, igual que la
+    telemetría.
+    """
+    values = dict(trip)
+    for key in ('start_time', 'end_time'):
+        values[key] = datetime.fromtimestamp(values[key], timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            INSERT INTO trips (vehicle_id, {', '.join(TRIP_FIELDS)})
+            VALUES (?, {', '.join('?' for _ in TRIP_FIELDS)})
+        ''', [vehicle_id] + [values.get(field) for field in TRIP_FIELDS])
+        return cursor.lastrowid
+
+def get_trips(vehicle_id, start_epoch=None, end_epoch=None, limit=50):
+    """Viajes de un vehículo, del más reciente al más antiguo (usa idx_trips_vehicle)"""
+    start = '0000-01-01 00:00:00' if start_epoch is None else \
+        datetime.fromtimestamp(start_epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    end = '9999-12-31 23:59:59' if end_epoch is None else \
+        datetime.fromtimestamp(end_epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM trips
+            WHERE vehicle_id = ? AND start_time BETWEEN ? AND ?
+            ORDER BY start_time DESC, id DESC
+            LIMIT ?
+        ''', (vehicle_id, start, end, limit))
+        return [dict(row) for row in cursor.fetchall()]
+
+def get_trip_totals(vehicle_id):
+    """Totales de todos los viajes de un vehículo, sumados a partir de los agregados"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT COUNT(*) AS trip_count,
+                   COALESCE(SUM(distance_km), 0) AS total_km,
+                   COALESCE(SUM(duration_s), 0) AS total_duration_s,
+                   MAX(rpm_max) AS rpm_max,
+                   MAX(coolant_max) AS coolant_max,
+                   SUM(rpm_avg * sample_count) / NULLIF(SUM(CASE WHEN rpm_avg IS NOT NULL THEN sample_count END), 0) AS rpm_avg,
+                   SUM(load_avg * sample_count) / NULLIF(SUM(CASE WHEN load_avg IS NOT NULL THEN sample_count END), 0) AS load_avg,
+                   MIN(start_time) AS first_trip,
+                   MAX(end_time) AS last_trip
+            FROM trips
+            WHERE vehicle_id = ?
+        ''', (vehicle_id,))
+        return dict(cursor.fetchone())
+
+# =============================================================================
+# EXPORTACIÓN
+# =============================================================================
+
+# Conjuntos exportables: tabla, columna de tiempo, formato de esa columna
+# (None = epoch en ms) y columnas
+EXPORT_DATASETS = {
+    'telemetry': ('telemetry_data', 'ts_ms', None,
+                  ('id', 'timestamp', 'ts_ms', 'rpm', 'speed', 'throttle_position', 'engine_load',
+                   'coolant_temp', 'intake_temp', 'maf', 'distance')),
+    'trips': ('trips', 'start_time', '%Y-%m-%d %H:%M:%S', ('id',) + tuple(TRIP_FIELDS)),
+    'analyses': ('ai_analysis', 'analysis_date', '%Y-%m-%d %H:%M:%S',
+                 ('id', 'analysis_date', 'health_score', 'engine_health', 'thermal_health',
+                  'efficiency_health', 'predictions', 'warnings')),
+    'maintenance': ('maintenance_records', 'maintenance_date', '%Y-%m-%d',
+                    ('id', 'maintenance_date', 'maintenance_type', 'notes', 'created_at'))
+}
+
+def iter_export_rows(dataset, vehicle_id, start_epoch=None, end_epoch=None, chunk_size=5000):
+    """Filas (tuplas con las columnas de EXPORT_DATASETS) en orden cronológico
+
+    Se leen por páginas keyset (tiempo, id), cada una con su propia conexión
+    del pool: un cliente lento no retiene conexiones ni acumula filas.
+    """
+    table, time_column, time_format, columns = EXPORT_DATASETS[dataset]
+    if time_format is None:
+        start, end = _ms_range(start_epoch, end_epoch)
+    else:
+        start = '0000-01-01 00:00:00' if start_epoch is None else \
+            datetime.fromtimestamp(start_epoch, timezone.utc).strftime(time_format)
+        end = '9999-12-31 23:59:59' if end_epoch is None else \
+            datetime.fromtimestamp(end_epoch, timezone.utc).strftime(time_format)
+    time_index = columns.index(time_column)
+    last_time, last_id = None, None
+
+    while True:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            if last_time is None:
+                cursor.execute(f'''
+                    SELECT {', '.join(columns)} FROM {table}
+                    WHERE vehicle_id = ? AND {time_column} BETWEEN ? AND ?
+                    ORDER BY {time_column}, id
+                    LIMIT ?
+                ''', (vehicle_id, start, end, chunk_size))
+            else:
+                cursor.execute(f'''
+                    SELECT {', '.join(columns)} FROM {table}
+                    WHERE vehicle_id = ? AND {time_column} >= ? AND {time_column} <= ?
+                    AND ({time_column} > ? OR id > ?)
+                    ORDER BY {time_column}, id
+                    LIMIT ?
+                ''', (vehicle_id, last_time, end, last_time, last_id, chunk_size))
+            rows = [tuple(row) for row in cursor.fetchall()]
+
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last_time, last_id = rows[-1][time_index], rows[-1][0]
 
 # =============================================================================
 # OPERACIONES - MANTENIMIENTO
@@ -322,6 +1451,37 @@ def get_ai_analysis_history(vehicle_id, limit=50):
 
         return results
 
+def get_ai_analysis_range(vehicle_id, start_epoch=None, end_epoch=None, limit=100):
+    """Análisis de un vehículo entre dos instantes, del más reciente al más antiguo
+
+    Con vehicle_id None devuelve las instantáneas tomadas sin vehículo activo.
+    Usa idx_analysis_vehicle (vehicle_id, analysis_date), así que el coste depende
+    del tramo pedido y no del total de análisis guardados.
+    """
+    start = '0000-01-01 00:00:00' if start_epoch is None else \
+        datetime.fromtimestamp(start_epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+    end = '9999-12-31 23:59:59' if end_epoch is None else \
+        datetime.fromtimestamp(end_epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, analysis_date, health_score, engine_health,
+                   thermal_health, efficiency_health, predictions, warnings
+            FROM ai_analysis
+            WHERE vehicle_id IS ? AND analysis_date BETWEEN ? AND ?
+            ORDER BY analysis_date DESC, id DESC
+            LIMIT ?
+        ''', (vehicle_id, start, end, limit))
+
+        results = []
+        for row in cursor.fetchall():
+            data = dict(row)
+            data['predictions'] = json.loads(data['predictions']) if data['predictions'] else []
+            data['warnings'] = json.loads(data['warnings']) if data['warnings'] else []
+            results.append(data)
+        return results
+
 def get_latest_ai_analysis(vehicle_id):
     """Obtiene el análisis más reciente de un vehículo"""
     with get_db_connection() as conn:
@@ -343,6 +1503,103 @@ def get_latest_ai_analysis(vehicle_id):
             return data
         return None
 
+# =============================================================================
+# OPERACIONES - CACHÉ DE RESPUESTAS IA
+# =============================================================================
+
+def get_cached_ai_response(cache_key, now):
+    """Devuelve (respuesta_json, expires_at) si la entrada existe y no ha caducado"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT response, expires_at
+            FROM ai_response_cache
+            WHERE cache_key = ? AND expires_at > ?
+        ''', (cache_key, now))
+        row = cursor.fetchone()
+        return (row['response'], row['expires_at']) if row else None
+
+def save_cached_ai_response(cache_key, endpoint, response, expires_at):
+    """Guarda (o reemplaza) una respuesta de la IA"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR REPLACE INTO ai_response_cache
+            (cache_key, endpoint, response, created_at, expires_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (cache_key, endpoint, response, datetime.now().timestamp(), expires_at))
+
+def delete_expired_ai_responses(now):
+    """Elimina las respuestas caducadas"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM ai_response_cache WHERE expires_at <= ?', (now,))
+        return cursor.rowcount
+
+# =============================================================================
+# OPERACIONES - TRABAJOS IA ASÍNCRONOS
+# =============================================================================
+
+def create_ai_job(job_id, job_type, vehicle_id=None, queue='ai'):
+    """Registra un trabajo de la cola `queue` en estado 'queued'"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO ai_jobs (id, vehicle_id, job_type, queue, status, created_at)
+            VALUES (?, ?, ?, ?, 'queued', ?)
+        ''', (job_id, vehicle_id, job_type, queue, datetime.now().timestamp()))
+        return job_id
+
+def update_ai_job(job_id, only_if_status=None, **fields):
+    """Actualiza campos de un trabajo (status, result, error, started_at, finished_at)
+
+    Con `only_if_status` (tupla de estados) solo se actualiza si el trabajo
+    sigue en uno de ellos; devuelve False si no se tocó ninguna fila.
+    """
+    allowed = {'status', 'result', 'error', 'started_at', 'finished_at'}
+    fields = {k: v for k, v in fields.items() if k in allowed}
+    if not fields:
+        return False
+    if 'result' in fields and fields['result'] is not None and not isinstance(fields['result'], str):
+        fields['result'] = json.dumps(fields['result'], ensure_ascii=False)
+
+    assignments = ', '.join(f'{k} = ?' for k in fields)
+    condition, params = 'id = ?', (job_id,)
+    if only_if_status:
+        condition += f" AND status IN ({', '.join('?' for _ in only_if_status)})"
+        params += tuple(only_if_status)
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f'UPDATE ai_jobs SET {assignments} WHERE {condition}',
+                       tuple(fields.values()) + params)
+        return cursor.rowcount > 0
+
+def _job_from_row(row):
+    data = dict(row)
+    data['result'] = json.loads(data['result']) if data['result'] else None
+    return data
+
+def get_ai_job(job_id, queue=None):
+    """Obtiene un trabajo por su id (solo si es de la cola `queue`, si se indica)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT * FROM ai_jobs WHERE id = ? AND (? IS NULL OR queue = ?)',
+                       (job_id, queue, queue))
+        row = cursor.fetchone()
+        return _job_from_row(row) if row else None
+
+def get_ai_jobs_for_vehicle(vehicle_id, job_type=None, limit=20, queue=None):
+    """Últimos trabajos de un vehículo (opcionalmente de un tipo o de una cola)"""
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT * FROM ai_jobs
+            WHERE vehicle_id = ? AND (? IS NULL OR job_type = ?) AND (? IS NULL OR queue = ?)
+            ORDER BY created_at DESC
+            LIMIT ?
+        ''', (vehicle_id, job_type, job_type, queue, queue, limit))
+        return [_job_from_row(row) for row in cursor.fetchall()]
+
 # =============================================================================
 # ESTADÍSTICAS Y UTILIDADES
 # =============================================================================
@@ -355,8 +1612,8 @@ def get_vehicle_statistics(vehicle_id):
         # Contar registros de telemetría
         cursor.execute('''
             SELECT COUNT(*) as telemetry_count,
-                   MIN(timestamp) as first_reading,
-                   MAX(timestamp) as last_reading
+                   strftime('%Y-%m-%d %H:%M:%S', MIN(ts_ms) / 1000, 'unixepoch') as first_reading,
+                   strftime('%Y-%m-%d %H:%M:%S', MAX(ts_ms) / 1000, 'unixepoch') as last_reading
             FROM telemetry_data
             WHERE vehicle_id = ?
         ''', (vehicle_id,))
@@ -387,14 +1644,64 @@ def get_vehicle_statistics(vehicle_id):
             **health_stats
         }
 
-def backup_database(backup_path=None):
-    """Crea una copia de seguridad de la base de datos"""
+def get_fleet_stats(active_window_hours=24):
+    """Resumen de la flota leído de fleet_summary (sin recorrer los vehículos)
+
+    Los vehículos activos se cuentan con el índice de vehicles.last_seen_at,
+    así que el coste depende de los vistos en la ventana, no del tamaño de la flota.
+    """
+    since = (datetime.now(timezone.utc) - timedelta(hours=active_window_hours)).strftime('%Y-%m-%d %H:%M:%S')
+
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT total_vehicles, total_km, vehicles_with_warnings
+            FROM fleet_summary WHERE id = 1
+        ''')
+        row = cursor.fetchone()
+        summary = dict(row) if row else {'total_vehicles': 0, 'total_km': 0, 'vehicles_with_warnings': 0}
+
+        cursor.execute('SELECT COUNT(*) FROM vehicles WHERE last_seen_at >= ?', (since,))
+        summary['connected_today'] = cursor.fetchone()[0]
+        return summary
+
+def rebuild_fleet_summary():
+    """Recalcula fleet_summary desde cero (para reparar contadores)"""
+    with get_db_connection() as conn:
+        _rebuild_fleet_summary(conn.cursor())
+
+def backup_database(backup_path=None, pages_per_step=BACKUP_PAGES_PER_STEP,
+                    step_pause=BACKUP_STEP_PAUSE, progress=None):
+    """Crea una copia de seguridad consistente sin detener las escrituras
+
+    Usa la API de backup de SQLite, `pages_per_step` páginas por paso con una
+    pausa entre pasos. La conexión de origen mantiene abierta una transacción
+    de lectura: en modo WAL los escritores siguen trabajando y la copia es la
+    foto de ese instante (sin ella, cada escritura reiniciaría la copia).
+    `progress(copiadas, total)` se llama tras cada paso.
+    """
     if backup_path is None:
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         backup_path = f'sentinel_pro_backup_{timestamp}.db'
 
-    import shutil
-    shutil.copy2(DATABASE_NAME, backup_path)
+    source = sqlite3.connect(DATABASE_NAME, timeout=POOL_TIMEOUT, isolation_level=None)
+    target = sqlite3.connect(backup_path)
+    try:
+        source.execute('BEGIN')
+        source.execute('SELECT COUNT(*) FROM sqlite_master').fetchone()  # Fija la foto de lectura
+
+        def step(status, remaining, total):
+            if progress:
+                progress(total - remaining, total)
+            if remaining and step_pause:
+                time.sleep(step_pause)
+
+        source.backup(target, pages=pages_per_step, progress=step)
+        source.execute('COMMIT')
+    finally:
+        target.close()
+        source.close()
+
     print(f"[DATABASE] ✓ Backup creado: {backup_path}")
     return backup_path
 
@@ -0,0 +1,99 @@
+# =============================================================================
+# SENTINEL PRO - INFORMES DE FLOTA POR LOTES
+# Datos leídos de la BD y PDF generados en paralelo en un pool de procesos
+# =============================================================================
+
+import multiprocessing
+import os
+import re
+import shutil
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from reports import gather_vehicle_report, render_report
+
+ZIP_NAME = 'informes.zip'
+REPORT_FILE = re.compile(r'^informe_vehiculo_\d+\.pdf$')
+
+def report_filename(vehicle_id):
+    return f"informe_vehiculo_{vehicle_id}.pdf"
+
+def is_batch_file(name):
+    """True si `name` es un fichero descargable de un lote (un PDF o el ZIP)"""
+    return name == ZIP_NAME or bool(REPORT_FILE.match(name or ''))
+
+def prune_batches(folder, keep):
+    """Borra las carpetas de lote más antiguas que `keep`; devuelve sus nombres"""
+    if not os.path.isdir(folder):
+        return []
+    batches = sorted((entry for entry in os.scandir(folder) if entry.is_dir()),
+                     key=lambda entry: entry.stat().st_mtime)
+    pruned = []
+    for entry in batches[:max(0, len(batches) - keep)]:
+        shutil.rmtree(entry.path, ignore_errors=True)
+        pruned.append(entry.name)
+    return pruned
+
+def generate_batch(batch_dir, vehicle_ids, trend_days=30, max_workers=None, health_for=None, progress=None):
+    """
+    Informes PDF de varios vehículos en `batch_dir` más un ZIP con todos.
+
+    Los datos de cada vehículo se leen de la BD en este hilo y el PDF se
+    genera en un pool de `max_workers` procesos (por defecto, uno por
+    núcleo): así el render escala con los núcleos sin pelear por el GIL con
+    el servidor. Los procesos se arrancan con 'spawn': un fork copiaría los
+    hilos de adquisición, escritura y colas del servidor con sus locks y
+    conexiones SQLite, y un lock tomado en ese instante bloquearía al hijo
+    (render_report solo necesita el diccionario del informe).
+
+    `health_for(vehicle_id)` puede devolver la salud en vivo de un vehículo
+    conectado; si devuelve None se usa su último análisis.
+    `progress(update)` se llama cada vez que termina un informe.
+    """
+    os.makedirs(batch_dir, exist_ok=True)
+    workers = min(max_workers or os.cpu_count() or 1, max(1, len(vehicle_ids)))
+    reports = []
+    done = failed = 0
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = {}
+        for vehicle_id in vehicle_ids:
+            health = health_for(vehicle_id) if health_for else None
+            report = gather_vehicle_report(vehicle_id, trend_days, health)
+            if report is None:
+                reports.append({"vehicle_id": vehicle_id, "error": "Vehículo no encontrado"})
+                failed += 1
+                continue
+            futures[executor.submit(render_report, report)] = vehicle_id
+
+        for future in as_completed(futures):
+            vehicle_id = futures[future]
+            try:
+                filename = report_filename(vehicle_id)
+                with open(os.path.join(batch_dir, filename), 'wb') as f:
+                    f.write(future.result())
+                reports.append({"vehicle_id": vehicle_id, "file": filename})
+                done += 1
+            except Exception as e:
+                print(f"[REPORTS] Error en el informe del vehículo {vehicle_id}: {e}")
+                reports.append({"vehicle_id": vehicle_id, "error": str(e)})
+                failed += 1
+            if progress:
+                progress({"vehicle_id": vehicle_id, "done": done, "failed": failed, "total": len(vehicle_ids)})
+
+    reports.sort(key=lambda item: item["vehicle_id"])
+    if done:
+        # Los PDF ya van comprimidos: el ZIP solo los agrupa
+        with zipfile.ZipFile(os.path.join(batch_dir, ZIP_NAME), 'w', compression=zipfile.ZIP_STORED) as bundle:
+            for item in reports:
+                if "file" in item:
+                    bundle.write(os.path.join(batch_dir, item["file"]), item["file"])
+
+    return {
+        "total": len(vehicle_ids),
+        "done": done,
+        "failed": failed,
+        "workers": workers,
+        "zip": ZIP_NAME if done else None,
+        "reports": reports
+    }
@@ -0,0 +1,182 @@
+# =============================================================================
+# SENTINEL PRO - ANALIZADOR INCREMENTAL DE SALUD DEL VEHÍCULO
+# Estadísticas acumuladas por PID: cada muestra es O(1) y cada informe también
+# =============================================================================
+
+from fractions import Fraction
+
+class RunningStat:
+    """Conteo, media y máximo acumulados de una serie de valores.
+
+    La suma se guarda como Fraction para que la media coincida exactamente con
+    statistics.mean (que también suma en aritmética exacta).
+    """
+
+    __slots__ = ('count', 'total', 'max')
+
+    def __init__(self):
+        self.count = 0
+        self.total = Fraction(0)
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        self.total += Fraction(value)
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, count, total, max_value):
+        """Incorpora los acumulados de otra serie (`total` exacto: int, Fraction o float)"""
+        if not count:
+            return
+        self.count += count
+        self.total += Fraction(total)
+        if self.max is None or max_value > self.max:
+            self.max = max_value
+
+    def mean(self):
+        if not self.count:
+            return None
+        return float(self.total / self.count)
+
+    def __bool__(self):
+        return self.count > 0
+
+class HealthAnalyzer:
+    """
+    Mantiene por PID los acumulados que necesitan las reglas de salud.
+
+    add_sample() se llama con cada punto del viaje y evaluate() aplica las mismas
+    reglas de puntuación que el análisis original sobre la lista completa de
+    puntos, sin recorrerla.
+    """
+
+    MIN_SAMPLES = 10
+    HIGH_RPM_THRESHOLD = 4000
+    HARSH_THROTTLE_DELTA = 30
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.sample_count = 0
+        self.rpm = RunningStat()
+        self.high_rpm_count = 0
+        self.load = RunningStat()
+        self.maf = RunningStat()
+        self.coolant = RunningStat()
+        self.intake = RunningStat()
+        self.throttle_count = 0
+        self.last_throttle = None
+        self.harsh_accel_count = 0
+
+    def add_sample(self, point):
+        """Incorpora un punto de viaje (dict con las claves de los comandos OBD)"""
+        self.sample_count += 1
+
+        rpm = point.get('RPM')
+        if rpm and rpm > 0:
+            self.rpm.add(rpm)
+            if rpm > self.HIGH_RPM_THRESHOLD:
+                self.high_rpm_count += 1
+
+        throttle = point.get('THROTTLE_POS')
+        if throttle is not None:
+            if self.last_throttle is not None and throttle - self.last_throttle > self.HARSH_THROTTLE_DELTA:
+                self.harsh_accel_count += 1
+            self.last_throttle = throttle
+            self.throttle_count += 1
+
+        load = point.get('ENGINE_LOAD')
+        if load is not None:
+            self.load.add(load)
+
+        maf = point.get('MAF')
+        if maf and maf > 0:
+            self.maf.add(maf)
+
+        coolant = point.get('COOLANT_TEMP')
+        if coolant and coolant > 0:
+            self.coolant.add(coolant)
+
+        intake = point.get('INTAKE_TEMP')
+        if intake and intake > 0:
+            self.intake.add(intake)
+
+    def has_enough_data(self):
+        return self.sample_count >= self.MIN_SAMPLES
+
+    def evaluate(self):
+        """Puntuaciones, advertencias y predicciones con los acumulados actuales"""
+        warnings = []
+        predictions = []
+
+        # 1. SALUD DEL MOTOR
+        engine_health = 100
+        if self.rpm:
+            high_rpm_ratio = self.high_rpm_count / self.rpm.count
+
+            if high_rpm_ratio > 0.3:
+                engine_health -= 20
+                warnings.append("⚠️ Uso frecuente de RPM altas (>4000). Aumenta desgaste del motor.")
+                predictions.append("Riesgo medio de desgaste prematuro de componentes en 12-18 meses")
+
+            if self.rpm.max > 6000:
+                engine_health -= 15
+                warnings.append("🔴 RPM CRÍTICAS detectadas (>6000). Revisar limitador.")
+
+        if self.load:
+            if self.load.mean() > 80:
+                engine_health -= 10
+                warnings.append("⚠️ Carga motor alta (>80%). Revisar admisión.")
+
+        # 2. SALUD TÉRMICA
+        thermal_health = 100
+        if self.coolant:
+            if self.coolant.max > 105:
+                thermal_health -= 30
+                warnings.append("🔴 CRÍTICO: Temperatura >105°C. Revisar sistema URGENTE.")
+                predictions.append("Riesgo ALTO de fallo en junta culata o radiador en 1-3 meses")
+            elif self.coolant.mean() > 95:
+                thermal_health -= 15
+                warnings.append("⚠️ Temperatura elevada. Revisar termostato y radiador.")
+                predictions.append("Riesgo medio de sobrecalentamiento. Mantenimiento en 3-6 meses")
+
+        if self.intake:
+            if self.intake.mean() > 50:
+                thermal_health -= 10
+                warnings.append("⚠️ Temperatura admisión alta. Revisar intercooler.")
+
+        # 3. EFICIENCIA
+        efficiency_health = 100
+        if self.maf:
+            maf_avg = self.maf.mean()
+            if maf_avg < 10 or maf_avg > 80:
+                efficiency_health -= 15
+                warnings.append("⚠️ Flujo aire anómalo. Revisar MAF y filtro.")
+                predictions.append("Posible obstrucción en admisión. Reducción eficiencia 5-10%")
+
+        if self.throttle_count > 1:
+            harsh_ratio = self.harsh_accel_count / self.throttle_count
+            if harsh_ratio > 0.05:
+                efficiency_health -= 10
+                warnings.append("⚠️ Conducción agresiva. Aumenta consumo y desgaste.")
+
+        # PUNTUACIÓN GLOBAL
+        overall_score = round((engine_health + thermal_health + efficiency_health) / 3)
+
+        return {
+            "overall_score": overall_score,
+            "engine_health": round(engine_health),
+            "thermal_health": round(thermal_health),
+            "efficiency_health": round(efficiency_health),
+            "warnings": warnings,
+            "predictions": predictions
+        }
+
+def evaluate_points(points):
+    """Evalúa una lista completa de puntos (útil para datos ya grabados)"""
+    analyzer = HealthAnalyzer()
+    for point in points:
+        analyzer.add_sample(point)
+    return analyzer.evaluate() if analyzer.has_enough_data() else None
@@ -0,0 +1,113 @@
+# =============================================================================
+# SENTINEL PRO - COLA DE TRABAJOS ASÍNCRONOS PARA ANÁLISIS IA
+# Pool acotado de workers; estado y resultados persistidos en la tabla ai_jobs
+# =============================================================================
+
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+
+class JobQueueFull(Exception):
+    """Se lanza cuando hay demasiados trabajos pendientes"""
+
+class JobQueue:
+    """
+    Ejecuta trabajos largos (llamadas a Gemini) fuera de los hilos de Flask.
+
+    Los endpoints encolan y devuelven un job_id al instante; como mucho
+    `max_workers` trabajos se ejecutan a la vez y `max_pending` esperan. Un
+    trabajo que supera `timeout` segundos se marca como 'timeout' y su
+    resultado tardío se descarta. `on_finish(job)` se llama al terminar cada
+    trabajo (p. ej. para notificar por el stream SSE).
+
+    Todas las colas comparten la tabla ai_jobs: cada trabajo se guarda con el
+    nombre de su cola (`name`) y get() solo ve los suyos, así el timeout de
+    una cola nunca caduca los trabajos de otra.
+    """
+
+    def __init__(self, max_workers=2, max_pending=50, timeout=90, on_finish=None,
+                 name='ai', thread_name_prefix=None):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.timeout = timeout
+        self.on_finish = on_finish
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix=thread_name_prefix or f"{name}-job")
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {"submitted": 0, "done": 0, "error": 0, "timeout": 0, "rejected": 0}
+
+    def submit(self, job_type, fn, vehicle_id=None, job_id=None):
+        """Encola fn() y devuelve el id del trabajo (se genera si no se indica)"""
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_pending:
+                self._stats["rejected"] += 1
+                raise JobQueueFull(f"Demasiados trabajos en curso ({self._in_flight})")
+            self._in_flight += 1
+            self._stats["submitted"] += 1
+
+        job_id = job_id or uuid.uuid4().hex
+        try:
+            database.create_ai_job(job_id, job_type, vehicle_id, queue=self.name)
+            self._executor.submit(self._execute, job_id, job_type, fn)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        return job_id
+
+    def get(self, job_id):
+        """Estado del trabajo (None si no es de esta cola); marca 'timeout' si lleva demasiado en ejecución"""
+        job = database.get_ai_job(job_id, queue=self.name)
+        if job and job['status'] == 'running' and job['started_at'] and \
+                time.time() - job['started_at'] > self.timeout:
+            database.update_ai_job(job_id, status='timeout', finished_at=time.time(),
+                                   error=f"Tiempo máximo superado ({self.timeout}s)",
+                                   only_if_status=('running',))
+            job = database.get_ai_job(job_id, queue=self.name)
+        return job
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = self._in_flight
+        stats["max_workers"] = self.max_workers
+        stats["max_pending"] = self.max_pending
+        return stats
+
+    def _execute(self, job_id, job_type, fn):
+        started = time.time()
+        status, result, error = 'done', None, None
+
+        try:
+            database.update_ai_job(job_id, status='running', started_at=started)
+            result = fn()
+            if time.time() - started > self.timeout:
+                status, result = 'timeout', None
+                error = f"Tiempo máximo superado ({self.timeout}s)"
+        except Exception as e:
+            print(f"[JOBS] Error en trabajo {job_type} {job_id}: {e}")
+            status, error = 'error', str(e)
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        try:
+            # Si get() ya lo dio por caducado, el estado final es 'timeout' y el resultado se descarta
+            if not database.update_ai_job(job_id, status=status, result=result, error=error,
+                                          finished_at=time.time(), only_if_status=('queued', 'running')):
+                status = 'timeout'
+            if self.on_finish:
+                self.on_finish(database.get_ai_job(job_id))
+        except Exception as e:
+            print(f"[JOBS] Error guardando resultado de {job_id}: {e}")
+        finally:
+            with self._lock:
+                self._stats[status] += 1
@@ -0,0 +1,119 @@
+# =============================================================================
+# SENTINEL PRO - DIFUSIÓN DE TELEMETRÍA EN VIVO (Server-Sent Events)
+# Un único publicador reparte cada muestra y cada análisis a todos los clientes
+# =============================================================================
+
+import json
+import queue
+import threading
+from collections import deque
+
+class Subscriber:
+    """Cola acotada de eventos pendientes de un cliente conectado
+
+    Si tiene `channel` solo recibe los eventos de ese canal y los globales
+    (publicados sin canal).
+    """
+
+    def __init__(self, max_pending, channel=None):
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.channel = channel
+        self.dropped = False
+
+    def wants(self, channel):
+        return self.channel is None or channel is None or channel == self.channel
+
+class EventBroadcaster:
+    """
+    Publicador fan-out para el stream SSE.
+
+    Cada evento se serializa una sola vez y se reparte a las colas de los
+    suscriptores. Un cliente lento cuya cola se llena se desconecta (en vez de
+    frenar al resto); al reconectar con Last-Event-ID recibe los eventos
+    pendientes desde el histórico de los últimos `history_size` eventos.
+    """
+
+    def __init__(self, history_size=500, client_queue_size=100):
+        self.client_queue_size = client_queue_size
+        self._history = deque(maxlen=history_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self._stats = {"published": 0, "dropped_clients": 0}
+
+    def publish(self, event, data, channel=None):
+        """Publica un evento (opcionalmente en un canal); devuelve su número de secuencia"""
+        payload = json.dumps(data, ensure_ascii=False, default=str)
+
+        with self._lock:
+            self._sequence += 1
+            message = (self._sequence, event, payload)
+            self._history.append((channel, message))
+            self._stats["published"] += 1
+
+            for subscriber in list(self._subscribers):
+                if not subscriber.wants(channel):
+                    continue
+                try:
+                    subscriber.queue.put_nowait(message)
+                except queue.Full:
+                    subscriber.dropped = True
+                    self._subscribers.discard(subscriber)
+                    self._stats["dropped_clients"] += 1
+
+            return self._sequence
+
+    def subscribe(self, last_event_id=None, initial=None, channel=None):
+        """Registra un cliente.
+
+        Si trae last_event_id se le reenvían los eventos posteriores del histórico;
+        si no, recibe `initial` (tupla evento, datos) como estado actual.
+        """
+        subscriber = Subscriber(self.client_queue_size, channel)
+
+        with self._lock:
+            if last_event_id is not None:
+                pending = [m for c, m in self._history if m[0] > last_event_id and subscriber.wants(c)]
+                for message in pending[-self.client_queue_size:]:
+                    subscriber.queue.put_nowait(message)
+            elif initial is not None:
+                event, data = initial
+                payload = json.dumps(data, ensure_ascii=False, default=str)
+                subscriber.queue.put_nowait((self._sequence, event, payload))
+            self._subscribers.add(subscriber)
+
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def stream(self, subscriber, heartbeat=15):
+        """Generador de texto SSE para un suscriptor (latido cada `heartbeat` s)"""
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    sequence, event, payload = subscriber.queue.get(timeout=heartbeat)
+                except queue.Empty:
+                    if subscriber.dropped:
+                        break
+                    yield ": keepalive\n\n"
+                    continue
+
+                yield f"id: {sequence}\nevent: {event}\ndata: {payload}\n\n"
+
+                if subscriber.dropped and subscriber.queue.empty():
+                    # Cliente demasiado lento: se cierra y el navegador reconecta
+                    # con Last-Event-ID para continuar desde el último evento recibido
+                    break
+        finally:
+            self.unsubscribe(subscriber)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["subscribers"] = len(self._subscribers)
+            stats["last_sequence"] = self._sequence
+            stats["history_size"] = len(self._history)
+        return stats
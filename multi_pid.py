@@ -0,0 +1,161 @@
+# =============================================================================
+# SENTINEL PRO - PETICIONES OBD MULTI-PID
+# Agrupa hasta 6 PIDs de modo 01 en una sola petición al ELM327 (solo CAN)
+# =============================================================================
+
+import copy
+
+from obd import OBDCommand
+from obd.protocols import ECU
+
+# Protocolos CAN del ELM327 (ISO 15765-4 y SAE J1939): admiten varios PIDs por petición
+CAN_PROTOCOL_IDS = {'6', '7', '8', '9', 'A', 'B', 'C'}
+MAX_PIDS_PER_REQUEST = 6
+
+def _raw_messages(messages):
+    """Decoder que devuelve los mensajes sin interpretar"""
+    return messages
+
+def response_value(response):
+    """Valor numérico de una respuesta OBD (o None)"""
+    if response is None or response.value is None:
+        return None
+    value = response.value
+    return value.magnitude if hasattr(value, 'magnitude') else value
+
+def split_multi_pid(messages, commands):
+    """Separa una respuesta '41 PID datos PID datos...' en mensajes de un solo PID.
+
+    La longitud de cada bloque sale de `command.bytes` (que incluye modo y PID).
+    Devuelve {pid: [Message]} con un mensaje por ECU que haya respondido.
+    """
+    by_pid = {cmd.pid: cmd for cmd in commands}
+    parts = {pid: [] for pid in by_pid}
+
+    for message in messages:
+        data = message.data
+        if len(data) < 2 or data[0] != 0x41:
+            continue
+
+        i = 1
+        while i < len(data):
+            cmd = by_pid.get(data[i])
+            if cmd is None:
+                break  # PID desconocido o relleno: no se puede saber su longitud
+            size = cmd.bytes - 2
+            chunk = data[i + 1:i + 1 + size]
+            if len(chunk) < size:
+                break
+
+            part = copy.copy(message)
+            part.data = bytearray([0x41, cmd.pid]) + chunk
+            parts[cmd.pid].append(part)
+            i += 1 + size
+
+    return parts
+
+class MultiPIDReader:
+    """
+    Lee un conjunto de comandos de modo 01 con el mínimo de peticiones.
+
+    En protocolos CAN envía los PIDs en grupos de hasta `max_pids` y decodifica
+    cada bloque con el decoder de su comando. Los PIDs que no vuelvan en la
+    respuesta agrupada se piden uno a uno; si tras `max_failures` intentos
+    seguidos la ECU no responde a las peticiones agrupadas, se desactivan
+    para esta conexión.
+    """
+
+    def __init__(self, connection, enabled=True, max_pids=MAX_PIDS_PER_REQUEST, max_failures=3):
+        self.connection = connection
+        self.max_pids = max(1, min(max_pids, MAX_PIDS_PER_REQUEST))
+        self.max_failures = max_failures
+        self.enabled = enabled and self._is_can()
+        self._failures = 0
+        self._batch_commands = {}
+        self.stats = {"batched_requests": 0, "single_requests": 0, "fallback_pids": 0}
+
+        if enabled and not self.enabled:
+            print("[OBD] Protocolo no CAN: peticiones multi-PID desactivadas")
+
+    def _is_can(self):
+        try:
+            return str(self.connection.protocol_id()) in CAN_PROTOCOL_IDS
+        except Exception:
+            return False
+
+    def query(self, commands):
+        """Devuelve {nombre_comando: valor} para todos los comandos pedidos"""
+        results = {}
+        batchable = []
+        single = []
+
+        for cmd in commands:
+            if self.enabled and cmd.mode == 1 and cmd.bytes > 2 and self.connection.supports(cmd):
+                batchable.append(cmd)
+            else:
+                single.append(cmd)
+
+        if len(batchable) < 2:
+            single.extend(batchable)
+            batchable = []
+
+        for start in range(0, len(batchable), self.max_pids):
+            group = batchable[start:start + self.max_pids]
+            values = self._query_group(group)
+            for cmd in group:
+                if cmd.name in values:
+                    results[cmd.name] = values[cmd.name]
+                else:
+                    self.stats["fallback_pids"] += 1
+                    single.append(cmd)
+
+        for cmd in single:
+            results[cmd.name] = self._query_single(cmd)
+
+        return results
+
+    def _query_single(self, cmd):
+        self.stats["single_requests"] += 1
+        try:
+            return response_value(self.connection.query(cmd))
+        except Exception:
+            return None
+
+    def _group_command(self, group):
+        key = tuple(cmd.pid for cmd in group)
+        command = self._batch_commands.get(key)
+        if command is None:
+            pids = b''.join(cmd.command[2:] for cmd in group)
+            command = OBDCommand("MULTI_PID_" + "_".join(cmd.name for cmd in group),
+                                 "Petición agrupada de modo 01",
+                                 b'01' + pids, 0, _raw_messages, ECU.ALL, False)
+            self._batch_commands[key] = command
+        return command
+
+    def _query_group(self, group):
+        self.stats["batched_requests"] += 1
+        try:
+            response = self.connection.query(self._group_command(group), force=True)
+            parts = split_multi_pid(response.value or [], group)
+        except Exception as e:
+            print(f"[OBD] Error en petición multi-PID: {e}")
+            parts = {}
+
+        values = {}
+        for cmd in group:
+            messages = parts.get(cmd.pid)
+            if messages:
+                values[cmd.name] = response_value(cmd(messages))
+
+        # Una ECU sin soporte multi-PID suele contestar solo al primer PID
+        if len(values) >= min(2, len(group)):
+            self._failures = 0
+        else:
+            self._failures += 1
+            if self._failures >= self.max_failures:
+                self.enabled = False
+                print("[OBD] La ECU no responde a peticiones multi-PID: se usan peticiones individuales")
+        return values
+
+    def get_stats(self):
+        return {**self.stats, "enabled": self.enabled, "max_pids": self.max_pids}
@@ -2,7 +2,7 @@
 # SENTINEL PRO - MANTENIMIENTO PREDICTIVO v10.0 - MULTI-VEHÍCULO + SQLite
 # Sistema completo con gestión de múltiples vehículos
 # =============================================================================
-from flask import Flask, jsonify, request, send_file, send_from_directory
+from flask import Flask, jsonify, request, send_file, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 import obd
 import time
@@ -10,17 +10,35 @@ import json
 import requests
 import geocoder
 import google.generativeai as genai
-from fpdf import FPDF
 import os
 import traceback
 import re
 import csv
-from datetime import datetime, timedelta
+import uuid
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import TimeoutError as FuturesTimeoutError
 from werkzeug.utils import secure_filename
-import statistics
+import atexit
 
 # Importar módulo de base de datos
 import database
+from acquisition import AcquisitionWorker
+from telemetry_writer import TelemetryWriter
+from retention import RetentionService
+from backup import BackupManager
+from reports import ReportRenderer, build_report, latest_health
+import fleet_reports
+from csv_logger import CsvLogger
+from vehicle_sessions import VehicleSession, SessionManager
+from live_stream import EventBroadcaster
+from ai_cache import ResponseCache, mileage_bucket, round_to
+from job_queue import JobQueue, JobQueueFull
+from multi_pid import MultiPIDReader
+from pid_scheduler import PIDScheduler, PIDSpec
+import csv_import
+import offline_analysis
+import data_export
 
 # ----- CONFIGURACIÓN OBLIGATORIA -----
 OBD_PORT = "COM6"  # CAMBIA ESTO A TU PUERTO
@@ -32,9 +50,6 @@ GEMINI_MODEL_NAME = "models/gemini-pro-latest"
 CSV_FOLDER = 'csv_data'
 UPLOAD_FOLDER = 'uploaded_csv'
 ALLOWED_EXTENSIONS = {'csv'}
-CSV_FILENAME = os.path.join(CSV_FOLDER, 'obd_readings.csv')
-HEALTH_HISTORY_FILE = 'health_history.json'
-TRIP_HISTORY_FILE = 'historial_viajes.json'
 
 os.makedirs(CSV_FOLDER, exist_ok=True)
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -42,32 +57,81 @@ os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app = Flask(__name__)
 CORS(app)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['MAX_CONTENT_LENGTH'] = 1024 * 1024 * 1024  # Volcados de logger de varios millones de filas
 
 # Variables globales
-connection = None
-supported_commands_cache = set()
-last_connection_attempt_time = 0
-last_thermal_reading_time = 0
 RECONNECTION_COOLDOWN = 10
+# Adaptadores adicionales que se registran a la vez que el principal (OBD_PORT):
+# lista de (puerto, vehicle_id), p. ej. [("COM7", 2), ("COM8", 3)]
+OBD_EXTRA_SESSIONS = []
 THERMAL_READING_INTERVAL = 60
+# Planificación por PID: (comando, periodo en marcha, periodo al ralentí, prioridad)
+# Periodo 0 = en cada ciclo; prioridad 0 = siempre se lee
+PID_SCHEDULE = [
+    ("RPM", 0, 0, 0),
+    ("SPEED", 0, 0, 0),
+    ("THROTTLE_POS", 0, 6, 1),
+    ("ENGINE_LOAD", 0, 6, 1),
+    ("MAF", 0, 6, 1),
+    ("COOLANT_TEMP", THERMAL_READING_INTERVAL, 15, 2),
+    ("INTAKE_TEMP", THERMAL_READING_INTERVAL, 30, 2)
+]
+OBD_BUS_BUDGET = 0.7  # Fracción del intervalo de adquisición dedicada a consultas
+OBD_FILLER_PERIOD = 30  # Segundos entre lecturas de PIDs de relleno (tiempo de bus sobrante)
+OBD_MULTI_PID = True  # Agrupar PIDs en una sola petición (solo vehículos CAN)
+OBD_MULTI_PID_MAX = 6  # PIDs por petición agrupada (máximo del estándar: 6)
+ACQUISITION_INTERVAL = 3  # Segundos entre muestras del worker de adquisición
+TELEMETRY_QUEUE_SIZE = 10000  # Muestras máximas en cola antes de descartar
+TELEMETRY_BATCH_SIZE = 200  # Filas por commit agrupado
+TELEMETRY_FLUSH_INTERVAL_MS = 1000  # Volcado máximo cada N milisegundos
+CSV_FLUSH_INTERVAL = 5  # Segundos máximos de lecturas en el buffer del CSV
+CSV_FLUSH_ROWS = 100  # Filas en el buffer del CSV antes de volcar
+CSV_MAX_MB = 50  # Tamaño a partir del cual se rota el CSV del día
+CSV_COMPRESS = True  # Comprimir con gzip los CSV ya cerrados
+HEALTH_ANALYSIS_EVERY = 30  # Muestras entre análisis de salud (1 = en cada muestra)
+TRIP_BUFFER_CAPACITY = None  # Puntos de viaje en memoria (None = viaje completo)
+TRIP_RPM_THRESHOLD = 400  # RPM por debajo de las cuales el motor se considera apagado
+TRIP_END_IDLE_SECONDS = 120  # Segundos con motor apagado para dar el viaje por terminado
+STREAM_HISTORY_SIZE = 500  # Eventos guardados para reanudar el stream SSE
+STREAM_CLIENT_QUEUE = 100  # Eventos pendientes por cliente antes de desconectarlo
+STREAM_HEARTBEAT = 15  # Segundos entre latidos del stream SSE
+HEALTH_HISTORY_TAIL = 100  # Instantáneas de salud recientes en memoria
+AI_JOB_WORKERS = 2  # Llamadas simultáneas a Gemini
+AI_JOB_MAX_PENDING = 20  # Análisis en espera antes de rechazar (HTTP 503)
+AI_JOB_TIMEOUT = 90  # Segundos máximos por análisis
+CSV_IMPORT_MAX_PENDING = 5  # Importaciones de CSV en espera antes de rechazar
+CSV_IMPORT_TIMEOUT = 1800  # Segundos máximos por importación
+RETENTION_RAW_DAYS = 90  # Días de telemetría cruda por defecto (None = conservar siempre)
+RETENTION_ROLLUP_DAYS = 365  # Días de agregados de 1 minuto por defecto (1h/1d se conservan)
+RETENTION_INTERVAL = 3600  # Segundos entre pasadas de retención
+RETENTION_BATCH_SIZE = 2000  # Filas borradas por transacción
+RETENTION_BATCH_PAUSE = 0.05  # Segundos entre lotes (el escritor de telemetría recupera el lock)
+RETENTION_VACUUM_PAGES = 256  # Páginas devueltas al disco por paso de incremental_vacuum
+BACKUP_FOLDER = 'db_backups'  # Instantáneas locales de la base de datos
+BACKUP_KEEP = 7  # Instantáneas que se conservan
+BACKUP_COMPRESS = True  # Guardar las instantáneas con gzip
+BACKUP_PAGES_PER_STEP = 1024  # Páginas copiadas por paso de la API de backup
+BACKUP_STEP_PAUSE = 0.005  # Segundos entre pasos (los escritores siguen trabajando)
+BACKUP_MAX_PENDING = 2  # Copias en espera antes de rechazar (HTTP 503)
+BACKUP_TIMEOUT = 3600  # Segundos máximos por copia
+REPORT_TREND_DAYS = 30  # Días de tendencia diaria incluidos en el informe PDF (0 = ninguno)
+REPORT_CACHE_MB = 32  # Memoria máxima para informes PDF ya generados
+REPORT_TIMEOUT = 30  # Segundos máximos esperando a que se genere un informe
+REPORT_BATCH_FOLDER = 'report_batches'  # Informes por lotes (una carpeta por lote)
+REPORT_BATCH_WORKERS = None  # Procesos que generan PDF en paralelo (None = uno por núcleo)
+REPORT_BATCH_KEEP = 10  # Lotes que se conservan en disco
+REPORT_BATCH_MAX_PENDING = 3  # Lotes en espera antes de rechazar (HTTP 503)
+REPORT_BATCH_TIMEOUT = 3600  # Segundos máximos por lote
 
 # NUEVO: Variable para vehículo activo
 active_vehicle_id = None
 
-trip_data = {}
+sessions = SessionManager()  # Una sesión de adquisición por adaptador
+live_broadcaster = EventBroadcaster(STREAM_HISTORY_SIZE, STREAM_CLIENT_QUEUE)
+ai_cache = ResponseCache()  # Respuestas de Gemini reutilizables (memoria + SQLite)
+health_tail = deque(maxlen=HEALTH_HISTORY_TAIL)  # Últimas instantáneas de salud
 maintenanceHistory = []
 
-vehicle_health = {
-    "overall_score": 100,
-    "engine_health": 100,
-    "thermal_health": 100,
-    "efficiency_health": 100,
-    "warnings": [],
-    "predictions": [],
-    "last_update": None
-}
-
 # Inicialización Gemini
 model = None
 try:
@@ -79,13 +143,22 @@ try:
 except Exception as e:
     print(f"[GEMINI] ✗ Error: {e}")
 
-# Inicializar base de datos al inicio
+# Inicializar base de datos al inicio (tablas y migraciones; el VACUUM único
+# para auto_vacuum incremental espera al arranque del servidor)
 try:
-    database.initialize_database()
+    database.initialize_database(vacuum=False)
     print("[DATABASE] ✓ Base de datos inicializada")
 except Exception as e:
     print(f"[DATABASE] ✗ Error: {e}")
 
+def initialize_storage():
+    """Pasa una base existente a auto_vacuum incremental al arrancar el servidor
+    (no al importar el módulo: es un VACUUM completo, una sola vez)"""
+    try:
+        database.enable_incremental_vacuum()
+    except Exception as e:
+        print(f"[DATABASE] ✗ Error activando auto_vacuum incremental: {e}")
+
 # =============================================================================
 # ENDPOINTS - GESTIÓN DE VEHÍCULOS
 # =============================================================================
@@ -199,12 +272,12 @@ def update_vehicle(vehicle_id):
 @app.route("/api/vehicles/<int:vehicle_id>", methods=["DELETE"])
 def delete_vehicle(vehicle_id):
     """Eliminar un vehículo"""
-    global active_vehicle_id
 
     try:
         # Si es el vehículo activo, deseleccionarlo
         if active_vehicle_id == vehicle_id:
-            active_vehicle_id = None
+            set_active_vehicle_id(None)
+        close_vehicle_session(vehicle_id)
 
         success = database.delete_vehicle(vehicle_id)
 
@@ -223,7 +296,6 @@ def delete_vehicle(vehicle_id):
 @app.route("/api/vehicles/<int:vehicle_id>/select", methods=["POST"])
 def select_vehicle(vehicle_id):
     """Seleccionar vehículo activo para monitoreo"""
-    global active_vehicle_id
 
     try:
         # Verificar que el vehículo existe
@@ -232,10 +304,11 @@ def select_vehicle(vehicle_id):
         if not vehicle:
             return jsonify({"error": "Vehículo no encontrado"}), 404
 
-        active_vehicle_id = vehicle_id
-
-        # Resetear datos de viaje al cambiar de vehículo
-        reset_trip()
+        # Asignar a la sesión principal (solo se reinicia su viaje)
+        try:
+            set_active_vehicle_id(vehicle_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 409
 
         print(f"[VEHICLES] Vehículo activo: {vehicle['brand']} {vehicle['model']}")
 
@@ -253,7 +326,6 @@ def select_vehicle(vehicle_id):
 @app.route("/api/vehicles/active", methods=["GET"])
 def get_active_vehicle():
     """Obtener el vehículo actualmente activo"""
-    global active_vehicle_id
 
     if active_vehicle_id is None:
         return jsonify({
@@ -266,7 +338,7 @@ def get_active_vehicle():
         vehicle = database.get_vehicle_by_id(active_vehicle_id)
 
         if not vehicle:
-            active_vehicle_id = None
+            set_active_vehicle_id(None)
             return jsonify({
                 "success": True,
                 "active_vehicle_id": None,
@@ -287,12 +359,31 @@ def get_active_vehicle():
 # ENDPOINTS - TELEMETRÍA
 # =============================================================================
 
+def parse_time_param(value, default=None):
+    """Convierte un parámetro de tiempo (epoch en segundos o ISO 8601, UTC) a epoch"""
+    if value is None or value == '':
+        return default
+    try:
+        return int(float(value))
+    except ValueError:
+        parsed = datetime.fromisoformat(value)
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return int(parsed.timestamp())
+
+def telemetry_range_args():
+    """Rango ?from=&to= (epoch o ISO 8601, UTC) común a los endpoints de telemetría"""
+    return {
+        'start_epoch': parse_time_param(request.args.get('from')),
+        'end_epoch': parse_time_param(request.args.get('to'))
+    }
+
 @app.route("/api/telemetry/<int:vehicle_id>", methods=["GET"])
 def get_telemetry_history(vehicle_id):
-    """Obtener historial de telemetría de un vehículo"""
+    """Obtener historial de telemetría de un vehículo (opcionalmente en ?from=&to=)"""
     try:
         limit = request.args.get('limit', 1000, type=int)
-        telemetry = database.get_telemetry_history(vehicle_id, limit)
+        telemetry = database.get_telemetry_history(vehicle_id, limit, **telemetry_range_args())
 
         return jsonify({
             "success": True,
@@ -301,10 +392,283 @@ def get_telemetry_history(vehicle_id):
             "telemetry": telemetry
         })
 
+    except ValueError as e:
+        return jsonify({"error": f"Parámetro de tiempo no válido: {e}"}), 400
     except Exception as e:
         print(f"[TELEMETRY] Error obteniendo historial: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/telemetry/<int:vehicle_id>/history", methods=["GET"])
+def get_telemetry_rollup_history(vehicle_id):
+    """Historial para gráficas: elige crudo o agregados (1m/1h/1d) según el rango pedido"""
+    try:
+        now = int(time.time())
+        end = parse_time_param(request.args.get('to'), now)
+        start = parse_time_param(request.args.get('from'), end - 86400)
+        max_points = request.args.get('max_points', 500, type=int)
+        resolution = request.args.get('resolution') or database.choose_rollup_resolution(start, end, max_points)
+
+        if resolution == 'raw':
+            points = database.get_telemetry_range(vehicle_id, start, end, limit=max_points * 4)
+        elif resolution in database.ROLLUP_RESOLUTIONS:
+            points = database.get_telemetry_rollups(vehicle_id, resolution, start, end)
+        else:
+            return jsonify({"error": f"Resolución no válida: {resolution}"}), 400
+
+        return jsonify({
+            "success": True,
+            "vehicle_id": vehicle_id,
+            "resolution": resolution,
+            "from": start,
+            "to": end,
+            "count": len(points),
+            "points": points
+        })
+
+    except ValueError as e:
+        return jsonify({"error": f"Parámetro de tiempo no válido: {e}"}), 400
+    except Exception as e:
+        print(f"[TELEMETRY] Error obteniendo historial agregado: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def telemetry_cursor_args():
+    """Parámetros de cursor keyset y de rango comunes a /page y /stream"""
+    return {
+        'after_id': request.args.get('after_id', type=int),
+        'before_ts_ms': request.args.get('before_ts_ms', type=int),
+        'before_timestamp': request.args.get('before_timestamp') or None,
+        'before_id': request.args.get('before_id', type=int),
+        **telemetry_range_args()
+    }
+
+@app.route("/api/telemetry/<int:vehicle_id>/page", methods=["GET"])
+def get_telemetry_page(vehicle_id):
+    """Página de telemetría por cursor (after_id o before_ts_ms/before_id) y rango opcional"""
+    try:
+        limit = min(request.args.get('limit', 500, type=int), 5000)
+        rows, next_cursor = database.get_telemetry_page(vehicle_id, limit=limit, **telemetry_cursor_args())
+
+        return jsonify({
+            "success": True,
+            "vehicle_id": vehicle_id,
+            "count": len(rows),
+            "telemetry": rows,
+            "next_cursor": next_cursor
+        })
+
+    except ValueError as e:
+        return jsonify({"error": f"Parámetro de tiempo no válido: {e}"}), 400
+    except Exception as e:
+        print(f"[TELEMETRY] Error obteniendo página: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/telemetry/<int:vehicle_id>/stream", methods=["GET"])
+def stream_telemetry(vehicle_id):
+    """Exporta la telemetría en streaming (JSON lines o array JSON) con memoria constante"""
+    output_format = request.args.get('format', 'ndjson')
+    limit = request.args.get('limit', type=int)
+    try:
+        cursor_args = telemetry_cursor_args()
+    except ValueError as e:
+        return jsonify({"error": f"Parámetro de tiempo no válido: {e}"}), 400
+    rows = database.iter_telemetry(vehicle_id, limit=limit, **cursor_args)
+
+    if output_format == 'ndjson':
+        def generate():
+            for row in rows:
+                yield json.dumps(row, ensure_ascii=False) + '\n'
+        mimetype = 'application/x-ndjson'
+    elif output_format == 'json':
+        def generate():
+            yield '['
+            separator = ''
+            for row in rows:
+                yield separator + json.dumps(row, ensure_ascii=False)
+                separator = ','
+            yield ']'
+        mimetype = 'application/json'
+    else:
+        return jsonify({"error": "Formato no válido (ndjson o json)"}), 400
+
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+@app.route("/api/vehicles/<int:vehicle_id>/export", methods=["GET"])
+def export_vehicle_data(vehicle_id):
+    """Exporta datos de un vehículo en streaming, directamente desde SQLite
+
+    ?format=csv | csv.gz (un conjunto, ?dataset=telemetry) o zip (varios,
+    ?include=telemetry,trips,analyses,maintenance); ?from= y ?to= acotan el
+    rango. Se genera a medida que el cliente descarga: ni ficheros temporales
+    ni el resultado completo en memoria.
+    """
+    try:
+        vehicle = database.get_vehicle_by_id(vehicle_id)
+        if not vehicle:
+            return jsonify({"error": "Vehículo no encontrado"}), 404
+
+        output_format = request.args.get('format', 'csv')
+        if output_format not in data_export.EXPORT_FORMATS:
+            return jsonify({"error": f"Formato no válido ({', '.join(data_export.EXPORT_FORMATS)})"}), 400
+
+        start = parse_time_param(request.args.get('from'))
+        end = parse_time_param(request.args.get('to'))
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        if output_format == 'zip':
+            include = request.args.get('include')
+            datasets = include.split(',') if include else list(database.EXPORT_DATASETS)
+            unknown = [d for d in datasets if d not in database.EXPORT_DATASETS]
+            if unknown:
+                return jsonify({"error": f"Conjuntos no válidos: {', '.join(unknown)}"}), 400
+            chunks = data_export.zip_chunks(vehicle, datasets, start, end)
+            filename = f"vehiculo_{vehicle_id}_{stamp}.zip"
+            mimetype = 'application/zip'
+        else:
+            dataset = request.args.get('dataset', 'telemetry')
+            if dataset not in database.EXPORT_DATASETS:
+                return jsonify({"error": f"Conjunto no válido: {dataset}"}), 400
+            chunks = data_export.csv_chunks(dataset, vehicle_id, start, end)
+            filename = f"vehiculo_{vehicle_id}_{dataset}_{stamp}.csv"
+            mimetype = 'text/csv'
+            if output_format == 'csv.gz':
+                chunks = data_export.gzip_chunks(chunks)
+                filename += '.gz'
+                mimetype = 'application/gzip'
+
+        return Response(
+            stream_with_context(chunks),
+            mimetype=mimetype,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+        )
+
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"[EXPORT] Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/telemetry/writer/stats", methods=["GET"])
+def get_telemetry_writer_stats():
+    """Contadores del escritor agrupado de telemetría (cola, lotes, descartes)"""
+    return jsonify({
+        "success": True,
+        "stats": telemetry_writer.get_stats(),
+        "csv": csv_logger.get_stats()
+    })
+
+# =============================================================================
+# ENDPOINTS - RETENCIÓN
+# =============================================================================
+
+def parse_retention_days(data, key, default):
+    """Días de una política: entero >= 1, o null para conservar siempre"""
+    if key not in data:
+        return default
+    value = data[key]
+    if value is None:
+        return None
+    days = int(value)
+    if days < 1:
+        raise ValueError(f"{key} debe ser al menos 1 día (o null para conservar siempre)")
+    return days
+
+@app.route("/api/retention", methods=["GET"])
+def get_retention_status():
+    """Estado del servicio de retención, tamaño de la base y políticas por vehículo"""
+    try:
+        return jsonify({
+            "success": True,
+            "stats": retention_service.get_stats(),
+            "storage": database.get_storage_stats(),
+            "policies": list(database.get_retention_policies().values())
+        })
+    except Exception as e:
+        print(f"[RETENTION] Error obteniendo estado: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/retention/run", methods=["POST"])
+def run_retention():
+    """Adelanta la siguiente pasada de retención (se ejecuta en segundo plano)"""
+    retention_service.start()
+    retention_service.trigger()
+    return jsonify({"success": True, "message": "Pasada de retención programada"}), 202
+
+@app.route("/api/vehicles/<int:vehicle_id>/retention", methods=["GET"])
+def get_vehicle_retention(vehicle_id):
+    """Política de retención efectiva de un vehículo"""
+    try:
+        return jsonify({
+            "success": True,
+            "vehicle_id": vehicle_id,
+            "policy": retention_service.policy_for(vehicle_id)
+        })
+    except Exception as e:
+        print(f"[RETENTION] Error obteniendo política: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/vehicles/<int:vehicle_id>/retention", methods=["PUT"])
+def set_vehicle_retention(vehicle_id):
+    """Fija la política de un vehículo: {"raw_days": 30, "rollup_days": null}"""
+    try:
+        if not database.get_vehicle_by_id(vehicle_id):
+            return jsonify({"error": "Vehículo no encontrado"}), 404
+
+        data = request.json or {}
+        current = retention_service.policy_for(vehicle_id)
+        raw_days = parse_retention_days(data, 'raw_days', current["raw_days"])
+        rollup_days = parse_retention_days(data, 'rollup_days', current["rollup_days"])
+        database.set_retention_policy(vehicle_id, raw_days, rollup_days)
+
+        return jsonify({
+            "success": True,
+            "vehicle_id": vehicle_id,
+            "policy": retention_service.policy_for(vehicle_id)
+        })
+
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Política no válida: {e}"}), 400
+    except Exception as e:
+        print(f"[RETENTION] Error guardando política: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/vehicles/<int:vehicle_id>/retention", methods=["DELETE"])
+def delete_vehicle_retention(vehicle_id):
+    """Vuelve a la política de retención por defecto"""
+    try:
+        database.delete_retention_policy(vehicle_id)
+        return jsonify({
+            "success": True,
+            "vehicle_id": vehicle_id,
+            "policy": retention_service.policy_for(vehicle_id)
+        })
+    except Exception as e:
+        print(f"[RETENTION] Error eliminando política: {e}")
+        return jsonify({"error": str(e)}), 500
+
+# =============================================================================
+# ENDPOINTS - VIAJES
+# =============================================================================
+
+@app.route("/api/trips/<int:vehicle_id>", methods=["GET"])
+def get_vehicle_trips(vehicle_id):
+    """Viajes terminados de un vehículo y sus totales (?from=&to=&limit=)"""
+    try:
+        trips = database.get_trips(
+            vehicle_id,
+            parse_time_param(request.args.get("from")),
+            parse_time_param(request.args.get("to")),
+            min(request.args.get("limit", 50, type=int), 1000)
+        )
+        return jsonify({
+            "success": True,
+            "trips": trips,
+            "totals": database.get_trip_totals(vehicle_id)
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # =============================================================================
 # ENDPOINTS - MANTENIMIENTO
 # =============================================================================
@@ -428,47 +792,33 @@ def get_analysis_history_endpoint(vehicle_id):
 # FUNCIONES CSV (mantenidas para compatibilidad)
 # =============================================================================
 
-def initialize_csv():
-    if not os.path.exists(CSV_FILENAME):
-        with open(CSV_FILENAME, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                'timestamp', 'date', 'time', 'vehicle_id',
-                'rpm', 'speed_kmh', 'throttle_pos', 'engine_load', 'maf',
-                'coolant_temp', 'intake_temp', 'distance_km'
-            ])
-        print(f"[CSV] ✓ Archivo creado con columnas optimizadas")
-
 def save_reading_to_csv(data, thermal_data=None, vehicle_id=None):
     try:
         now = datetime.now()
-        with open(CSV_FILENAME, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                now.isoformat(),
-                now.strftime('%Y-%m-%d'),
-                now.strftime('%H:%M:%S'),
-                vehicle_id if vehicle_id else '',
-                data.get('RPM', ''),
-                data.get('SPEED', ''),
-                data.get('THROTTLE_POS', ''),
-                data.get('ENGINE_LOAD', ''),
-                data.get('MAF', ''),
-                thermal_data.get('COOLANT_TEMP', '') if thermal_data else '',
-                thermal_data.get('INTAKE_TEMP', '') if thermal_data else '',
-                data.get('total_distance', '')
-            ])
+        csv_logger.write(vehicle_id, [
+            now.isoformat(),
+            now.strftime('%Y-%m-%d'),
+            now.strftime('%H:%M:%S'),
+            vehicle_id if vehicle_id else '',
+            data.get('RPM', ''),
+            data.get('SPEED', ''),
+            data.get('THROTTLE_POS', ''),
+            data.get('ENGINE_LOAD', ''),
+            data.get('MAF', ''),
+            thermal_data.get('COOLANT_TEMP', '') if thermal_data else '',
+            thermal_data.get('INTAKE_TEMP', '') if thermal_data else '',
+            data.get('total_distance', '')
+        ], now)
     except Exception as e:
         print(f"[CSV] Error guardando: {e}")
 
 def read_csv_file(filepath):
+    """Recorre las filas de un CSV como diccionarios sin cargarlo entero"""
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
-            reader = csv.DictReader(f)
-            return list(reader)
+            yield from csv.DictReader(f)
     except Exception as e:
         print(f"[CSV] Error leyendo: {e}")
-        return []
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -487,311 +837,263 @@ def calculate_distance(speed_kmh, time_delta_s):
 # ANÁLISIS DE SALUD DEL VEHÍCULO (modificado para guardar en DB)
 # =============================================================================
 
-def analyze_vehicle_health(trip_points):
-    global vehicle_health, active_vehicle_id
-
-    if not trip_points or len(trip_points) < 10:
-        return vehicle_health
+def analyze_vehicle_health(session):
+    """Genera una instantánea de salud a partir de los acumulados del analizador (O(1))"""
+    with session.lock:
+        if not session.health_analyzer.has_enough_data():
+            return session.health
+        try:
+            result = session.health_analyzer.evaluate()
+        except Exception as e:
+            print(f"[HEALTH] Error en análisis: {e}")
+            return session.health
 
     try:
-        rpms = [p.get('RPM', 0) for p in trip_points if p.get('RPM') and p.get('RPM') > 0]
-        throttles = [p.get('THROTTLE_POS', 0) for p in trip_points if p.get('THROTTLE_POS') is not None]
-        loads = [p.get('ENGINE_LOAD', 0) for p in trip_points if p.get('ENGINE_LOAD') is not None]
-        mafs = [p.get('MAF', 0) for p in trip_points if p.get('MAF') and p.get('MAF') > 0]
-        temps_coolant = [p.get('COOLANT_TEMP', 0) for p in trip_points if p.get('COOLANT_TEMP') and p.get('COOLANT_TEMP') > 0]
-        temps_intake = [p.get('INTAKE_TEMP', 0) for p in trip_points if p.get('INTAKE_TEMP') and p.get('INTAKE_TEMP') > 0]
-
-        warnings = []
-        predictions = []
-
-        # 1. SALUD DEL MOTOR
-        engine_health = 100
-        if rpms:
-            rpm_avg = statistics.mean(rpms)
-            rpm_max = max(rpms)
-
-            high_rpm_count = sum(1 for r in rpms if r > 4000)
-            high_rpm_ratio = high_rpm_count / len(rpms)
-
-            if high_rpm_ratio > 0.3:
-                engine_health -= 20
-                warnings.append("⚠️ Uso frecuente de RPM altas (>4000). Aumenta desgaste del motor.")
-                predictions.append("Riesgo medio de desgaste prematuro de componentes en 12-18 meses")
-
-            if rpm_max > 6000:
-                engine_health -= 15
-                warnings.append("🔴 RPM CRÍTICAS detectadas (>6000). Revisar limitador.")
-
-        if loads:
-            load_avg = statistics.mean(loads)
-            if load_avg > 80:
-                engine_health -= 10
-                warnings.append("⚠️ Carga motor alta (>80%). Revisar admisión.")
-
-        # 2. SALUD TÉRMICA
-        thermal_health = 100
-        if temps_coolant:
-            temp_max = max(temps_coolant)
-            temp_avg = statistics.mean(temps_coolant)
-
-            if temp_max > 105:
-                thermal_health -= 30
-                warnings.append("🔴 CRÍTICO: Temperatura >105°C. Revisar sistema URGENTE.")
-                predictions.append("Riesgo ALTO de fallo en junta culata o radiador en 1-3 meses")
-            elif temp_avg > 95:
-                thermal_health -= 15
-                warnings.append("⚠️ Temperatura elevada. Revisar termostato y radiador.")
-                predictions.append("Riesgo medio de sobrecalentamiento. Mantenimiento en 3-6 meses")
-
-        if temps_intake:
-            temp_intake_avg = statistics.mean(temps_intake)
-            if temp_intake_avg > 50:
-                thermal_health -= 10
-                warnings.append("⚠️ Temperatura admisión alta. Revisar intercooler.")
-
-        # 3. EFICIENCIA
-        efficiency_health = 100
-        if mafs:
-            maf_avg = statistics.mean(mafs)
-            if maf_avg < 10 or maf_avg > 80:
-                efficiency_health -= 15
-                warnings.append("⚠️ Flujo aire anómalo. Revisar MAF y filtro.")
-                predictions.append("Posible obstrucción en admisión. Reducción eficiencia 5-10%")
-
-        if throttles and len(throttles) > 1:
-            harsh_accel = 0
-            for i in range(1, len(throttles)):
-                if throttles[i] - throttles[i-1] > 30:
-                    harsh_accel += 1
-
-            harsh_ratio = harsh_accel / len(throttles)
-            if harsh_ratio > 0.05:
-                efficiency_health -= 10
-                warnings.append("⚠️ Conducción agresiva. Aumenta consumo y desgaste.")
-
-        # PUNTUACIÓN GLOBAL
-        overall_score = round((engine_health + thermal_health + efficiency_health) / 3)
-
-        vehicle_health = {
-            "overall_score": overall_score,
-            "engine_health": round(engine_health),
-            "thermal_health": round(thermal_health),
-            "efficiency_health": round(efficiency_health),
-            "warnings": warnings,
-            "predictions": predictions,
+        session.health = {
+            **result,
             "last_update": datetime.now().isoformat()
         }
 
-        # Guardar en base de datos si hay vehículo activo
-        if active_vehicle_id:
-            try:
-                database.save_ai_analysis(
-                    active_vehicle_id,
-                    vehicle_health['overall_score'],
-                    vehicle_health['engine_health'],
-                    vehicle_health['thermal_health'],
-                    vehicle_health['efficiency_health'],
-                    vehicle_health['predictions'],
-                    vehicle_health['warnings']
-                )
-            except Exception as e:
-                print(f"[HEALTH] Error guardando en DB: {e}")
-
-        save_health_history(vehicle_health)
-        return vehicle_health
+        save_health_history(session.health, session.vehicle_id)
+        live_broadcaster.publish("health", {**session.health, "vehicle_id": session.vehicle_id},
+                                 channel=session.port)
+        return session.health
 
     except Exception as e:
         print(f"[HEALTH] Error en análisis: {e}")
-        return vehicle_health
+        return session.health
 
-def save_health_history(health_data):
-    try:
-        history = []
-        if os.path.exists(HEALTH_HISTORY_FILE):
-            with open(HEALTH_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-
-        history.append(health_data)
+def save_health_history(health_data, vehicle_id=None):
+    """Añade una instantánea al historial (append O(1), sin reescribir nada)
 
-        if len(history) > 100:
-            history = history[-100:]
+    Se guarda en ai_analysis, con vehicle_id NULL si no hay vehículo activo,
+    y se conserva en la cola en memoria.
+    """
+    health_tail.append({**health_data, "vehicle_id": vehicle_id})
 
-        with open(HEALTH_HISTORY_FILE, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
+    try:
+        database.save_ai_analysis(
+            vehicle_id or None,
+            health_data['overall_score'],
+            health_data['engine_health'],
+            health_data['thermal_health'],
+            health_data['efficiency_health'],
+            health_data['predictions'],
+            health_data['warnings']
+        )
     except Exception as e:
         print(f"[HEALTH] Error guardando: {e}")
 
-def get_trip_history():
-    if os.path.exists(TRIP_HISTORY_FILE):
-        with open(TRIP_HISTORY_FILE, 'r', encoding='utf-8') as f:
-            try:
-                return json.load(f)
-            except:
-                return []
-    return []
-
-def save_trip_summary(summary):
-    history = get_trip_history()
-    history.append(summary)
-    with open(TRIP_HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history, f, indent=4, ensure_ascii=False)
-
 # =============================================================================
 # FUNCIONES OBD
 # =============================================================================
 
-def initialize_obd_connection(force_reconnect=False):
-    global connection, supported_commands_cache, last_connection_attempt_time
-
+def initialize_obd_connection(session, force_reconnect=False):
     current_time = time.time()
-    if not force_reconnect and current_time - last_connection_attempt_time < RECONNECTION_COOLDOWN:
+    if not force_reconnect and current_time - session.last_connection_attempt < RECONNECTION_COOLDOWN:
         return False
 
-    last_connection_attempt_time = current_time
+    session.last_connection_attempt = current_time
 
-    if connection and connection.is_connected() and not force_reconnect:
+    if session.is_connected() and not force_reconnect:
         return True
 
     try:
-        print(f"[OBD] Conectando a {OBD_PORT}...")
-        new_connection = obd.OBD(OBD_PORT, baudrate=None, fast=False, timeout=10)
+        print(f"[OBD] Conectando a {session.port}...")
+        new_connection = obd.OBD(session.port, baudrate=None, fast=False, timeout=10)
 
         if new_connection.is_connected():
-            connection = new_connection
-            print("[OBD] ✓ Conectado exitosamente")
+            session.connection = new_connection
+            print(f"[OBD] ✓ Conectado exitosamente ({session.port})")
             time.sleep(1)
 
-            if force_reconnect or not supported_commands_cache:
-                supported_commands_cache = set(connection.supported_commands)
+            if force_reconnect or not session.supported_commands:
+                session.supported_commands = set(new_connection.supported_commands)
 
-            if supported_commands_cache:
-                print(f"[OBD] ✓ {len(supported_commands_cache)} comandos soportados")
+            if session.supported_commands:
+                print(f"[OBD] ✓ {len(session.supported_commands)} comandos soportados")
             return True
         else:
-            print(f"[OBD] ✗ No se pudo conectar")
-            connection = None
+            print(f"[OBD] ✗ No se pudo conectar ({session.port})")
+            session.connection = None
             return False
 
     except Exception as e:
-        print(f"[OBD] ✗ Error: {e}")
-        connection = None
+        print(f"[OBD] ✗ Error ({session.port}): {e}")
+        session.connection = None
         return False
 
-def reset_trip():
-    global trip_data
-    trip_data = {
-        "active": False,
-        "start_time": None,
-        "last_read_time": None,
-        "distance_km": 0.0,
-        "points": []
-    }
-
-reset_trip()
-initialize_csv()
 
 # =============================================================================
-# ENDPOINTS OBD (modificados para multi-vehículo)
+# ADQUISICIÓN OBD EN SEGUNDO PLANO
 # =============================================================================
 
-@app.route("/get_live_data", methods=["GET"])
-def get_live_data():
-    global connection, trip_data, last_thermal_reading_time, active_vehicle_id
-
-    if not connection or not connection.is_connected():
-        if not initialize_obd_connection(force_reconnect=True):
-            return jsonify({
-                "offline": True,
-                "RPM": None,
-                "SPEED": None,
-                "THROTTLE_POS": None,
-                "ENGINE_LOAD": None,
-                "MAF": None,
-                "COOLANT_TEMP": None,
-                "INTAKE_TEMP": None,
-                "total_distance": 0,
-                "active_vehicle_id": active_vehicle_id
-            })
-
-    # DATOS CRÍTICOS (cada 3s)
-    critical_commands = [
-        obd.commands.RPM,
-        obd.commands.SPEED,
-        obd.commands.THROTTLE_POS,
-        obd.commands.ENGINE_LOAD,
-        obd.commands.MAF
+def build_trip_record(trip):
+    """Agregados del viaje listos para la tabla trips, calculados sobre el buffer"""
+    points = trip["points"]
+    record = {
+        "start_time": trip["start_time"],
+        "end_time": trip["last_read_time"],
+        "duration_s": round(trip["last_read_time"] - trip["start_time"], 1),
+        "distance_km": round(trip["distance_km"], 3),
+        "sample_count": points.appended
+    }
+    for column, prefix in database.TRIP_AGGREGATE_COLUMNS.items():
+        stats = points.stats(column, nonzero=True)
+        record[f"{prefix}_avg"] = round(stats["mean"], 2) if stats["count"] else None
+        record[f"{prefix}_max"] = round(stats["max"], 2) if stats["count"] else None
+    return record
+
+def check_trip_end(session, now):
+    """Cierra el viaje si el motor lleva TRIP_END_IDLE_SECONDS apagado.
+
+    Se llama con session.lock tomado; devuelve el registro del viaje terminado o None.
+    Los puntos se conservan hasta que empiece el siguiente viaje para que el
+    análisis predictivo pueda usarlos después de aparcar.
+    """
+    trip = session.trip
+    if not trip["active"]:
+        return None
+    if trip["idle_since"] is None:
+        trip["idle_since"] = now
+        return None
+    if now - trip["idle_since"] < TRIP_END_IDLE_SECONDS:
+        return None
+
+    trip["active"] = False
+    trip["idle_since"] = None
+    return build_trip_record(trip)
+
+def finish_trip(session, record):
+    """Persiste un viaje terminado y lo notifica al stream"""
+    if record is None:
+        return
+    vehicle_id = session.vehicle_id
+    print(f"[TRIP] ✓ Viaje terminado ({session.port}): {record['distance_km']} km en {round(record['duration_s'] / 60, 1)} min")
+    try:
+        record["id"] = database.save_trip(vehicle_id, record) if vehicle_id else None
+    except Exception as e:
+        print(f"[TRIP] Error guardando viaje: {e}")
+    live_broadcaster.publish("trip", {**record, "vehicle_id": vehicle_id}, channel=session.port)
+
+def build_pid_scheduler(supported_commands):
+    """Planificador con PID_SCHEDULE y los PIDs soportados como relleno"""
+    specs = [
+        PIDSpec(obd.commands[name], period_moving, period_idle, priority)
+        for name, period_moving, period_idle, priority in PID_SCHEDULE
     ]
+    return PIDScheduler(
+        specs,
+        cycle_interval=ACQUISITION_INTERVAL,
+        bus_fraction=OBD_BUS_BUDGET,
+        filler_commands=supported_commands or (),
+        filler_period=OBD_FILLER_PERIOD
+    )
+
+def offline_reading():
+    """Lectura vacía que se publica cuando no hay conexión con el adaptador"""
+    return {
+        "offline": True,
+        "RPM": None,
+        "SPEED": None,
+        "THROTTLE_POS": None,
+        "ENGINE_LOAD": None,
+        "MAF": None,
+        "COOLANT_TEMP": None,
+        "INTAKE_TEMP": None,
+        "total_distance": 0
+    }
 
-    results = {}
-    for cmd in critical_commands:
-        try:
-            response = connection.query(cmd)
-            if response and response.value is not None:
-                results[cmd.name] = response.value.magnitude if hasattr(response.value, 'magnitude') else response.value
-            else:
-                results[cmd.name] = None
-        except Exception as e:
-            results[cmd.name] = None
-
-    # DATOS TÉRMICOS (cada 60s)
-    thermal_data = {}
+def acquire_sample(session):
+    """Un ciclo de muestreo: consulta el adaptador, gestiona el viaje y persiste la lectura.
+
+    Solo lo ejecuta el worker de la sesión, que es el dueño de `session.connection`.
+    """
+    if not session.is_connected():
+        if not initialize_obd_connection(session):
+            with session.lock:
+                ended = check_trip_end(session, time.time())
+            finish_trip(session, ended)
+            return offline_reading()
+
+    # Lector y planificador dependen del protocolo y de los PIDs soportados:
+    # se rehacen con cada conexión nueva
+    if session.pid_reader is None or session.pid_reader.connection is not session.connection:
+        session.pid_reader = MultiPIDReader(session.connection, enabled=OBD_MULTI_PID, max_pids=OBD_MULTI_PID_MAX)
+        session.pid_scheduler = build_pid_scheduler(session.supported_commands)
+    pid_reader = session.pid_reader
+    pid_scheduler = session.pid_scheduler
+
+    # Al ralentí (motor en marcha, vehículo parado) se relajan los PIDs de conducción
+    moving = bool(pid_scheduler.last_values.get('SPEED'))
     current_time = time.time()
-
-    if current_time - last_thermal_reading_time >= THERMAL_READING_INTERVAL:
-        thermal_commands = [
-            obd.commands.COOLANT_TEMP,
-            obd.commands.INTAKE_TEMP
-        ]
-
-        for cmd in thermal_commands:
-            try:
-                response = connection.query(cmd)
-                if response and response.value is not None:
-                    thermal_data[cmd.name] = response.value.magnitude if hasattr(response.value, 'magnitude') else response.value
-                else:
-                    thermal_data[cmd.name] = None
-            except Exception as e:
-                thermal_data[cmd.name] = None
-
-        last_thermal_reading_time = current_time
-        results.update(thermal_data)
-    else:
-        if trip_data.get("points") and len(trip_data["points"]) > 0:
-            last_point = trip_data["points"][-1]
-            results['COOLANT_TEMP'] = last_point.get('COOLANT_TEMP')
-            results['INTAKE_TEMP'] = last_point.get('INTAKE_TEMP')
+    commands = pid_scheduler.plan(current_time, moving)
+
+    started = time.monotonic()
+    values = pid_reader.query(commands)
+    sample_ms = int(time.time() * 1000)  # Hora de la lectura, no la de escritura en la base
+    pid_scheduler.record(commands, values, time.monotonic() - started, current_time)
+
+    # Los PIDs no leídos en este ciclo conservan su último valor; los de relleno
+    # (solo valores numéricos) se publican aparte en 'extra'
+    results = pid_scheduler.sample(values)
+    extra = {
+        name: value for name, value in values.items()
+        if pid_scheduler.is_filler(name) and isinstance(value, (int, float))
+    }
+    if extra:
+        results['extra'] = extra
+
+    # Solo los térmicos leídos en este ciclo van al CSV
+    thermal_data = {name: values[name] for name in ('COOLANT_TEMP', 'INTAKE_TEMP') if name in values}
+    vehicle_id = session.vehicle_id
+
+    with session.lock:
+        trip = session.trip
+
+        # GESTIÓN DE VIAJE
+        ended = None
+        if results.get("RPM") and results.get("RPM") > TRIP_RPM_THRESHOLD:
+            if not trip["active"]:
+                session.reset_trip()
+                trip = session.trip
+                trip["active"] = True
+                trip["start_time"] = time.time()
+                trip["last_read_time"] = time.time()
+                print(f"[TRIP] ✓ Nuevo viaje iniciado ({session.port})")
+
+            current_time = time.time()
+            time_delta_s = current_time - trip["last_read_time"]
+
+            if results.get("SPEED") and time_delta_s > 0:
+                distance_increment = calculate_distance(results.get("SPEED"), time_delta_s)
+                trip["distance_km"] += distance_increment
+
+            results['total_distance'] = round(trip['distance_km'], 3)
+            # El analizador recibe el mismo punto que se guarda en el viaje (con los
+            # valores arrastrados, como el análisis original): la salud en vivo
+            # coincide con evaluate_points() sobre los puntos grabados
+            trip["points"].append(results, timestamp=current_time)
+            session.health_analyzer.add_sample(results)
+            trip["last_read_time"] = current_time
+            trip["idle_since"] = None
+            point_count = trip["points"].appended
         else:
-            results['COOLANT_TEMP'] = None
-            results['INTAKE_TEMP'] = None
-
-    # GESTIÓN DE VIAJE
-    if results.get("RPM") and results.get("RPM") > 400:
-        if not trip_data["active"]:
-            reset_trip()
-            trip_data["active"] = True
-            trip_data["start_time"] = time.time()
-            trip_data["last_read_time"] = time.time()
-            print("[TRIP] ✓ Nuevo viaje iniciado")
-
-        current_time = time.time()
-        time_delta_s = current_time - trip_data["last_read_time"]
+            results['total_distance'] = trip['distance_km'] if trip["active"] else 0
+            point_count = 0
+            ended = check_trip_end(session, time.time())
 
-        if results.get("SPEED") and time_delta_s > 0:
-            distance_increment = calculate_distance(results.get("SPEED"), time_delta_s)
-            trip_data["distance_km"] += distance_increment
-
-        results['total_distance'] = round(trip_data['distance_km'], 3)
-        trip_data["points"].append(results)
-        trip_data["last_read_time"] = current_time
+    finish_trip(session, ended)
 
+    if point_count:
         # Guardar en CSV y en base de datos
-        save_reading_to_csv(results, thermal_data if thermal_data else None, active_vehicle_id)
+        save_reading_to_csv(results, thermal_data if thermal_data else None, vehicle_id)
 
-        # Guardar en base de datos si hay vehículo activo
-        if active_vehicle_id:
+        # Encolar para el escritor agrupado si la sesión tiene vehículo
+        if vehicle_id:
             try:
-                database.save_telemetry(
-                    active_vehicle_id,
+                telemetry_writer.submit(
+                    vehicle_id,
                     results.get('RPM'),
                     results.get('SPEED'),
                     results.get('THROTTLE_POS'),
@@ -799,66 +1101,526 @@ def get_live_data():
                     results.get('COOLANT_TEMP'),
                     results.get('INTAKE_TEMP'),
                     results.get('MAF'),
-                    results.get('total_distance')
+                    results.get('total_distance'),
+                    timestamp_ms=sample_ms
                 )
             except Exception as e:
-                print(f"[TELEMETRY] Error guardando en DB: {e}")
+                print(f"[TELEMETRY] Error encolando muestra: {e}")
+
+        if point_count % HEALTH_ANALYSIS_EVERY == 0:
+            analyze_vehicle_health(session)
+
+    return results
+
+telemetry_writer = TelemetryWriter(
+    max_queue=TELEMETRY_QUEUE_SIZE,
+    batch_size=TELEMETRY_BATCH_SIZE,
+    flush_interval_ms=TELEMETRY_FLUSH_INTERVAL_MS
+)
+
+csv_logger = CsvLogger(
+    CSV_FOLDER,
+    flush_interval=CSV_FLUSH_INTERVAL,
+    flush_rows=CSV_FLUSH_ROWS,
+    max_bytes=CSV_MAX_MB * 1024 * 1024,
+    compress=CSV_COMPRESS
+)
+
+def publish_live_reading(session, reading):
+    """Reenvía cada lectura publicada por el worker al canal de su sesión"""
+    reading['vehicle_id'] = session.vehicle_id
+    reading['active_vehicle_id'] = session.vehicle_id
+    reading['port'] = session.port
+    live_broadcaster.publish("live", reading, channel=session.port)
+
+def create_session(port, vehicle_id=None, primary=False):
+    """Registra una sesión de adquisición con su propio worker (sin arrancarlo)"""
+    session = VehicleSession(port, vehicle_id, trip_capacity=TRIP_BUFFER_CAPACITY, primary=primary)
+    session.worker = AcquisitionWorker(
+        lambda: acquire_sample(session),
+        interval=ACQUISITION_INTERVAL,
+        name=f"obd-acquisition-{port}",
+        on_publish=lambda reading: publish_live_reading(session, reading)
+    )
+    return sessions.add(session)
+
+def stop_all_sessions(timeout=5):
+    for session in sessions.all():
+        session.worker.stop(timeout)
+
+# Sesión principal: el adaptador de OBD_PORT registra el vehículo activo
+primary_session = create_session(OBD_PORT, primary=True)
+
+# atexit ejecuta en orden inverso: primero se para la adquisición y después
+# el escritor vacía su cola
+atexit.register(csv_logger.close)
+atexit.register(telemetry_writer.stop, 10)
+atexit.register(stop_all_sessions, 5)
+
+def publish_job_result(job):
+    """Notifica por el stream SSE que un análisis IA ha terminado"""
+    live_broadcaster.publish("job", {
+        "job_id": job["id"],
+        "job_type": job["job_type"],
+        "vehicle_id": job["vehicle_id"],
+        "status": job["status"]
+    })
+
+ai_jobs = JobQueue(
+    max_workers=AI_JOB_WORKERS,
+    max_pending=AI_JOB_MAX_PENDING,
+    timeout=AI_JOB_TIMEOUT,
+    on_finish=publish_job_result,
+    name='ai'
+)
+atexit.register(ai_jobs.shutdown)
+
+def finish_import(job):
+    """Publica el resultado final de una importación y libera su progreso"""
+    import_progress.pop(job["id"], None)
+    live_broadcaster.publish("import", {
+        "job_id": job["id"],
+        "vehicle_id": job["vehicle_id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"]
+    })
+
+# Importaciones de CSV: un único worker para no competir por el lock de escritura
+import_jobs = JobQueue(
+    max_workers=1,
+    max_pending=CSV_IMPORT_MAX_PENDING,
+    timeout=CSV_IMPORT_TIMEOUT,
+    on_finish=finish_import,
+    name='import'
+)
+atexit.register(import_jobs.shutdown)
+import_progress = {}  # job_id -> último estado publicado por la importación en curso
+
+def vehicle_importing(vehicle_id):
+    """True si hay una importación de CSV pendiente o en curso para el vehículo"""
+    return any(state.get("vehicle_id") == vehicle_id for state in list(import_progress.values()))
+
+# La telemetría importada se agrega al terminar: no se poda mientras tanto
+retention_service = RetentionService(
+    raw_days=RETENTION_RAW_DAYS,
+    rollup_days=RETENTION_ROLLUP_DAYS,
+    interval=RETENTION_INTERVAL,
+    batch_size=RETENTION_BATCH_SIZE,
+    batch_pause=RETENTION_BATCH_PAUSE,
+    vacuum_pages=RETENTION_VACUUM_PAGES,
+    is_busy=vehicle_importing,
+    housekeeping={"ai_cache": ai_cache.purge_expired}  # Respuestas de Gemini caducadas
+)
+atexit.register(retention_service.stop, 5)
+
+backups = BackupManager(
+    BACKUP_FOLDER,
+    keep=BACKUP_KEEP,
+    pages_per_step=BACKUP_PAGES_PER_STEP,
+    step_pause=BACKUP_STEP_PAUSE,
+    compress=BACKUP_COMPRESS
+)
+
+def finish_backup(job):
+    """Publica el final de una copia de seguridad y libera su progreso"""
+    backup_progress.pop(job["id"], None)
+    live_broadcaster.publish("backup", {
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"]
+    })
+
+# Copias de seguridad: una a la vez y fuera de los hilos de Flask
+backup_jobs = JobQueue(
+    max_workers=1,
+    max_pending=BACKUP_MAX_PENDING,
+    timeout=BACKUP_TIMEOUT,
+    on_finish=finish_backup,
+    name='backup'
+)
+atexit.register(backup_jobs.shutdown)
+backup_progress = {}  # job_id -> páginas copiadas de la copia en curso
+
+report_renderer = ReportRenderer(max_bytes=REPORT_CACHE_MB * 1024 * 1024, timeout=REPORT_TIMEOUT)
+atexit.register(report_renderer.shutdown)
+
+def finish_report_batch(job):
+    """Publica el final de un lote de informes y libera su progreso"""
+    report_progress.pop(job["id"], None)
+    live_broadcaster.publish("report_batch", {
+        "job_id": job["id"],
+        "status": job["status"],
+        "error": job["error"]
+    })
+
+# Lotes de informes: uno a la vez, cada uno ya reparte el render entre todos los núcleos
+report_jobs = JobQueue(
+    max_workers=1,
+    max_pending=REPORT_BATCH_MAX_PENDING,
+    timeout=REPORT_BATCH_TIMEOUT,
+    on_finish=finish_report_batch,
+    name='report'
+)
+atexit.register(report_jobs.shutdown)
+report_progress = {}  # job_id -> último estado publicado por el lote en curso
+
+def start_background_services():
+    """Arranca el escritor de telemetría, la retención y los workers de todas las sesiones"""
+    telemetry_writer.start()
+    retention_service.start()
+
+    for port, vehicle_id in OBD_EXTRA_SESSIONS:
+        if sessions.get(port) is None:
+            try:
+                create_session(port, vehicle_id)
+            except ValueError as e:
+                print(f"[SESSIONS] {e}")
 
-        if len(trip_data["points"]) % 30 == 0:
-            analyze_vehicle_health(trip_data["points"])
-    else:
-        results['total_distance'] = trip_data['distance_km'] if trip_data["active"] else 0
+    for session in sessions.all():
+        session.worker.start()
+
+def set_active_vehicle_id(vehicle_id):
+    """Asigna el vehículo activo a la sesión principal; solo se reinicia su viaje"""
+    global active_vehicle_id
 
-    results['active_vehicle_id'] = active_vehicle_id
+    other = sessions.find_vehicle(vehicle_id) if vehicle_id is not None else None
+    if other is not None and not other.primary:
+        raise ValueError(f"El vehículo {vehicle_id} ya se está registrando en {other.port}")
+
+    changed = primary_session.vehicle_id != vehicle_id
+    active_vehicle_id = vehicle_id
+    primary_session.vehicle_id = vehicle_id
+    if changed:
+        primary_session.reset_trip()
+
+def close_vehicle_session(vehicle_id):
+    """Detiene la sesión secundaria que registra un vehículo (si la hay)"""
+    session = sessions.find_vehicle(vehicle_id)
+    if session is None or session.primary:
+        return False
+
+    sessions.remove(session.port)
+    session.worker.stop(5)
+    if session.connection:
+        try:
+            session.connection.close()
+        except Exception:
+            pass
+    print(f"[SESSIONS] Sesión {session.port} detenida")
+    return True
+
+def session_for_request():
+    """Sesión indicada por ?vehicle_id= (o en el cuerpo JSON); por defecto la principal"""
+    vehicle_id = request.args.get("vehicle_id", type=int)
+    if vehicle_id is None and request.is_json:
+        vehicle_id = (request.get_json(silent=True) or {}).get("vehicle_id")
+    if vehicle_id is None:
+        return primary_session
+    return sessions.find_vehicle(vehicle_id)
+
+# =============================================================================
+# ENDPOINTS OBD (modificados para multi-vehículo)
+# =============================================================================
+
+@app.route("/get_live_data", methods=["GET"])
+def get_live_data():
+    """Última lectura publicada por el worker de una sesión (no toca el puerto serie)
+
+    ?vehicle_id= elige la sesión; sin él se usa la del adaptador principal.
+    """
+    if not primary_session.worker.is_running():
+        start_background_services()
+
+    session = session_for_request()
+    if session is None:
+        return jsonify({"error": "No hay sesión de adquisición para ese vehículo"}), 404
+
+    results = session.worker.get_snapshot() or offline_reading()
+    results['vehicle_id'] = session.vehicle_id
+    results['active_vehicle_id'] = session.vehicle_id
     return jsonify(results)
 
+@app.route("/stream/live", methods=["GET"])
+def stream_live():
+    """Stream SSE con cada lectura ('live') y cada análisis de salud ('health')
+
+    Para reanudar se usa la cabecera Last-Event-ID (EventSource la envía sola)
+    o el parámetro ?since=<secuencia>. ?vehicle_id= elige la sesión y ?all=1
+    recibe los eventos de todas.
+    """
+    if not primary_session.worker.is_running():
+        start_background_services()
+
+    session = session_for_request()
+    if session is None:
+        return jsonify({"error": "No hay sesión de adquisición para ese vehículo"}), 404
+    channel = None if request.args.get('all') == '1' else session.port
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_event_id = int(last_event_id) if last_event_id is not None else None
+    except ValueError:
+        last_event_id = None
+
+    # Un cliente nuevo recibe primero la última lectura disponible
+    initial = None
+    snapshot = session.worker.get_snapshot()
+    if snapshot:
+        snapshot['vehicle_id'] = session.vehicle_id
+        snapshot['active_vehicle_id'] = session.vehicle_id
+        initial = ("live", snapshot)
+
+    subscriber = live_broadcaster.subscribe(last_event_id, initial=initial, channel=channel)
+
+    return Response(
+        stream_with_context(live_broadcaster.stream(subscriber, heartbeat=STREAM_HEARTBEAT)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route("/api/obd/stats", methods=["GET"])
+def get_obd_stats():
+    """Peticiones enviadas al adaptador (agrupadas, individuales, PIDs recuperados uno a uno)"""
+    session = session_for_request()
+    if session is None:
+        return jsonify({"error": "No hay sesión de adquisición para ese vehículo"}), 404
+
+    connection = session.connection
+    return jsonify({
+        "success": True,
+        "port": session.port,
+        "vehicle_id": session.vehicle_id,
+        "connected": session.is_connected(),
+        "protocol": connection.protocol_name() if connection else None,
+        "multi_pid": session.pid_reader.get_stats() if session.pid_reader else None,
+        "scheduler": session.pid_scheduler.get_stats() if session.pid_scheduler else None
+    })
+
+@app.route("/stream/stats", methods=["GET"])
+def stream_stats():
+    """Estado del publicador SSE (clientes, eventos, desconexiones por lentitud)"""
+    return jsonify({"success": True, "stats": live_broadcaster.get_stats()})
+
 @app.route("/get_vehicle_health", methods=["GET"])
 def get_vehicle_health():
-    global vehicle_health
-    return jsonify(vehicle_health)
+    """Salud calculada por la sesión del vehículo (?vehicle_id=, por defecto la principal)"""
+    session = session_for_request()
+    if session is None:
+        return jsonify({"error": "No hay sesión de adquisición para ese vehículo"}), 404
+    return jsonify(session.health)
+
+# =============================================================================
+# ENDPOINTS - SESIONES DE ADQUISICIÓN
+# =============================================================================
+
+@app.route("/api/sessions", methods=["GET"])
+def list_sessions():
+    """Sesiones de adquisición registradas (una por adaptador)"""
+    return jsonify({
+        "success": True,
+        "sessions": [session.describe() for session in sessions.all()]
+    })
+
+@app.route("/api/sessions", methods=["POST"])
+def create_session_endpoint():
+    """Abre una sesión en otro adaptador para registrar un vehículo en paralelo"""
+    try:
+        data = request.json or {}
+        port = data.get("port")
+        vehicle_id = data.get("vehicle_id")
+
+        if not port or not vehicle_id:
+            return jsonify({"error": "port y vehicle_id requeridos"}), 400
+        if not database.get_vehicle_by_id(vehicle_id):
+            return jsonify({"error": "Vehículo no encontrado"}), 404
+
+        try:
+            session = create_session(port, vehicle_id)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 409
+
+        telemetry_writer.start()
+        session.worker.start()
+        print(f"[SESSIONS] ✓ Sesión {port} → vehículo {vehicle_id}")
+
+        return jsonify({"success": True, "session": session.describe()}), 201
+    except Exception as e:
+        print(f"[SESSIONS] Error creando sesión: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/sessions/<int:vehicle_id>", methods=["DELETE"])
+def delete_session_endpoint(vehicle_id):
+    """Detiene la sesión de un vehículo (la principal no se puede eliminar)"""
+    session = sessions.find_vehicle(vehicle_id)
+    if session is None:
+        return jsonify({"error": "No hay sesión para ese vehículo"}), 404
+    if session.primary:
+        return jsonify({"error": "La sesión principal no se puede eliminar"}), 400
+
+    close_vehicle_session(vehicle_id)
+    return jsonify({"success": True, "message": f"Sesión {session.port} detenida"})
+
+def analysis_to_health(row, vehicle_id):
+    """Convierte una fila de ai_analysis al formato de vehicle_health"""
+    return {
+        "overall_score": row['health_score'],
+        "engine_health": row['engine_health'],
+        "thermal_health": row['thermal_health'],
+        "efficiency_health": row['efficiency_health'],
+        "warnings": row['warnings'],
+        "predictions": row['predictions'],
+        "last_update": row['analysis_date'],
+        "vehicle_id": vehicle_id
+    }
 
 @app.route("/get_health_history", methods=["GET"])
 def get_health_history():
+    """Historial de salud (?vehicle_id=&from=&to=&limit=)
+
+    Sin rango se sirve desde la cola en memoria; con rango (o si la cola no
+    alcanza) se consulta ai_analysis por índice. Sin vehículo (ni activo) se
+    devuelven las instantáneas tomadas sin vehículo.
+    """
     try:
-        if os.path.exists(HEALTH_HISTORY_FILE):
-            with open(HEALTH_HISTORY_FILE, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-                return jsonify({"history": history})
-        return jsonify({"history": []})
+        vehicle_id = request.args.get("vehicle_id", type=int) or active_vehicle_id
+        start = parse_time_param(request.args.get("from"))
+        end = parse_time_param(request.args.get("to"))
+        limit = min(request.args.get("limit", HEALTH_HISTORY_TAIL, type=int), 5000)
+
+        if start is None and end is None:
+            recent = [h for h in health_tail if (h["vehicle_id"] or None) == vehicle_id]
+            if len(recent) >= limit:
+                return jsonify({"history": recent[-limit:]})
+
+        rows = database.get_ai_analysis_range(vehicle_id, start, end, limit)
+        history = [analysis_to_health(row, vehicle_id) for row in reversed(rows)]
+        return jsonify({"history": history})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+def summarize_trip(trip):
+    """Estadísticas del viaje calculadas directamente sobre las columnas del buffer"""
+    points = trip["points"]
+    rpm = points.stats('RPM', nonzero=True)
+    load = points.stats('ENGINE_LOAD', nonzero=True)
+    maf = points.stats('MAF', nonzero=True)
+    temp = points.stats('COOLANT_TEMP', nonzero=True)
+
+    return {
+        "rpm_avg": round(rpm["mean"]) if rpm["count"] else 0,
+        "rpm_max": round(rpm["max"]) if rpm["count"] else 0,
+        "load_avg": round(load["mean"]) if load["count"] else 0,
+        "maf_avg": round(maf["mean"], 2) if maf["count"] else 0,
+        "temp_max": round(temp["max"]) if temp["count"] else 0,
+        "distance": round(trip["distance_km"], 2),
+        "duration_min": round((trip["last_read_time"] - trip["start_time"]) / 60, 1)
+    }
+
+# =============================================================================
+# ANÁLISIS IA ASÍNCRONOS
+# =============================================================================
+
+def generate_ai_json(prompt):
+    """Llama a Gemini con el timeout de los trabajos y extrae el JSON de la respuesta"""
+    response = model.generate_content(prompt, request_options={"timeout": AI_JOB_TIMEOUT})
+    cleaned = response.text.strip().replace("```json", "").replace("```", "").strip()
+
+    json_match = re.search(r'\{[\s\S]*\}', cleaned)
+    if json_match:
+        return json.loads(json_match.group())
+    return json.loads(cleaned)
+
+def job_vehicle_id():
+    """Vehículo al que se asocia un análisis: el indicado en la petición o el activo"""
+    body = request.json or {}
+    return body.get("vehicle_id") or body.get("vehicleInfo", {}).get("id") or active_vehicle_id
+
+def enqueue_ai_job(job_type, fn):
+    """Encola un análisis y responde 202 con la URL para consultar su estado"""
+    try:
+        job_id = ai_jobs.submit(job_type, fn, vehicle_id=job_vehicle_id())
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202
+
+@app.route("/api/jobs/<job_id>", methods=["GET"])
+def get_job(job_id):
+    """Estado y resultado de un análisis IA (importaciones, copias e informes tienen su propia URL)"""
+    try:
+        job = ai_jobs.get(job_id)
+        if not job:
+            return jsonify({"error": "Trabajo no encontrado"}), 404
+        return jsonify({"success": True, "job": job})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/jobs", methods=["GET"])
+def list_jobs():
+    """Últimos análisis IA de un vehículo (?vehicle_id=&type=&limit=)"""
+    try:
+        vehicle_id = request.args.get("vehicle_id", type=int) or active_vehicle_id
+        if not vehicle_id:
+            return jsonify({"error": "vehicle_id requerido"}), 400
+        jobs = database.get_ai_jobs_for_vehicle(
+            vehicle_id,
+            job_type=request.args.get("type"),
+            limit=min(request.args.get("limit", 20, type=int), 100),
+            queue=ai_jobs.name
+        )
+        return jsonify({"success": True, "jobs": jobs, "queue": ai_jobs.get_stats()})
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/predictive_analysis", methods=["POST"])
 def predictive_analysis():
-    global model, trip_data
 
     if not model:
         return jsonify({"error": "IA no configurada"}), 500
 
     vehicle_info = request.json.get("vehicleInfo", {})
+    session = session_for_request()
+    if session is None:
+        return jsonify({"error": "No hay sesión de adquisición para ese vehículo"}), 404
+
+    with session.lock:
+        point_count = len(session.trip["points"])
+        stats = summarize_trip(session.trip) if point_count >= 20 else None
+        health = dict(session.health)
 
-    if not trip_data["points"] or len(trip_data["points"]) < 20:
+    if not stats:
         return jsonify({"error": "Datos insuficientes. Conduce al menos 2 minutos."}), 400
 
-    try:
-        points = trip_data["points"]
-
-        rpms = [p.get('RPM', 0) for p in points if p.get('RPM')]
-        loads = [p.get('ENGINE_LOAD', 0) for p in points if p.get('ENGINE_LOAD')]
-        mafs = [p.get('MAF', 0) for p in points if p.get('MAF')]
-        temps = [p.get('COOLANT_TEMP', 0) for p in points if p.get('COOLANT_TEMP')]
-
-        stats = {
-            "rpm_avg": round(statistics.mean(rpms)) if rpms else 0,
-            "rpm_max": round(max(rpms)) if rpms else 0,
-            "load_avg": round(statistics.mean(loads)) if loads else 0,
-            "maf_avg": round(statistics.mean(mafs), 2) if mafs else 0,
-            "temp_max": round(max(temps)) if temps else 0,
-            "distance": round(trip_data["distance_km"], 2),
-            "duration_min": round((trip_data["last_read_time"] - trip_data["start_time"]) / 60, 1)
-        }
+    # Huella resumida: viajes con estadísticas parecidas comparten respuesta
+    cache_key = {
+        "brand": vehicle_info.get('brand'),
+        "model": vehicle_info.get('model'),
+        "year": vehicle_info.get('year'),
+        "mileage_bucket": mileage_bucket(vehicle_info.get('mileage')),
+        "rpm_avg": round_to(stats['rpm_avg'], 100),
+        "rpm_max": round_to(stats['rpm_max'], 250),
+        "load_avg": round_to(stats['load_avg'], 5),
+        "maf_avg": round_to(stats['maf_avg'], 2),
+        "temp_max": round_to(stats['temp_max'], 2),
+        "distance": round_to(stats['distance'], 5),
+        "duration_min": round_to(stats['duration_min'], 10)
+    }
+    cached = ai_cache.get('predictive_analysis', cache_key)
+    if cached is not None:
+        cached["trip_stats"] = stats
+        cached["vehicle_health"] = health
+        return jsonify(cached)
 
-        prompt = f"""Eres ingeniero de diagnóstico vehicular especializado en MANTENIMIENTO PREDICTIVO.
+    prompt = f"""Eres ingeniero de diagnóstico vehicular especializado en MANTENIMIENTO PREDICTIVO.
 
 VEHÍCULO: {vehicle_info.get('brand', 'N/D')} {vehicle_info.get('model', 'N/D')} ({vehicle_info.get('year', 'N/D')})
 KILOMETRAJE: {vehicle_info.get('mileage', 'N/D')} km
@@ -909,24 +1671,20 @@ JSON VÁLIDO:
     }}
 }}"""
 
-        response = model.generate_content(prompt)
-        cleaned = response.text.strip().replace("```json", "").replace("```", "").strip()
-
-        json_match = re.search(r'\{[\s\S]*\}', cleaned)
-        if json_match:
-            ai_analysis = json.loads(json_match.group())
-        else:
-            ai_analysis = json.loads(cleaned)
+    def run():
+        try:
+            ai_analysis = generate_ai_json(prompt)
+        except Exception as e:
+            print(f"[PREDICTIVE] Error: {e}")
+            traceback.print_exc()
+            raise
 
+        ai_cache.put('predictive_analysis', cache_key, ai_analysis)
         ai_analysis["trip_stats"] = stats
-        ai_analysis["vehicle_health"] = vehicle_health
+        ai_analysis["vehicle_health"] = health
+        return ai_analysis
 
-        return jsonify(ai_analysis)
-
-    except Exception as e:
-        print(f"[PREDICTIVE] Error: {e}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
+    return enqueue_ai_job('predictive_analysis', run)
 
 @app.route("/get_common_failures", methods=["POST"])
 def get_common_failures():
@@ -975,6 +1733,11 @@ Responde SOLO con JSON válido:
     "recommendation": "Consejo general de mantenimiento preventivo para este modelo"
 }}"""
 
+    cache_key = {"brand": brand, "model": model_year, "year": year}
+    cached = ai_cache.get('common_failures', cache_key)
+    if cached is not None:
+        return jsonify(cached)
+
     try:
         response = model.generate_content(prompt)
         cleaned_response = response.text.strip().replace("```json", "").replace("```", "").strip()
@@ -985,6 +1748,7 @@ Responde SOLO con JSON válido:
         else:
             failures_data = json.loads(cleaned_response)
 
+        ai_cache.put('common_failures', cache_key, failures_data)
         return jsonify(failures_data)
     except Exception as e:
         print(f"[FAILURES] Error: {e}")
@@ -1005,16 +1769,15 @@ def get_vehicle_valuation():
     if not all([brand, model_year, year, mileage]):
         return jsonify({"error": "Todos los datos requeridos."}), 400
 
-    trip_history = get_trip_history()
+    vehicle_id = job_vehicle_id()
+    trip_totals = database.get_trip_totals(vehicle_id) if vehicle_id else None
     driving_style_summary = "Sin datos"
     driving_quality_score = 5
 
-    if trip_history and len(trip_history) > 0:
-        total_km = sum(t.get('distancia_km', 0) for t in trip_history)
-
-        if total_km > 1:
+    if trip_totals and trip_totals['trip_count'] > 0:
+        if trip_totals['total_km'] > 1:
             driving_quality_score = 8
-            driving_style_summary = f"Conducción registrada: {len(trip_history)} viajes"
+            driving_style_summary = f"Conducción registrada: {trip_totals['trip_count']} viajes"
 
     maintenance_history = request.json.get("maintenanceHistory", [])
     maintenance_score = 5
@@ -1030,10 +1793,22 @@ def get_vehicle_valuation():
         else:
             maintenance_score = 6
 
+    cache_key = {
+        "brand": brand,
+        "model": model_year,
+        "year": year,
+        "fuel_type": v.get('type', 'gasolina'),
+        "mileage_bucket": mileage_bucket(mileage),
+        "driving_quality_score": driving_quality_score,
+        "maintenance_score": maintenance_score
+    }
+    cached = ai_cache.get('vehicle_valuation', cache_key)
+    if cached is not None:
+        return jsonify(cached)
+
     print(f"[VALUATION] Tasando {brand} {model_year} {year}")
 
-    try:
-        prompt = f"""Eres tasador profesional de vehículos segunda mano en España con 20 años experiencia.
+    prompt = f"""Eres tasador profesional de vehículos segunda mano en España con 20 años experiencia.
 
 VEHÍCULO: {brand} {model_year} - Año {year} - {mileage} km - {v.get('type', 'gasolina')}
 
@@ -1051,26 +1826,27 @@ Responde SOLO con JSON válido:
     "justification": "Explicación detallada de 2-3 líneas sobre la valoración"
 }}"""
 
-        response = model.generate_content(prompt)
-        cleaned_response = response.text.strip().replace("```json", "").replace("```", "").strip()
-
-        json_match = re.search(r'\{[\s\S]*\}', cleaned_response)
-        if json_match:
-            valuation_data = json.loads(json_match.group())
-        else:
-            valuation_data = json.loads(cleaned_response)
-
-        valuation_data["min_price"] = int(valuation_data["min_price"])
-        valuation_data["max_price"] = int(valuation_data["max_price"])
-        valuation_data["realistic_price"] = int(valuation_data["realistic_price"])
+    def run():
+        try:
+            valuation_data = generate_ai_json(prompt)
+            valuation_data["min_price"] = int(valuation_data["min_price"])
+            valuation_data["max_price"] = int(valuation_data["max_price"])
+            valuation_data["realistic_price"] = int(valuation_data["realistic_price"])
+        except Exception as e:
+            print(f"[VALUATION] Error: {e}")
+            traceback.print_exc()
+            raise
 
+        ai_cache.put('vehicle_valuation', cache_key, valuation_data)
         print(f"[VALUATION] ✓ {valuation_data['realistic_price']}€")
-        return jsonify(valuation_data)
+        return valuation_data
 
-    except Exception as e:
-        print(f"[VALUATION] Error: {e}")
-        traceback.print_exc()
-        return jsonify({"error": f"Error: {e}"}), 500
+    return enqueue_ai_job('vehicle_valuation', run)
+
+@app.route("/api/ai_cache/stats", methods=["GET"])
+def get_ai_cache_stats():
+    """Aciertos/fallos de la caché de respuestas de la IA"""
+    return jsonify({"success": True, "stats": ai_cache.get_stats()})
 
 @app.route("/upload_csv", methods=["POST"])
 def upload_csv():
@@ -1088,6 +1864,11 @@ def upload_csv():
         filepath = os.path.join(app.config['UPLOAD_FOLDER'], new_filename)
         file.save(filepath)
 
+        # Con vehicle_id el fichero se importa además en telemetry_data
+        vehicle_id = request.form.get('vehicle_id', type=int)
+        if vehicle_id is not None:
+            return enqueue_csv_import(vehicle_id, new_filename)
+
         return jsonify({
             "success": True,
             "filename": new_filename
@@ -1095,6 +1876,119 @@ def upload_csv():
 
     return jsonify({"error": "Tipo no permitido"}), 400
 
+def enqueue_csv_import(vehicle_id, filename, column_map=None, assume_utc=False):
+    """Encola la importación de un CSV subido y responde 202 con su job_id"""
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+    if not os.path.exists(filepath):
+        return jsonify({"error": "Archivo no encontrado"}), 404
+    if not database.get_vehicle_by_id(vehicle_id):
+        return jsonify({"error": "Vehículo no encontrado"}), 404
+
+    state = {"status": "queued", "vehicle_id": vehicle_id}
+
+    def progress(update):
+        state.update(update, status="running")
+        live_broadcaster.publish("import", {"vehicle_id": vehicle_id, "filename": filename, **update})
+
+    def run():
+        return csv_import.import_csv(filepath, vehicle_id, column_map, assume_utc, progress=progress)
+
+    # El progreso se registra antes de encolar: un CSV pequeño puede terminar enseguida
+    job_id = uuid.uuid4().hex
+    import_progress[job_id] = state
+    try:
+        import_jobs.submit('csv_import', run, vehicle_id=vehicle_id, job_id=job_id)
+    except JobQueueFull as e:
+        import_progress.pop(job_id, None)
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({
+        "success": True,
+        "filename": filename,
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/imports/{job_id}"
+    }), 202
+
+@app.route("/api/vehicles/<int:vehicle_id>/import_csv", methods=["POST"])
+def import_csv_api(vehicle_id):
+    """Importa en telemetry_data un CSV ya subido a uploaded_csv/
+
+    Cuerpo: {"filename": ..., "column_map": {"columna_csv": "campo"}, "assume_utc": false}.
+    Sin column_map se espera el formato del registro CSV (csv_logger).
+    """
+    data = request.get_json(silent=True) or {}
+    filename = data.get("filename")
+    if not filename:
+        return jsonify({"error": "filename requerido"}), 400
+
+    column_map = data.get("column_map")
+    if column_map is not None and not isinstance(column_map, dict):
+        return jsonify({"error": "column_map debe ser un objeto"}), 400
+
+    return enqueue_csv_import(vehicle_id, filename, column_map, bool(data.get("assume_utc")))
+
+@app.route("/api/imports/<job_id>", methods=["GET"])
+def get_import(job_id):
+    """Estado de una importación de CSV (progreso en curso o resumen final)"""
+    try:
+        job = import_jobs.get(job_id)
+        if not job or job["job_type"] != 'csv_import':
+            return jsonify({"error": "Importación no encontrada"}), 404
+        return jsonify({"success": True, "job": job, "progress": import_progress.get(job_id)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/vehicles/<int:vehicle_id>/offline_analysis", methods=["POST"])
+def offline_health_analysis(vehicle_id):
+    """Re-puntúa la salud sobre telemetría guardada o un CSV subido
+
+    Cuerpo: {"group_by": "trip" | "window" | "all", "window_hours": 24,
+    "from": ..., "to": ..., "filename": ...}. Con filename se analiza ese CSV de
+    uploaded_csv/ sin importarlo; sin él, la telemetría del vehículo. Los
+    resultados tienen el formato de ai_analysis y no se guardan.
+    """
+    try:
+        if not database.get_vehicle_by_id(vehicle_id):
+            return jsonify({"error": "Vehículo no encontrado"}), 404
+
+        data = request.get_json(silent=True) or {}
+        options = {
+            "group_by": data.get("group_by", "trip"),
+            "window_seconds": float(data.get("window_hours", 24)) * 3600,
+            "gap_seconds": float(data.get("gap_minutes", offline_analysis.TRIP_GAP_SECONDS / 60)) * 60
+        }
+        if options["group_by"] not in offline_analysis.GROUP_MODES:
+            return jsonify({"error": f"group_by no válido: {options['group_by']}"}), 400
+        if options["window_seconds"] <= 0 or options["gap_seconds"] <= 0:
+            return jsonify({"error": "window_hours y gap_minutes deben ser positivos"}), 400
+
+        started = time.time()
+        filename = data.get("filename")
+        if filename:
+            filepath = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(filename))
+            if not os.path.exists(filepath):
+                return jsonify({"error": "Archivo no encontrado"}), 404
+            results, rows = offline_analysis.analyze_csv(
+                filepath, data.get("column_map"), bool(data.get("assume_utc")), **options)
+        else:
+            results, rows = offline_analysis.analyze_vehicle(
+                vehicle_id, parse_time_param(data.get("from")), parse_time_param(data.get("to")), **options)
+
+        return jsonify({
+            "success": True,
+            "vehicle_id": vehicle_id,
+            "group_by": options["group_by"],
+            "rows": rows,
+            "seconds": round(time.time() - started, 2),
+            "results": results
+        })
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"[OFFLINE] Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/list_uploaded_csvs", methods=["GET"])
 def list_uploaded_csvs():
     try:
@@ -1115,84 +2009,288 @@ def list_uploaded_csvs():
 
 @app.route("/download_current_csv", methods=["GET"])
 def download_current_csv():
-    if os.path.exists(CSV_FILENAME):
+    """CSV del día en curso de un vehículo (?vehicle_id=, por defecto el activo)"""
+    vehicle_id = request.args.get("vehicle_id", type=int) or primary_session.vehicle_id
+    path = csv_logger.current_file(vehicle_id)
+    if path is None:
+        # Sin lecturas desde el arranque: el segmento más reciente guardado
+        files = csv_logger.list_files(vehicle_id)
+        if files:
+            path = os.path.join(CSV_FOLDER, max(files, key=lambda f: f["modified"])["path"])
+
+    if path and os.path.exists(path):
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        extension = '.csv.gz' if path.endswith('.gz') else '.csv'
         return send_file(
-            CSV_FILENAME,
+            path,
             as_attachment=True,
-            download_name=f'sentinel_data_{timestamp}.csv'
+            download_name=f'sentinel_data_{timestamp}{extension}'
         )
     return jsonify({"error": "No hay datos"}), 404
 
+@app.route("/api/csv_logs", methods=["GET"])
+def list_csv_logs():
+    """Segmentos del registro CSV (todos o los de ?vehicle_id=)"""
+    try:
+        files = csv_logger.list_files(request.args.get("vehicle_id", type=int))
+        return jsonify({"success": True, "files": files})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/csv_logs/<path:name>", methods=["GET"])
+def download_csv_log(name):
+    """Descarga un segmento concreto (ruta relativa devuelta por /api/csv_logs)"""
+    csv_logger.flush()
+    return send_from_directory(CSV_FOLDER, name, as_attachment=True)
+
+def live_health(vehicle_id):
+    """Salud en vivo de un vehículo con una sesión conectada y ya analizada (o None)"""
+    session = sessions.find_vehicle(vehicle_id)
+    if session is None or not session.is_connected():
+        return None
+    with session.lock:
+        return dict(session.health) if session.health["last_update"] else None
+
 @app.route("/generate_report", methods=["POST"])
 def generate_report():
-    vehicle_info = request.json.get("vehicleInfo", {})
-    health_data = vehicle_health
-    maintenance = request.json.get("maintenanceHistory", [])
-
-    pdf = FPDF()
-    pdf.add_page()
-
-    pdf.set_font("Arial", 'B', 20)
-    pdf.cell(0, 10, 'SENTINEL PRO - Informe Diagnostico', 0, 1, 'C')
-    pdf.set_font("Arial", '', 11)
-    pdf.cell(0, 10, f"{vehicle_info.get('brand', 'N/D')} {vehicle_info.get('model', 'N/D')} - {vehicle_info.get('year', 'N/D')}", 0, 1, 'C')
-    pdf.cell(0, 5, f"Fecha: {datetime.now().strftime('%d/%m/%Y %H:%M')}", 0, 1, 'C')
-    pdf.ln(10)
-
-    pdf.set_font("Arial", 'B', 16)
-    pdf.cell(0, 10, f"Puntuacion Salud: {health_data['overall_score']}/100", 0, 1, 'L')
-    pdf.ln(5)
-
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, 'Sistemas:', 0, 1, 'L')
-    pdf.set_font("Arial", '', 10)
-    pdf.cell(0, 6, f"- Motor: {health_data['engine_health']}/100", 0, 1)
-    pdf.cell(0, 6, f"- Termica: {health_data['thermal_health']}/100", 0, 1)
-    pdf.cell(0, 6, f"- Eficiencia: {health_data['efficiency_health']}/100", 0, 1)
-    pdf.ln(5)
-
-    if health_data['warnings']:
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(0, 10, 'Advertencias:', 0, 1, 'L')
-        pdf.set_font("Arial", '', 9)
-        for w in health_data['warnings']:
-            pdf.multi_cell(0, 5, f"- {w}")
-
-    if health_data['predictions']:
-        pdf.ln(5)
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(0, 10, 'Predicciones:', 0, 1, 'L')
-        pdf.set_font("Arial", '', 9)
-        for p in health_data['predictions']:
-            pdf.multi_cell(0, 5, f"- {p}")
-
-    if maintenance:
-        pdf.ln(5)
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(0, 10, 'Mantenimiento:', 0, 1, 'L')
-        pdf.set_font("Arial", '', 9)
-        for m in maintenance[:10]:
-            pdf.cell(0, 5, f"- {m.get('date', 'N/D')}: {m.get('type', 'N/D')}", 0, 1)
+    """Informe PDF del vehículo, generado en memoria (y cacheado) fuera del hilo de la petición
+
+    La salud es la de la sesión de ese vehículo si está conectada; si no, la
+    de su último análisis guardado (nunca la de otro vehículo conectado).
+    """
+    try:
+        body = request.json or {}
+        vehicle_info = body.get("vehicleInfo", {})
+        vehicle_id = vehicle_info.get('id') or active_vehicle_id
+        if vehicle_id:
+            vehicle_id = int(vehicle_id)
+            health_data = live_health(vehicle_id) or latest_health(vehicle_id)
+        else:
+            with primary_session.lock:
+                health_data = dict(primary_session.health)
+
+        report = build_report(vehicle_info, health_data, body.get("maintenanceHistory", []),
+                              vehicle_id, REPORT_TREND_DAYS)
+        pdf, fingerprint, cached = report_renderer.render(report)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except FuturesTimeoutError:
+        return jsonify({"error": f"El informe tarda más de {REPORT_TIMEOUT}s en generarse"}), 504
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
     filename = f"sentinel_pro_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    pdf.output(filename)
-    return send_file(filename, as_attachment=True)
+    response = Response(pdf, mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Report-Cache'] = 'hit' if cached else 'miss'
+    response.headers['ETag'] = f'"{fingerprint}"'
+    return response
+
+@app.route("/api/reports/stats", methods=["GET"])
+def report_stats():
+    """Estadísticas de la caché y del generador de informes PDF"""
+    return jsonify({"success": True, "stats": report_renderer.get_stats()})
+
+# =============================================================================
+# ENDPOINTS - INFORMES DE FLOTA POR LOTES
+# =============================================================================
+
+@app.route("/api/report_batches", methods=["POST"])
+def create_report_batch():
+    """Encola informes PDF de varios vehículos generados en paralelo
+
+    Cuerpo: {"vehicle_ids": [1, 2, ...], "trend_days": 30}. Sin vehicle_ids se
+    incluyen todos los vehículos. Responde 202 con la URL del progreso; al
+    terminar hay un PDF por vehículo y un ZIP con todos.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        vehicle_ids = data.get("vehicle_ids")
+        if vehicle_ids is None:
+            vehicle_ids = [vehicle['id'] for vehicle in database.get_all_vehicles()]
+        if not isinstance(vehicle_ids, list) or not all(isinstance(v, int) for v in vehicle_ids):
+            return jsonify({"error": "vehicle_ids debe ser una lista de enteros"}), 400
+        vehicle_ids = list(dict.fromkeys(vehicle_ids))
+        if not vehicle_ids:
+            return jsonify({"error": "No hay vehículos para el informe"}), 400
+        trend_days = int(data.get("trend_days", REPORT_TREND_DAYS))
+        if trend_days < 0:
+            raise ValueError("trend_days no puede ser negativo")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+    job_id = uuid.uuid4().hex
+    state = {"status": "queued", "done": 0, "failed": 0, "total": len(vehicle_ids)}
+
+    def progress(update):
+        state.update(update, status="running")
+        live_broadcaster.publish("report_batch", {"job_id": job_id, **update})
+
+    def run():
+        result = fleet_reports.generate_batch(
+            os.path.join(REPORT_BATCH_FOLDER, job_id), vehicle_ids, trend_days,
+            max_workers=REPORT_BATCH_WORKERS, health_for=live_health, progress=progress)
+        for pruned in fleet_reports.prune_batches(REPORT_BATCH_FOLDER, REPORT_BATCH_KEEP):
+            report_progress.pop(pruned, None)
+        return result
+
+    report_progress[job_id] = state
+    try:
+        report_jobs.submit('report_batch', run, job_id=job_id)
+    except JobQueueFull as e:
+        report_progress.pop(job_id, None)
+        return jsonify({"error": str(e)}), 503
+    except Exception as e:
+        report_progress.pop(job_id, None)
+        return jsonify({"error": str(e)}), 500
+
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "vehicles": len(vehicle_ids),
+        "status_url": f"/api/report_batches/{job_id}"
+    }), 202
+
+@app.route("/api/report_batches/<job_id>", methods=["GET"])
+def get_report_batch(job_id):
+    """Progreso de un lote de informes y, al terminar, sus enlaces de descarga"""
+    try:
+        job = report_jobs.get(job_id)
+        if not job or job["job_type"] != 'report_batch':
+            return jsonify({"error": "Lote no encontrado"}), 404
+
+        result = job["result"]
+        if result and os.path.isdir(os.path.join(REPORT_BATCH_FOLDER, job_id)):
+            for item in result["reports"]:
+                if "file" in item:
+                    item["url"] = f"/api/report_batches/{job_id}/{item['file']}"
+            if result["zip"]:
+                result["zip_url"] = f"/api/report_batches/{job_id}/{result['zip']}"
+        return jsonify({"success": True, "job": job, "progress": report_progress.get(job_id)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/report_batches/<job_id>/<name>", methods=["GET"])
+def download_report_batch_file(job_id, name):
+    """Descarga el ZIP de un lote o el PDF de uno de sus vehículos"""
+    batch_dir = os.path.join(REPORT_BATCH_FOLDER, secure_filename(job_id))
+    if not fleet_reports.is_batch_file(name) or not os.path.exists(os.path.join(batch_dir, name)):
+        return jsonify({"error": "Informe no encontrado"}), 404
+    return send_from_directory(os.path.abspath(batch_dir), name, as_attachment=True)
 
 # =============================================================================
 # ENDPOINT DE BACKUP DE BASE DE DATOS
 # =============================================================================
 
+def backup_response(path, compress, mode):
+    """Envía una copia guardada en streaming (gzip al vuelo si se pide)"""
+    filename = os.path.basename(path)
+    if filename.endswith('.gz') and not compress:
+        filename = filename[:-len('.gz')]
+    elif compress and not filename.endswith('.gz'):
+        filename += '.gz'
+
+    response = Response(stream_with_context(backups.stream(path, compress)),
+                        mimetype='application/gzip' if compress else 'application/octet-stream')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['X-Backup-Mode'] = mode
+    return response
+
+def enqueue_backup(mode, compress=False):
+    """Encola una copia de seguridad y responde 202 con la URL de su estado"""
+    if mode not in ('full', 'incremental'):
+        return jsonify({"error": "Modo no válido (full o incremental)"}), 400
+
+    state = {"status": "queued", "mode": mode, "pages_copied": 0, "pages_total": None}
+
+    def progress(copied, total):
+        state.update(status="running", pages_copied=copied, pages_total=total)
+
+    def run():
+        info = backups.create(incremental=mode == 'incremental', progress=progress)
+        if info.get("delta"):
+            info["download_url"] = f"/api/backups/{info['delta']}"
+        else:
+            info["download_url"] = f"/api/backups/{info['snapshot']}?compress={int(compress)}"
+        return info
+
+    job_id = uuid.uuid4().hex
+    backup_progress[job_id] = state
+    try:
+        backup_jobs.submit('backup', run, job_id=job_id)
+    except JobQueueFull as e:
+        backup_progress.pop(job_id, None)
+        return jsonify({"error": str(e)}), 503
+
+    return jsonify({
+        "success": True,
+        "job_id": job_id,
+        "status": "queued",
+        "mode": mode,
+        "status_url": f"/api/backups/jobs/{job_id}"
+    }), 202
+
 @app.route("/api/backup/database", methods=["GET"])
 def backup_database_endpoint():
-    """Descargar backup de la base de datos"""
+    """Copia de seguridad de la base de datos
+
+    Encola una instantánea en caliente y responde 202 con la URL de su estado;
+    al terminar, el estado incluye download_url. ?mode=incremental genera
+    además un delta con solo las páginas cambiadas desde la instantánea
+    anterior (es lo que se descarga); ?compress=1 descarga la completa con gzip.
+    """
     try:
-        backup_path = database.backup_database()
-        return send_file(backup_path, as_attachment=True)
+        return enqueue_backup(request.args.get('mode', 'full'),
+                              request.args.get('compress', '0') in ('1', 'true'))
     except Exception as e:
         print(f"[BACKUP] Error: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/backups", methods=["GET"])
+def list_backups():
+    """Instantáneas y deltas guardados en el servidor"""
+    try:
+        return jsonify({"success": True, "backups": backups.list_backups(), "stats": backups.get_stats()})
+    except Exception as e:
+        print(f"[BACKUP] Error listando copias: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/backups", methods=["POST"])
+def create_backup():
+    """Encola una instantánea local ({"mode": "full" | "incremental"}); responde 202"""
+    try:
+        mode = (request.json or {}).get('mode', 'full') if request.is_json else 'full'
+        return enqueue_backup(mode)
+    except Exception as e:
+        print(f"[BACKUP] Error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/backups/jobs/<job_id>", methods=["GET"])
+def get_backup_job(job_id):
+    """Estado de una copia de seguridad (páginas copiadas o resumen con download_url)"""
+    try:
+        job = backup_jobs.get(job_id)
+        if not job or job["job_type"] != 'backup':
+            return jsonify({"error": "Copia no encontrada"}), 404
+        return jsonify({"success": True, "job": job, "progress": backup_progress.get(job_id)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/backups/<name>", methods=["GET"])
+def download_backup(name):
+    """Descarga una copia guardada (tal cual está almacenada, o ?compress=0|1)"""
+    path = backups.path_for(name)
+    if path is None:
+        return jsonify({"error": "Copia no encontrada"}), 404
+    if name.endswith('.delta.gz'):
+        return backup_response(path, True, 'incremental')
+    compress = request.args.get('compress')
+    compress = name.endswith('.gz') if compress is None else compress in ('1', 'true')
+    return backup_response(path, compress, 'full')
+
 # =============================================================================
 # ENDPOINTS COMPATIBLES CON FRONTEND ANTIGUO (SIN /api/)
 # =============================================================================
@@ -1283,7 +2381,6 @@ def update_vehicle_legacy():
 @app.route('/delete_vehicle', methods=['POST'])
 def delete_vehicle_legacy():
     """Eliminar un vehículo (compatible con frontend antiguo)"""
-    global active_vehicle_id
 
     try:
         data = request.json
@@ -1294,7 +2391,8 @@ def delete_vehicle_legacy():
 
         # Si es el vehículo activo, deseleccionarlo
         if active_vehicle_id == vehicle_id:
-            active_vehicle_id = None
+            set_active_vehicle_id(None)
+        close_vehicle_session(vehicle_id)
 
         success = database.delete_vehicle(vehicle_id)
 
@@ -1312,7 +2410,6 @@ def delete_vehicle_legacy():
 @app.route('/activate_vehicle', methods=['POST'])
 def activate_vehicle_legacy():
     """Activar un vehículo (compatible con frontend antiguo)"""
-    global active_vehicle_id
 
     try:
         data = request.json
@@ -1327,10 +2424,11 @@ def activate_vehicle_legacy():
         if not vehicle:
             return jsonify({'success': False, 'error': 'Vehículo no encontrado'}), 404
 
-        active_vehicle_id = vehicle_id
-
-        # Resetear datos de viaje al cambiar de vehículo
-        reset_trip()
+        # Asignar a la sesión principal (solo se reinicia su viaje)
+        try:
+            set_active_vehicle_id(vehicle_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 409
 
         print(f"[VEHICLES] Vehículo activo: {vehicle['brand']} {vehicle['model']}")
 
@@ -1345,7 +2443,6 @@ def activate_vehicle_legacy():
 @app.route('/set_active_vehicle', methods=['POST'])
 def set_active_vehicle():
     """Activar un vehículo específico (alias de activate_vehicle)"""
-    global active_vehicle_id
 
     try:
         data = request.json
@@ -1378,10 +2475,11 @@ def set_active_vehicle():
         except Exception as db_error:
             print(f"[VEHICLES] Error actualizando DB: {db_error}")
 
-        active_vehicle_id = vehicle_id
-
-        # Resetear datos de viaje al cambiar de vehículo
-        reset_trip()
+        # Asignar a la sesión principal (solo se reinicia su viaje)
+        try:
+            set_active_vehicle_id(vehicle_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 409
 
         print(f"[VEHICLES] ✓ Vehículo activado: {vehicle['brand']} {vehicle['model']}")
 
@@ -1404,7 +2502,6 @@ def set_active_vehicle():
 @app.route('/get_active_vehicle', methods=['GET'])
 def get_active_vehicle_legacy():
     """Obtener el vehículo activo (compatible con frontend antiguo)"""
-    global active_vehicle_id
 
     if active_vehicle_id is None:
         return jsonify({
@@ -1416,7 +2513,7 @@ def get_active_vehicle_legacy():
         vehicle = database.get_vehicle_by_id(active_vehicle_id)
 
         if not vehicle:
-            active_vehicle_id = None
+            set_active_vehicle_id(None)
             return jsonify({
                 'success': False,
                 'message': 'Vehículo activo no encontrado'
@@ -1455,40 +2552,15 @@ def get_vehicle_by_id_legacy(vehicle_id):
 def get_fleet_stats():
     """Obtener estadísticas de la flota completa"""
     try:
-        vehicles = database.get_all_vehicles()
-        total_vehicles = len(vehicles)
-        total_km = sum(v.get('mileage', 0) for v in vehicles)
-
-        # Contar vehículos conectados hoy (aquellos con last_connection en las últimas 24h)
-        connected_today = 0
-        vehicles_with_warnings = 0
-
-        from datetime import datetime, timedelta
-        now = datetime.now()
-        yesterday = now - timedelta(days=1)
-
-        for v in vehicles:
-            # Verificar conexión reciente
-            if v.get('last_connection'):
-                try:
-                    last_conn = datetime.fromisoformat(v['last_connection'])
-                    if last_conn > yesterday:
-                        connected_today += 1
-                except:
-                    pass
-
-            # Contar vehículos con advertencias (por ahora basado en análisis de salud)
-            # Esto es una aproximación - puedes mejorarlo con datos reales
-            if v.get('mileage', 0) > 200000:  # Ejemplo: alta kilometraje
-                vehicles_with_warnings += 1
+        summary = database.get_fleet_stats()
 
         return jsonify({
             'success': True,
             'stats': {
-                'total_vehicles': total_vehicles,
-                'total_kilometers': total_km,
-                'connected_today': connected_today,
-                'vehicles_with_warnings': vehicles_with_warnings
+                'total_vehicles': summary['total_vehicles'],
+                'total_kilometers': summary['total_km'],
+                'connected_today': summary['connected_today'],
+                'vehicles_with_warnings': summary['vehicles_with_warnings']
             }
         })
     except Exception as e:
@@ -1574,7 +2646,8 @@ if __name__ == "__main__":
     print("  ✓ Gestión de múltiples vehículos")
     print("  ✓ Base de datos SQLite persistente")
     print("  ✓ Historial completo por vehículo")
-    print("  ✓ Datos críticos cada 3s: RPM, velocidad, acelerador, carga, MAF")
+    print(f"  ✓ Worker de adquisición en segundo plano cada {ACQUISITION_INTERVAL}s")
+    print("  ✓ Datos críticos: RPM, velocidad, acelerador, carga, MAF")
     print("  ✓ Datos térmicos cada 60s: temperaturas refrigerante/admisión")
     print("  ✓ Cálculo preciso de distancia por integración")
     print("  ✓ Análisis salud automático cada 90s")
@@ -1604,18 +2677,44 @@ if __name__ == "__main__":
     print("\n  📊 Telemetría OBD-II:")
     print("     - GET  /get_live_data            → Datos en tiempo real")
     print("     - GET  /get_vehicle_health       → Salud del vehículo")
+    print("     - GET  /api/sessions             → Sesiones de adquisición")
+    print("     - POST /api/sessions             → Abrir sesión en otro adaptador")
+    print("     - GET  /stream/live              → Stream SSE en vivo (live + health)")
+    print("     - GET  /api/obd/stats            → Peticiones al adaptador (multi-PID, planificador)")
+    print("     - GET  /api/telemetry/<id>/history → Historial agregado (from, to)")
+    print("     - GET  /api/telemetry/<id>/page   → Página por cursor (after_id / before_ts_ms, from, to)")
+    print("     - GET  /api/telemetry/<id>/stream → Exportación en streaming (ndjson/json)")
+    print("     - GET  /api/vehicles/<id>/export → Exportación CSV / CSV.gz / ZIP")
+    print("     - GET  /api/telemetry/writer/stats → Estado del escritor de telemetría")
+    print("     - GET  /api/retention            → Retención de telemetría y tamaño de la base")
+    print("     - GET  /api/backups              → Copias de seguridad guardadas")
+    print("     - POST /api/backups              → Nueva copia (asíncrona, 202 + job_id)")
+    print("     - GET  /api/backups/jobs/<job_id> → Progreso y enlace de descarga de una copia")
+    print("     - GET  /api/trips/<id>           → Viajes terminados y totales")
     print("\n  🤖 Análisis IA:")
-    print("     - POST /predictive_analysis      → Predicción mantenimiento")
+    print("     - POST /predictive_analysis      → Predicción mantenimiento (asíncrono, 202 + job_id)")
     print("     - POST /get_common_failures      → Averías comunes")
-    print("     - POST /get_vehicle_valuation    → Tasación vehículo")
+    print("     - POST /get_vehicle_valuation    → Tasación vehículo (asíncrono, 202 + job_id)")
+    print("     - GET  /api/jobs/<job_id>        → Estado/resultado de un análisis")
+    print("     - GET  /api/jobs?vehicle_id=     → Últimos análisis de un vehículo")
+    print("     - GET  /api/ai_cache/stats       → Estadísticas de la caché IA")
     print("\n  📁 Archivos CSV:")
     print("     - POST /upload_csv               → Subir CSV")
     print("     - GET  /download_current_csv     → Descargar CSV")
     print("     - GET  /list_uploaded_csvs       → Listar archivos")
+    print("     - GET  /api/csv_logs             → Segmentos del registro CSV")
+    print("     - POST /api/vehicles/<id>/import_csv → Importar CSV a telemetría")
+    print("     - GET  /api/imports/<job_id>     → Progreso de importación")
+    print("     - POST /api/vehicles/<id>/offline_analysis → Salud sobre histórico o CSV")
     print("\n  📋 Reportes:")
     print("     - POST /generate_report          → Generar PDF")
+    print("     - GET  /api/reports/stats        → Caché de informes PDF")
+    print("     - POST /api/report_batches       → Informes de flota en paralelo (ZIP)")
+    print("     - GET  /api/report_batches/<id>  → Progreso y descargas del lote")
 
-    initialize_obd_connection(force_reconnect=True)
+    initialize_storage()
+    initialize_obd_connection(primary_session, force_reconnect=True)
+    start_background_services()
     print("\n" + "=" * 70)
     print("✓ Servidor ACTIVO en http://localhost:5000")
     print("=" * 70)
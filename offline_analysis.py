@@ -0,0 +1,208 @@
+# =============================================================================
+# SENTINEL PRO - ANÁLISIS DE SALUD OFFLINE (VECTORIZADO)
+# Re-puntúa telemetría grabada o CSVs subidos por viaje o ventana con NumPy
+# =============================================================================
+
+import csv
+import itertools
+import time
+from datetime import datetime, timezone
+from fractions import Fraction
+
+import numpy as np
+
+import csv_import
+import database
+from health_analyzer import HealthAnalyzer
+
+# Columnas de cada bloque (mismo orden que database.iter_telemetry_chunks)
+EPOCH, RPM, SPEED, THROTTLE, LOAD, COOLANT, INTAKE, MAF = range(8)
+
+CHUNK_SIZE = 50000
+TRIP_GAP_SECONDS = 300  # Hueco sin muestras que separa dos viajes
+GROUP_MODES = ('trip', 'window', 'all')
+
+def exact_sum(values):
+    """Suma exacta (Fraction) de un array de floats finitos, sin recorrerlo en Python
+
+    Cada valor es mantisa entera de 53 bits x 2^exponente: se suman las
+    mantisas de cada exponente con enteros (partidas en dos mitades de 26
+    bits para que int64 no desborde) y solo se combinan en Fraction los
+    pocos exponentes distintos. Coincide con sumar Fraction(v) uno a uno.
+    """
+    mantissas, exponents = np.frexp(values)
+    mantissas = (mantissas * 2.0 ** 53).astype(np.int64)
+    high, low = mantissas >> 26, mantissas & ((1 << 26) - 1)
+    total = Fraction(0)
+    for exponent in np.unique(exponents):
+        selected = exponents == exponent
+        mantissa_sum = (int(high[selected].sum()) << 26) + int(low[selected].sum())
+        total += mantissa_sum * Fraction(2) ** int(exponent - 53)
+    return total
+
+class ColumnAccumulator:
+    """
+    Acumulados de un grupo (viaje o ventana) para las reglas de HealthAnalyzer.
+
+    Cada bloque de filas se resume con operaciones vectoriales (filtros,
+    sumas exactas, máximos, diferencias de acelerador); evaluate() vuelca los
+    totales en un HealthAnalyzer con RunningStat.merge para aplicar
+    exactamente las mismas reglas, con las mismas medias.
+    """
+
+    # Atributo del analizador -> (columna, solo valores > 0)
+    STATS = {
+        'rpm': (RPM, True),
+        'load': (LOAD, False),
+        'maf': (MAF, True),
+        'coolant': (COOLANT, True),
+        'intake': (INTAKE, True)
+    }
+
+    def __init__(self, start):
+        self.start = start
+        self.end = start
+        self.samples = 0
+        self.stats = {name: [0, Fraction(0), None] for name in self.STATS}
+        self.high_rpm_count = 0
+        self.throttle_count = 0
+        self.harsh_accel_count = 0
+        self.last_throttle = None
+
+    def add(self, block):
+        """Incorpora un bloque (array filas x columnas, NaN = sin dato)"""
+        self.samples += len(block)
+        self.end = max(self.end, float(block[-1, EPOCH]))
+
+        for name, (column, positive) in self.STATS.items():
+            values = block[:, column]
+            values = values[values > 0] if positive else values[~np.isnan(values)]
+            if values.size:
+                stat = self.stats[name]
+                stat[0] += values.size
+                stat[1] += exact_sum(values)
+                peak = float(values.max())
+                stat[2] = peak if stat[2] is None else max(stat[2], peak)
+                if name == 'rpm':
+                    self.high_rpm_count += int(np.count_nonzero(values > HealthAnalyzer.HIGH_RPM_THRESHOLD))
+
+        throttle = block[:, THROTTLE]
+        throttle = throttle[~np.isnan(throttle)]
+        if throttle.size:
+            sequence = throttle if self.last_throttle is None else np.concatenate(([self.last_throttle], throttle))
+            self.harsh_accel_count += int(np.count_nonzero(np.diff(sequence) > HealthAnalyzer.HARSH_THROTTLE_DELTA))
+            self.throttle_count += throttle.size
+            self.last_throttle = float(throttle[-1])
+
+    def evaluate(self):
+        """Resultado de las reglas de salud, o None si hay pocas muestras"""
+        analyzer = HealthAnalyzer()
+        analyzer.sample_count = self.samples
+        if not analyzer.has_enough_data():
+            return None
+
+        for name, (count, total, peak) in self.stats.items():
+            getattr(analyzer, name).merge(count, total, peak)
+        analyzer.high_rpm_count = self.high_rpm_count
+        analyzer.throttle_count = self.throttle_count
+        analyzer.harsh_accel_count = self.harsh_accel_count
+        return analyzer.evaluate()
+
+def _iso(epoch):
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def analyze_chunks(chunks, group_by='trip', window_seconds=86400, gap_seconds=TRIP_GAP_SECONDS):
+    """
+    Evalúa la salud por grupos sobre bloques de filas en orden cronológico.
+
+    group_by: 'trip' (un viaje termina tras `gap_seconds` sin muestras),
+    'window' (ventanas fijas de `window_seconds`) o 'all' (un solo grupo).
+    Devuelve (resultados, filas leídas); cada resultado tiene el formato de
+    una fila de ai_analysis más el rango y el número de muestras del grupo.
+    """
+    if group_by not in GROUP_MODES:
+        raise ValueError(f"group_by debe ser uno de: {', '.join(GROUP_MODES)}")
+
+    groups = {}
+    rows = 0
+    trip_id = 0
+    last_epoch = None
+
+    for chunk in chunks:
+        block = np.array(chunk, dtype=np.float64)
+        if not len(block):
+            continue
+        rows += len(block)
+        epoch = block[:, EPOCH]
+
+        if group_by == 'trip':
+            previous = epoch[0] if last_epoch is None else last_epoch
+            gaps = np.diff(epoch, prepend=previous) > gap_seconds
+            keys = trip_id + np.cumsum(gaps)
+            trip_id = int(keys[-1])
+        elif group_by == 'window':
+            keys = (epoch // window_seconds).astype(np.int64)
+        else:
+            keys = np.zeros(len(block), dtype=np.int64)
+        last_epoch = epoch[-1]
+
+        # Los grupos son tramos contiguos: un add() vectorial por tramo
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        for start, end in zip(np.concatenate(([0], bounds)), np.concatenate((bounds, [len(block)]))):
+            key = int(keys[start])
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = ColumnAccumulator(float(epoch[start]))
+            group.add(block[start:end])
+
+    results = []
+    for key in sorted(groups):
+        group = groups[key]
+        health = group.evaluate()
+        if health is None:
+            continue
+        results.append({
+            "analysis_date": _iso(group.end),
+            "start": _iso(group.start),
+            "end": _iso(group.end),
+            "samples": group.samples,
+            "health_score": health["overall_score"],
+            "engine_health": health["engine_health"],
+            "thermal_health": health["thermal_health"],
+            "efficiency_health": health["efficiency_health"],
+            "predictions": health["predictions"],
+            "warnings": health["warnings"]
+        })
+    return results, rows
+
+def analyze_vehicle(vehicle_id, start_epoch=None, end_epoch=None, **options):
+    """Analiza la telemetría guardada de un vehículo (opcionalmente en un rango)"""
+    started = time.time()
+    chunks = database.iter_telemetry_chunks(vehicle_id, start_epoch, end_epoch, CHUNK_SIZE)
+    results, rows = analyze_chunks(chunks, **options)
+    print(f"[OFFLINE] {rows} filas analizadas en {time.time() - started:.2f}s ({len(results)} grupos)")
+    return results, rows
+
+def _csv_chunks(filepath, column_map=None, assume_utc=False):
+    """Bloques de un CSV en el formato de iter_telemetry_chunks"""
+    stats = {'read': 0, 'imported': 0, 'skipped': 0, 'invalid_values': 0}
+    with open(filepath, 'r', encoding='utf-8-sig', newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            raise ValueError("El CSV está vacío")
+        positions = csv_import.resolve_column_map(header, column_map)
+        rows = csv_import.iter_telemetry_rows(reader, None, positions, stats, assume_utc)
+
+        while True:
+            batch = list(itertools.islice(rows, CHUNK_SIZE))
+            if not batch:
+                break
+            yield [(row[1] / 1000,) + row[2:9] for row in batch]
+
+def analyze_csv(filepath, column_map=None, assume_utc=False, **options):
+    """Analiza un CSV subido sin importarlo (se asume orden cronológico)"""
+    started = time.time()
+    results, rows = analyze_chunks(_csv_chunks(filepath, column_map, assume_utc), **options)
+    print(f"[OFFLINE] {rows} filas de CSV analizadas en {time.time() - started:.2f}s ({len(results)} grupos)")
+    return results, rows
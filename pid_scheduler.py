@@ -0,0 +1,157 @@
+# =============================================================================
+# SENTINEL PRO - PLANIFICADOR DE PIDs OBD-II
+# Periodo y prioridad por PID, adaptado al estado de marcha y a la latencia real
+# =============================================================================
+
+import time
+
+# PIDs de modo 01 que no son medidas (mapas de soporte, estado de DTC...)
+NON_MEASUREMENT_PIDS = {'STATUS', 'FREEZE_DTC', 'STATUS_DRIVE_CYCLE', 'OBD_COMPLIANCE',
+                        'O2_SENSORS', 'O2_SENSORS_ALT', 'AUX_INPUT_STATUS', 'FUEL_STATUS'}
+
+class PIDSpec:
+    """Configuración de muestreo de un PID.
+
+    `period_moving` y `period_idle` son segundos entre lecturas (0 = en cada
+    ciclo). `priority` 0 son PIDs obligatorios; cuanto mayor, antes se aplazan
+    cuando el adaptador no da para todo.
+    """
+
+    def __init__(self, command, period_moving=0, period_idle=None, priority=1):
+        self.command = command
+        self.period_moving = period_moving
+        self.period_idle = period_moving if period_idle is None else period_idle
+        self.priority = priority
+        self.last_read = None
+        self.reads = 0
+
+    @property
+    def name(self):
+        return self.command.name
+
+    def period(self, moving):
+        return self.period_moving if moving else self.period_idle
+
+class PIDScheduler:
+    """
+    Decide qué PIDs se leen en cada ciclo de adquisición.
+
+    Cada ciclo (`cycle_interval` segundos) dispone de una fracción
+    `bus_fraction` de tiempo de bus. El coste por PID se mide (media móvil) a
+    partir de lo que tardan las consultas reales, así que en adaptadores lentos los PIDs de menor prioridad se leen con menos
+    frecuencia. Un PID que acumula más de `starvation_factor` periodos de
+    retraso se trata como obligatorio para que nunca deje de leerse. El tiempo
+    sobrante se reparte entre `filler_commands` (PIDs soportados no
+    configurados), como mucho uno cada `filler_period` segundos.
+    """
+
+    def __init__(self, specs, cycle_interval=3.0, bus_fraction=0.7, filler_commands=(),
+                 filler_period=30, starvation_factor=3, initial_pid_cost=0.1):
+        self.specs = {spec.name: spec for spec in specs}
+        self.cycle_interval = cycle_interval
+        self.cycle_budget = cycle_interval * bus_fraction
+        self.filler_period = filler_period
+        self.starvation_factor = starvation_factor
+        self.pid_cost = initial_pid_cost
+        self.last_values = {}
+        self._deferred = 0
+        self._fillers = []
+        self._filler_index = 0
+        self.set_filler_commands(filler_commands)
+
+    def set_filler_commands(self, commands):
+        """Registra los PIDs de relleno (solo medidas de modo 01 no configuradas)"""
+        fillers = []
+        for cmd in sorted(commands, key=lambda c: c.command):
+            if cmd.mode != 1 or cmd.name in self.specs or cmd.name in NON_MEASUREMENT_PIDS:
+                continue
+            if cmd.name.startswith('PIDS_'):
+                continue
+            fillers.append(PIDSpec(cmd, self.filler_period, priority=9))
+        self._fillers = fillers
+        self._filler_index = 0
+
+    def _is_due(self, spec, now, moving):
+        return spec.last_read is None or now - spec.last_read >= spec.period(moving)
+
+    def _overdue(self, spec, now, moving):
+        """Periodos de retraso acumulados (infinito si nunca se ha leído)"""
+        if spec.last_read is None:
+            return float('inf')
+        return (now - spec.last_read) / max(spec.period(moving), self.cycle_interval)
+
+    def plan(self, now=None, moving=True):
+        """Comandos a consultar en este ciclo, en orden de prioridad"""
+        now = time.time() if now is None else now
+        due = [spec for spec in self.specs.values() if self._is_due(spec, now, moving)]
+
+        def effective_priority(spec):
+            if spec.priority > 0 and self._overdue(spec, now, moving) >= self.starvation_factor:
+                return 0
+            return spec.priority
+
+        due.sort(key=lambda spec: (effective_priority(spec), -self._overdue(spec, now, moving)))
+
+        selected = []
+        budget = self.cycle_budget
+        for spec in due:
+            if effective_priority(spec) > 0 and budget < self.pid_cost:
+                self._deferred += 1
+                continue
+            selected.append(spec.command)
+            budget -= self.pid_cost
+
+        # Tiempo de bus sobrante: PIDs de relleno en rotación
+        checked = 0
+        while self._fillers and budget >= self.pid_cost and checked < len(self._fillers):
+            spec = self._fillers[self._filler_index]
+            self._filler_index = (self._filler_index + 1) % len(self._fillers)
+            checked += 1
+            if self._is_due(spec, now, moving):
+                selected.append(spec.command)
+                budget -= self.pid_cost
+
+        return selected
+
+    def record(self, commands, values, elapsed, now=None):
+        """Registra el resultado de las consultas del ciclo y actualiza el coste medido"""
+        now = time.time() if now is None else now
+        fillers = {spec.name: spec for spec in self._fillers}
+
+        for cmd in commands:
+            spec = self.specs.get(cmd.name) or fillers.get(cmd.name)
+            if spec is None:
+                continue
+            spec.last_read = now
+            spec.reads += 1
+            if values.get(cmd.name) is not None:
+                self.last_values[cmd.name] = values[cmd.name]
+
+        if commands and elapsed > 0:
+            self.pid_cost = 0.8 * self.pid_cost + 0.2 * (elapsed / len(commands))
+
+    def sample(self, values):
+        """Lectura publicada del ciclo: los PIDs configurados no leídos conservan su último valor"""
+        return {name: values.get(name, self.last_values.get(name)) for name in self.specs}
+
+    def is_filler(self, name):
+        """True si el PID no está configurado (se lee solo con tiempo sobrante)"""
+        return name not in self.specs
+
+    def get_stats(self, now=None, moving=True):
+        now = time.time() if now is None else now
+        return {
+            "pid_cost_ms": round(self.pid_cost * 1000, 1),
+            "cycle_budget_s": self.cycle_budget,
+            "deferred": self._deferred,
+            "fillers": len(self._fillers),
+            "pids": {
+                spec.name: {
+                    "priority": spec.priority,
+                    "period_s": spec.period(moving),
+                    "reads": spec.reads,
+                    "age_s": round(now - spec.last_read, 1) if spec.last_read else None
+                }
+                for spec in list(self.specs.values()) + [f for f in self._fillers if f.reads]
+            }
+        }
@@ -0,0 +1,270 @@
+# =============================================================================
+# SENTINEL PRO - INFORMES PDF EN MEMORIA
+# Render fuera del hilo de la petición, caché por huella del contenido y tendencias de la BD
+# =============================================================================
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from fpdf import FPDF
+
+import database
+
+TREND_METRICS = (
+    # (etiqueta, clave del agregado diario, ancho de columna)
+    ('Muestras', 'sample_count', 22),
+    ('Vel. media', 'speed_avg', 24),
+    ('RPM media', 'rpm_avg', 24),
+    ('RPM max', 'rpm_max', 22),
+    ('Carga media', 'engine_load_avg', 26),
+    ('Refrig. max', 'coolant_temp_max', 26)
+)
+
+def _text(value):
+    """Texto apto para las fuentes estándar de FPDF (latin-1)"""
+    return str(value).encode('latin-1', 'replace').decode('latin-1')
+
+def _score(value):
+    return 'N/D' if value is None else f"{value}/100"
+
+def _round(value, digits=0):
+    if value is None:
+        return None
+    return round(value, digits) if digits else int(round(value))
+
+def get_trend(vehicle_id, days=30, now=None):
+    """Agregados diarios de los últimos `days` días de un vehículo (de la tabla de rollups)"""
+    end_epoch = int(now or time.time())
+    buckets = database.get_telemetry_rollups(vehicle_id, '1d', end_epoch - days * 86400, end_epoch)
+    return [{
+        "day": datetime.fromtimestamp(bucket['bucket_start'], timezone.utc).strftime('%Y-%m-%d'),
+        "sample_count": bucket['sample_count'],
+        "speed_avg": _round(bucket['speed_avg'], 1),
+        "rpm_avg": _round(bucket['rpm_avg']),
+        "rpm_max": _round(bucket['rpm_max']),
+        "engine_load_avg": _round(bucket['engine_load_avg'], 1),
+        "coolant_temp_max": _round(bucket['coolant_temp_max'])
+    } for bucket in buckets]
+
+def build_report(vehicle_info, health, maintenance, vehicle_id=None, trend_days=30):
+    """
+    Datos de un informe: lo que envía el cliente más lo que se lee de la BD
+    (totales de viajes y tendencia diaria) si se conoce el vehículo.
+    """
+    return {
+        "vehicle": {key: vehicle_info.get(key) for key in ('id', 'brand', 'model', 'year')},
+        "health": {
+            "overall_score": health.get('overall_score'),
+            "engine_health": health.get('engine_health'),
+            "thermal_health": health.get('thermal_health'),
+            "efficiency_health": health.get('efficiency_health'),
+            "warnings": list(health.get('warnings') or []),
+            "predictions": list(health.get('predictions') or [])
+        },
+        "maintenance": [{"date": m.get('date'), "type": m.get('type')} for m in (maintenance or [])[:10]],
+        "trip_totals": database.get_trip_totals(vehicle_id) if vehicle_id else None,
+        "trend_days": trend_days,
+        "trend": get_trend(vehicle_id, trend_days) if vehicle_id and trend_days else [],
+        "generated_at": datetime.now().strftime('%d/%m/%Y %H:%M')
+    }
+
+def latest_health(vehicle_id):
+    """Salud del último análisis guardado de un vehículo (puntuaciones None si no tiene)"""
+    latest = database.get_ai_analysis_history(vehicle_id, limit=1)
+    analysis = latest[0] if latest else {}
+    return {
+        "overall_score": analysis.get('health_score'),
+        "engine_health": analysis.get('engine_health'),
+        "thermal_health": analysis.get('thermal_health'),
+        "efficiency_health": analysis.get('efficiency_health'),
+        "warnings": analysis.get('warnings'),
+        "predictions": analysis.get('predictions')
+    }
+
+def gather_vehicle_report(vehicle_id, trend_days=30, health=None):
+    """
+    Informe de un vehículo construido solo con la BD (o None si no existe).
+    Sin `health` se usa su último análisis guardado en ai_analysis.
+    """
+    vehicle = database.get_vehicle_by_id(vehicle_id)
+    if vehicle is None:
+        return None
+
+    if health is None:
+        health = latest_health(vehicle_id)
+    maintenance = [{"date": m['maintenance_date'], "type": m['maintenance_type']}
+                   for m in database.get_maintenance_history(vehicle_id)]
+    return build_report(vehicle, health, maintenance, vehicle_id, trend_days)
+
+def report_fingerprint(report):
+    """Huella del contenido del informe (sin la fecha de generación)"""
+    content = {key: value for key, value in report.items() if key != 'generated_at'}
+    normalized = json.dumps(content, sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+def render_report(report):
+    """Genera el PDF de un informe (salida de build_report) y devuelve sus bytes"""
+    vehicle = report['vehicle']
+    health = report['health']
+
+    pdf = FPDF()
+    pdf.add_page()
+
+    pdf.set_font("Arial", 'B', 20)
+    pdf.cell(0, 10, 'SENTINEL PRO - Informe Diagnostico', 0, 1, 'C')
+    pdf.set_font("Arial", '', 11)
+    pdf.cell(0, 10, _text(f"{vehicle.get('brand') or 'N/D'} {vehicle.get('model') or 'N/D'} - "
+                          f"{vehicle.get('year') or 'N/D'}"), 0, 1, 'C')
+    pdf.cell(0, 5, f"Fecha: {report['generated_at']}", 0, 1, 'C')
+    pdf.ln(10)
+
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(0, 10, f"Puntuacion Salud: {_score(health['overall_score'])}", 0, 1, 'L')
+    pdf.ln(5)
+
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, 'Sistemas:', 0, 1, 'L')
+    pdf.set_font("Arial", '', 10)
+    pdf.cell(0, 6, f"- Motor: {_score(health['engine_health'])}", 0, 1)
+    pdf.cell(0, 6, f"- Termica: {_score(health['thermal_health'])}", 0, 1)
+    pdf.cell(0, 6, f"- Eficiencia: {_score(health['efficiency_health'])}", 0, 1)
+    pdf.ln(5)
+
+    if health['warnings']:
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(0, 10, 'Advertencias:', 0, 1, 'L')
+        pdf.set_font("Arial", '', 9)
+        for w in health['warnings']:
+            pdf.multi_cell(0, 5, _text(f"- {w}"))
+
+    if health['predictions']:
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(0, 10, 'Predicciones:', 0, 1, 'L')
+        pdf.set_font("Arial", '', 9)
+        for p in health['predictions']:
+            pdf.multi_cell(0, 5, _text(f"- {p}"))
+
+    trip_totals = report.get('trip_totals')
+    if trip_totals and trip_totals['trip_count']:
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(0, 10, 'Viajes registrados:', 0, 1, 'L')
+        pdf.set_font("Arial", '', 10)
+        pdf.cell(0, 6, f"- Viajes: {trip_totals['trip_count']}", 0, 1)
+        pdf.cell(0, 6, f"- Distancia total: {round(trip_totals['total_km'], 1)} km", 0, 1)
+        pdf.cell(0, 6, f"- Tiempo de conduccion: {round(trip_totals['total_duration_s'] / 3600, 1)} h", 0, 1)
+        if trip_totals['rpm_max']:
+            pdf.cell(0, 6, f"- RPM max: {round(trip_totals['rpm_max'])}", 0, 1)
+        if trip_totals['coolant_max']:
+            pdf.cell(0, 6, f"- Temp. refrigerante max: {round(trip_totals['coolant_max'])} C", 0, 1)
+
+    if report.get('trend'):
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(0, 10, f"Tendencia (ultimos {report['trend_days']} dias):", 0, 1, 'L')
+        pdf.set_font("Arial", 'B', 8)
+        pdf.cell(24, 6, 'Dia', 1, 0, 'C')
+        for label, _, width in TREND_METRICS:
+            pdf.cell(width, 6, label, 1, 0, 'C')
+        pdf.ln()
+        pdf.set_font("Arial", '', 8)
+        for day in report['trend']:
+            pdf.cell(24, 5, day['day'], 1, 0, 'C')
+            for _, key, width in TREND_METRICS:
+                value = day.get(key)
+                pdf.cell(width, 5, '-' if value is None else str(value), 1, 0, 'R')
+            pdf.ln()
+
+    if report['maintenance']:
+        pdf.ln(5)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(0, 10, 'Mantenimiento:', 0, 1, 'L')
+        pdf.set_font("Arial", '', 9)
+        for m in report['maintenance']:
+            pdf.cell(0, 5, _text(f"- {m.get('date') or 'N/D'}: {m.get('type') or 'N/D'}"), 0, 1)
+
+    # fpdf 1.7 devuelve el documento como str latin-1 con dest='S'
+    return pdf.output(dest='S').encode('latin-1')
+
+class ReportRenderer:
+    """
+    Genera informes PDF en memoria sin ocupar los hilos de Flask.
+
+    Los PDF se generan en un pool de `max_workers` hilos y se guardan en un
+    LRU de hasta `max_bytes` indexado por la huella del contenido: un informe
+    idéntico (mismo vehículo, salud, mantenimiento y tendencia) se devuelve al
+    instante, con la fecha de cuando se generó. Si llega una petición igual a
+    otra que se está generando, espera a esa en lugar de repetirla.
+    """
+
+    def __init__(self, max_workers=1, max_bytes=32 * 1024 * 1024, timeout=30):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="report")
+        self._cache = OrderedDict()
+        self._cache_bytes = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "renders": 0, "errors": 0, "evictions": 0,
+                       "last_render_ms": 0.0}
+
+    def render(self, report):
+        """(bytes del PDF, huella, True si venía de la caché); espera como mucho `timeout`"""
+        key = report_fingerprint(report)
+        with self._lock:
+            pdf = self._cache.get(key)
+            if pdf is not None:
+                self._cache.move_to_end(key)
+                self._stats["hits"] += 1
+                return pdf, key, True
+            self._stats["misses"] += 1
+            future = self._pending.get(key)
+            if future is None:
+                future = self._pending[key] = self._executor.submit(self._render, key, report)
+
+        return future.result(timeout=self.timeout), key, False
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._cache_bytes = 0
+
+    def shutdown(self, wait=False):
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached"] = len(self._cache)
+            stats["cached_mb"] = round(self._cache_bytes / (1024 * 1024), 2)
+        stats["max_mb"] = round(self.max_bytes / (1024 * 1024), 2)
+        return stats
+
+    def _render(self, key, report):
+        started = time.monotonic()
+        try:
+            pdf = render_report(report)
+        except Exception:
+            with self._lock:
+                self._pending.pop(key, None)
+                self._stats["errors"] += 1
+            raise
+
+        with self._lock:
+            self._pending.pop(key, None)
+            self._stats["renders"] += 1
+            self._stats["last_render_ms"] = round((time.monotonic() - started) * 1000, 1)
+            if len(pdf) <= self.max_bytes:
+                self._cache[key] = pdf
+                self._cache_bytes += len(pdf)
+                while self._cache_bytes > self.max_bytes:
+                    _, evicted = self._cache.popitem(last=False)
+                    self._cache_bytes -= len(evicted)
+                    self._stats["evictions"] += 1
+        return pdf
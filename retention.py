@@ -0,0 +1,189 @@
+# =============================================================================
+# SENTINEL PRO - RETENCIÓN Y COMPACTACIÓN DE TELEMETRÍA
+# Poda por lotes cortos por vehículo + auto_vacuum incremental en segundo plano
+# =============================================================================
+
+import threading
+import time
+
+import database
+
+class RetentionService:
+    """
+    Mantiene acotado el tamaño de la base de datos sin bloquear la adquisición.
+
+    Cada `interval` segundos recorre los vehículos con telemetría y borra la
+    cruda más antigua que su política (`raw_days`) en lotes de `batch_size`
+    filas, con una pausa de `batch_pause` segundos entre lotes para que el
+    escritor de telemetría recupere el lock. Nunca se borra telemetría que
+    aún no esté en los agregados, ni la de vehículos que `is_busy(vehicle_id)`
+    marque como ocupados (p. ej. con una importación en curso). Los buckets de
+    1 minuto se podan con `rollup_days`; los de 1h/1d se conservan. Después
+    se devuelven al disco las páginas libres, `vacuum_pages` por paso.
+    `housekeeping` ({nombre: función}) son limpiezas extra que se ejecutan en
+    cada pasada antes de compactar (p. ej. purgar la caché IA caducada); cada
+    función devuelve cuántas filas ha borrado.
+    """
+
+    def __init__(self, raw_days=90, rollup_days=365, interval=3600, batch_size=2000,
+                 batch_pause=0.05, vacuum_pages=256, is_busy=None, housekeeping=None):
+        self.default_policy = {"raw_days": raw_days, "rollup_days": rollup_days}
+        self.interval = interval
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.vacuum_pages = vacuum_pages
+        self.is_busy = is_busy or (lambda vehicle_id: False)
+        self.housekeeping = dict(housekeeping or {})
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "runs": 0,
+            "raw_deleted": 0,
+            "rollups_deleted": 0,
+            "batches": 0,
+            "pages_released": 0,
+            "housekeeping_deleted": 0,
+            "max_batch_ms": 0.0,
+            "last_run": None,
+            "last_run_seconds": 0.0,
+            "last_error": None
+        }
+
+    # -------------------------------------------------------------------------
+    # API pública
+    # -------------------------------------------------------------------------
+
+    def start(self):
+        """Arranca el hilo de retención (idempotente)"""
+        if self._thread and self._thread.is_alive():
+            return False
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-retention", daemon=True)
+        self._thread.start()
+        print(f"[RETENTION] ✓ Servicio iniciado (cada {self.interval}s, lotes de {self.batch_size} filas)")
+        return True
+
+    def stop(self, timeout=None):
+        self._stop_event.set()
+        self._wake_event.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+
+    def trigger(self):
+        """Adelanta la siguiente pasada (no espera a que termine)"""
+        self._wake_event.set()
+
+    def policy_for(self, vehicle_id, policies=None):
+        """Política efectiva de un vehículo: la suya o la de por defecto"""
+        if policies is None:
+            policy = database.get_retention_policy(vehicle_id)
+        else:
+            policy = policies.get(vehicle_id)
+        if policy is None:
+            return dict(self.default_policy, source="default")
+        return {"raw_days": policy["raw_days"], "rollup_days": policy["rollup_days"], "source": "vehicle"}
+
+    def run_once(self):
+        """Una pasada completa de poda y compactación; devuelve lo borrado en ella"""
+        started = time.time()
+        result = {"raw_deleted": 0, "rollups_deleted": 0, "pages_released": 0, "housekeeping": {}}
+        policies = database.get_retention_policies()
+        now = time.time()
+
+        for vehicle_id in database.get_telemetry_vehicle_ids():
+            if self._stop_event.is_set():
+                break
+            if self.is_busy(vehicle_id):
+                continue
+            policy = self.policy_for(vehicle_id, policies)
+            if policy["raw_days"] is not None:
+                result["raw_deleted"] += self._prune_raw(vehicle_id, now - policy["raw_days"] * 86400)
+            if policy["rollup_days"] is not None:
+                result["rollups_deleted"] += database.prune_rollups(
+                    vehicle_id, min(database.ROLLUP_RESOLUTIONS.values()),
+                    int(now - policy["rollup_days"] * 86400))
+
+        for name, task in self.housekeeping.items():
+            try:
+                result["housekeeping"][name] = task()
+            except Exception as e:
+                print(f"[RETENTION] Error en la limpieza {name}: {e}")
+
+        result["pages_released"] = self._compact()
+        if result["raw_deleted"] or result["pages_released"]:
+            database.checkpoint_wal()  # Que el WAL no se quede con el tamaño de la poda
+
+        elapsed = time.time() - started
+        with self._stats_lock:
+            self._stats["runs"] += 1
+            self._stats["raw_deleted"] += result["raw_deleted"]
+            self._stats["rollups_deleted"] += result["rollups_deleted"]
+            self._stats["pages_released"] += result["pages_released"]
+            self._stats["housekeeping_deleted"] += sum(result["housekeeping"].values())
+            self._stats["last_run"] = started
+            self._stats["last_run_seconds"] = round(elapsed, 2)
+        if result["raw_deleted"] or result["rollups_deleted"]:
+            print(f"[RETENTION] {result['raw_deleted']} filas y {result['rollups_deleted']} buckets "
+                  f"eliminados, {result['pages_released']} páginas liberadas en {elapsed:.1f}s")
+        return result
+
+    def get_stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["running"] = bool(self._thread and self._thread.is_alive())
+        stats["interval"] = self.interval
+        stats["default_policy"] = dict(self.default_policy)
+        return stats
+
+    # -------------------------------------------------------------------------
+    # Internos
+    # -------------------------------------------------------------------------
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                with self._stats_lock:
+                    self._stats["last_error"] = str(e)
+                print(f"[RETENTION] Error en la pasada de retención: {e}")
+            self._wake_event.wait(self.interval)
+            self._wake_event.clear()
+
+    def _prune_raw(self, vehicle_id, cutoff_epoch):
+        """Borra la telemetría cruda anterior al corte, lote a lote"""
+        cutoff_ms = int(cutoff_epoch * 1000)
+        coverage_ms = database.get_rollup_coverage_ms(vehicle_id)
+        if coverage_ms is None:
+            return 0  # Sin agregados todavía: no se borra nada
+        cutoff_ms = min(cutoff_ms, coverage_ms)
+
+        deleted = 0
+        while not self._stop_event.is_set():
+            batch_started = time.monotonic()
+            count = database.prune_telemetry_batch(vehicle_id, cutoff_ms, self.batch_size)
+            batch_ms = (time.monotonic() - batch_started) * 1000
+            deleted += count
+            with self._stats_lock:
+                self._stats["batches"] += 1
+                self._stats["max_batch_ms"] = max(self._stats["max_batch_ms"], round(batch_ms, 1))
+            if count < self.batch_size:
+                break
+            self._stop_event.wait(self.batch_pause)
+        return deleted
+
+    def _compact(self):
+        """Libera las páginas vacías en tandas cortas; devuelve cuántas se liberaron"""
+        released = 0
+        free = database.get_storage_stats()["free_pages"]
+        while free and not self._stop_event.is_set():
+            remaining = database.incremental_vacuum(self.vacuum_pages)
+            if remaining >= free:
+                break  # auto_vacuum no incremental: nada que liberar por esta vía
+            released += free - remaining
+            free = remaining
+            self._stop_event.wait(self.batch_pause)
+        return released
@@ -256,6 +256,36 @@ document.addEventListener('DOMContentLoaded', () => {
 
     // === FUNCIONES DE RED ===
 
+    function handleLiveData(data) {
+        if (data.offline === true) {
+            if (isOBDConnected) {
+                console.log('[OBD] Conexión perdida');
+                isOBDConnected = false;
+            }
+            consecutiveFailures++;
+            updateLiveData({
+                RPM: 'Offline',
+                SPEED: 'Offline',
+                THROTTLE_POS: 'Offline',
+                ENGINE_LOAD: 'Offline',
+                MAF: 'Offline',
+                COOLANT_TEMP: 'Offline',
+                INTAKE_TEMP: 'Offline',
+                total_distance: 'Offline'
+            });
+        } else {
+            if (!isOBDConnected) {
+                console.log('[OBD] ✓ Conectado');
+                showConnectionNotification('OBD conectado - Optimizado: críticos 3s, térmicos 60s', 'success');
+            }
+            isOBDConnected = true;
+            consecutiveFailures = 0;
+            updateLiveData(data);
+        }
+
+        updateAnalyzeButton();
+    }
+
     async function fetchLiveData() {
         try {
             const response = await fetch(`${API_URL}/get_live_data`, {
@@ -268,34 +298,7 @@ document.addEventListener('DOMContentLoaded', () => {
             }
 
             const data = await response.json();
-
-            if (data.offline === true) {
-                if (isOBDConnected) {
-                    console.log('[OBD] Conexión perdida');
-                    isOBDConnected = false;
-                }
-                consecutiveFailures++;
-                updateLiveData({
-                    RPM: 'Offline',
-                    SPEED: 'Offline',
-                    THROTTLE_POS: 'Offline',
-                    ENGINE_LOAD: 'Offline',
-                    MAF: 'Offline',
-                    COOLANT_TEMP: 'Offline',
-                    INTAKE_TEMP: 'Offline',
-                    total_distance: 'Offline'
-                });
-            } else {
-                if (!isOBDConnected) {
-                    console.log('[OBD] ✓ Conectado');
-                    showConnectionNotification('OBD conectado - Optimizado: críticos 3s, térmicos 60s', 'success');
-                }
-                isOBDConnected = true;
-                consecutiveFailures = 0;
-                updateLiveData(data);
-            }
-
-            updateAnalyzeButton();
+            handleLiveData(data);
 
         } catch (error) {
             consecutiveFailures++;
@@ -332,6 +335,83 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    // === STREAM EN VIVO (SSE) CON RESPALDO DE POLLING ===
+
+    let liveDataTimer = null;
+    let healthTimer = null;
+
+    function startPolling() {
+        if (liveDataTimer) return;
+        console.log('[STREAM] Usando polling como respaldo');
+        fetchLiveData();
+        liveDataTimer = setInterval(fetchLiveData, POLL_INTERVAL);
+        healthTimer = setInterval(fetchVehicleHealth, 10000);
+    }
+
+    function stopPolling() {
+        clearInterval(liveDataTimer);
+        clearInterval(healthTimer);
+        liveDataTimer = null;
+        healthTimer = null;
+    }
+
+    function startLiveStream() {
+        if (!window.EventSource) {
+            startPolling();
+            return;
+        }
+
+        const source = new EventSource(`${API_URL}/stream/live`);
+
+        source.addEventListener('open', () => {
+            console.log('[STREAM] ✓ Conectado a /stream/live');
+            stopPolling();
+        });
+        source.addEventListener('live', (event) => {
+            handleLiveData(JSON.parse(event.data));
+        });
+        source.addEventListener('health', (event) => {
+            updateHealthDisplay(JSON.parse(event.data));
+        });
+        source.addEventListener('error', () => {
+            // EventSource reconecta solo (con Last-Event-ID); mientras tanto, polling
+            startPolling();
+        });
+    }
+
+    // Los análisis IA se ejecutan en segundo plano: el servidor responde 202
+    // con un job_id y el resultado se consulta hasta que el trabajo termina
+    async function resolveJob(response) {
+        const result = await response.json();
+
+        if (!response.ok) {
+            throw new Error(result.error || 'Error desconocido');
+        }
+        if (response.status !== 202) return result;
+
+        return waitForJob(result.job_id);
+    }
+
+    async function waitForJob(jobId, intervalMs = 1500, maxWaitMs = 120000) {
+        const deadline = Date.now() + maxWaitMs;
+
+        while (Date.now() < deadline) {
+            await new Promise(resolve => setTimeout(resolve, intervalMs));
+
+            const response = await fetch(`${API_URL}/api/jobs/${jobId}`);
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error || 'Error consultando el análisis');
+
+            const job = data.job;
+            if (job.status === 'done') return job.result;
+            if (job.status !== 'queued' && job.status !== 'running') {
+                throw new Error(job.error || `Análisis ${job.status}`);
+            }
+        }
+
+        throw new Error('El análisis está tardando demasiado');
+    }
+
     async function analyzeTrip() {
         const loadingMessage = isOBDConnected
             ? 'Analizando viaje con datos OBD reales...'
@@ -349,11 +429,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 })
             });
 
-            const result = await response.json();
-
-            if (!response.ok) {
-                throw new Error(result.error || 'Error desconocido');
-            }
+            const result = await resolveJob(response);
 
             displayPredictiveAnalysis(result);
 
@@ -621,9 +697,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 body: JSON.stringify({ vehicleInfo, maintenanceHistory })
             });
 
-            const result = await response.json();
-
-            if (!response.ok || result.error) throw new Error(result.error || 'Respuesta no válida.');
+            const result = await resolveJob(response);
 
             valuationResult.innerHTML = `
                 <div class="valuation-prices">
@@ -1127,13 +1201,9 @@ document.addEventListener('DOMContentLoaded', () => {
     loadUploadedCSVs();
     loadVehicles();
 
-    // Polling de datos OBD
-    fetchLiveData();
-    setInterval(fetchLiveData, POLL_INTERVAL);
-
-    // Polling de salud del vehículo
+    // Datos OBD y salud: stream SSE, con polling como respaldo
     fetchVehicleHealth();
-    setInterval(fetchVehicleHealth, 10000);
+    startLiveStream();
 
     console.log('[INIT] ✓ Sistema activo');
 });
@@ -0,0 +1,166 @@
+# =============================================================================
+# SENTINEL PRO - ESCRITOR ASÍNCRONO DE TELEMETRÍA
+# Cola acotada en memoria + commits agrupados con executemany
+# =============================================================================
+
+import queue
+import threading
+import time
+
+import database
+
+class TelemetryWriter:
+    """
+    Agrupa las muestras de telemetría y las escribe en lotes.
+
+    El worker de adquisición solo encola (submit no bloquea nunca); un hilo
+    propio vacía la cola y la vuelca con database.save_telemetry_batch cada
+    `batch_size` filas o cada `flush_interval_ms` milisegundos, lo que ocurra
+    antes. Si la cola se llena las muestras nuevas se descartan y se cuentan
+    en `dropped`. stop() vacía la cola antes de terminar.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=200, flush_interval_ms=1000,
+                 flush_fn=None, max_retries=3):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.flush_fn = flush_fn or database.save_telemetry_batch
+        self.max_retries = max_retries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            "submitted": 0,
+            "written": 0,
+            "dropped": 0,
+            "failed": 0,
+            "flushes": 0,
+            "max_queue_depth": 0,
+            "last_flush_rows": 0,
+            "last_flush_ms": 0.0
+        }
+
+    # -------------------------------------------------------------------------
+    # API pública
+    # -------------------------------------------------------------------------
+
+    def start(self):
+        """Arranca el hilo de escritura (idempotente)"""
+        if self._thread and self._thread.is_alive():
+            return False
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name="telemetry-writer", daemon=True)
+        self._thread.start()
+        print(f"[TELEMETRY] ✓ Escritor iniciado (lote {self.batch_size} filas / {int(self.flush_interval * 1000)} ms)")
+        return True
+
+    def stop(self, timeout=None):
+        """Detiene el hilo garantizando que la cola se vuelca antes de salir"""
+        self._stop_event.set()
+        thread = self._thread
+        if thread and thread.is_alive():
+            thread.join(timeout)
+        else:
+            # Sin hilo activo: vaciar la cola desde el llamador
+            self._drain()
+        print(f"[TELEMETRY] Escritor detenido ({self._stats['written']} filas escritas)")
+
+    def submit(self, vehicle_id, rpm, speed, throttle_position, engine_load,
+               coolant_temp=None, intake_temp=None, maf=None, distance=None,
+               timestamp_ms=None):
+        """Encola una muestra; devuelve False si se descartó por cola llena
+
+        `timestamp_ms` es la hora de la lectura (epoch en ms); si falta se toma
+        la de encolado, nunca la de escritura en la base de datos.
+        """
+        if timestamp_ms is None:
+            timestamp_ms = database.now_ms()
+
+        row = (vehicle_id, timestamp_ms, rpm, speed, throttle_position, engine_load,
+               coolant_temp, intake_temp, maf, distance)
+
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            with self._stats_lock:
+                self._stats["dropped"] += 1
+            return False
+
+        with self._stats_lock:
+            self._stats["submitted"] += 1
+            depth = self._queue.qsize()
+            if depth > self._stats["max_queue_depth"]:
+                self._stats["max_queue_depth"] = depth
+        return True
+
+    def get_stats(self):
+        """Contadores de rendimiento y de contrapresión"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["queue_capacity"] = self._queue.maxsize
+        stats["running"] = bool(self._thread and self._thread.is_alive())
+        return stats
+
+    # -------------------------------------------------------------------------
+    # Hilo de escritura
+    # -------------------------------------------------------------------------
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            batch = self._collect_batch()
+            if batch:
+                self._flush(batch)
+        self._drain()
+
+    def _collect_batch(self):
+        """Espera hasta tener batch_size filas o hasta que venza el intervalo"""
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._stop_event.is_set():
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        return batch
+
+    def _drain(self):
+        """Vuelca todo lo que quede en la cola"""
+        while True:
+            batch = []
+            try:
+                while len(batch) < self.batch_size:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if not batch:
+                return
+            self._flush(batch)
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                self.flush_fn(batch)
+                break
+            except Exception as e:
+                print(f"[TELEMETRY] Error escribiendo lote ({len(batch)} filas, intento {attempt}): {e}")
+                if attempt == self.max_retries:
+                    with self._stats_lock:
+                        self._stats["failed"] += len(batch)
+                    return
+                time.sleep(0.1 * attempt)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._stats_lock:
+            self._stats["written"] += len(batch)
+            self._stats["flushes"] += 1
+            self._stats["last_flush_rows"] = len(batch)
+            self._stats["last_flush_ms"] = round(elapsed_ms, 2)
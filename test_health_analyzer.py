@@ -0,0 +1,287 @@
+# =============================================================================
+# SENTINEL PRO - REGRESIÓN DEL ANALIZADOR INCREMENTAL DE SALUD
+# Compara HealthAnalyzer con el análisis original sobre la lista completa de puntos
+# Ejecutar: python -m pytest -q
+# =============================================================================
+
+import csv
+import random
+import statistics
+from fractions import Fraction
+
+import numpy as np
+import obd
+import pytest
+
+import offline_analysis
+from health_analyzer import HealthAnalyzer, RunningStat, evaluate_points
+from pid_scheduler import PIDScheduler, PIDSpec
+from trip_buffer import TripBuffer
+
+# =============================================================================
+# REFERENCIA: analyze_vehicle_health original (obd_server.py, sin la parte de BD)
+# =============================================================================
+
+def reference_health(trip_points):
+    if not trip_points or len(trip_points) < 10:
+        return None
+
+    rpms = [p.get('RPM', 0) for p in trip_points if p.get('RPM') and p.get('RPM') > 0]
+    throttles = [p.get('THROTTLE_POS', 0) for p in trip_points if p.get('THROTTLE_POS') is not None]
+    loads = [p.get('ENGINE_LOAD', 0) for p in trip_points if p.get('ENGINE_LOAD') is not None]
+    mafs = [p.get('MAF', 0) for p in trip_points if p.get('MAF') and p.get('MAF') > 0]
+    temps_coolant = [p.get('COOLANT_TEMP', 0) for p in trip_points if p.get('COOLANT_TEMP') and p.get('COOLANT_TEMP') > 0]
+    temps_intake = [p.get('INTAKE_TEMP', 0) for p in trip_points if p.get('INTAKE_TEMP') and p.get('INTAKE_TEMP') > 0]
+
+    warnings = []
+    predictions = []
+
+    # 1. SALUD DEL MOTOR
+    engine_health = 100
+    if rpms:
+        rpm_max = max(rpms)
+
+        high_rpm_count = sum(1 for r in rpms if r > 4000)
+        high_rpm_ratio = high_rpm_count / len(rpms)
+
+        if high_rpm_ratio > 0.3:
+            engine_health -= 20
+            warnings.append("⚠️ Uso frecuente de RPM altas (>4000). Aumenta desgaste del motor.")
+            predictions.append("Riesgo medio de desgaste prematuro de componentes en 12-18 meses")
+
+        if rpm_max > 6000:
+            engine_health -= 15
+            warnings.append("🔴 RPM CRÍTICAS detectadas (>6000). Revisar limitador.")
+
+    if loads:
+        load_avg = statistics.mean(loads)
+        if load_avg > 80:
+            engine_health -= 10
+            warnings.append("⚠️ Carga motor alta (>80%). Revisar admisión.")
+
+    # 2. SALUD TÉRMICA
+    thermal_health = 100
+    if temps_coolant:
+        temp_max = max(temps_coolant)
+        temp_avg = statistics.mean(temps_coolant)
+
+        if temp_max > 105:
+            thermal_health -= 30
+            warnings.append("🔴 CRÍTICO: Temperatura >105°C. Revisar sistema URGENTE.")
+            predictions.append("Riesgo ALTO de fallo en junta culata o radiador en 1-3 meses")
+        elif temp_avg > 95:
+            thermal_health -= 15
+            warnings.append("⚠️ Temperatura elevada. Revisar termostato y radiador.")
+            predictions.append("Riesgo medio de sobrecalentamiento. Mantenimiento en 3-6 meses")
+
+    if temps_intake:
+        temp_intake_avg = statistics.mean(temps_intake)
+        if temp_intake_avg > 50:
+            thermal_health -= 10
+            warnings.append("⚠️ Temperatura admisión alta. Revisar intercooler.")
+
+    # 3. EFICIENCIA
+    efficiency_health = 100
+    if mafs:
+        maf_avg = statistics.mean(mafs)
+        if maf_avg < 10 or maf_avg > 80:
+            efficiency_health -= 15
+            warnings.append("⚠️ Flujo aire anómalo. Revisar MAF y filtro.")
+            predictions.append("Posible obstrucción en admisión. Reducción eficiencia 5-10%")
+
+    if throttles and len(throttles) > 1:
+        harsh_accel = 0
+        for i in range(1, len(throttles)):
+            if throttles[i] - throttles[i-1] > 30:
+                harsh_accel += 1
+
+        harsh_ratio = harsh_accel / len(throttles)
+        if harsh_ratio > 0.05:
+            efficiency_health -= 10
+            warnings.append("⚠️ Conducción agresiva. Aumenta consumo y desgaste.")
+
+    # PUNTUACIÓN GLOBAL
+    overall_score = round((engine_health + thermal_health + efficiency_health) / 3)
+
+    return {
+        "overall_score": overall_score,
+        "engine_health": round(engine_health),
+        "thermal_health": round(thermal_health),
+        "efficiency_health": round(efficiency_health),
+        "warnings": warnings,
+        "predictions": predictions
+    }
+
+# =============================================================================
+# VIAJES GRABADOS (generados con semilla fija para que sean reproducibles)
+# =============================================================================
+
+def _trip(seed, samples, rpm, load, coolant, intake, maf, throttle_jump=0.0, gaps=0.0):
+    """Viaje con lecturas en torno a los valores dados; `gaps` = fracción de PIDs sin respuesta"""
+    rng = random.Random(seed)
+    points = []
+    throttle = 15.0
+    for _ in range(samples):
+        if rng.random() < throttle_jump:
+            throttle = min(100.0, throttle + rng.uniform(31, 60))
+        else:
+            throttle = throttle * 0.5 + rng.uniform(0, 10)  # Vuelve enseguida a ~15%
+        point = {
+            'RPM': max(0.0, rng.gauss(*rpm)),
+            'SPEED': max(0.0, rng.gauss(60, 20)),
+            'THROTTLE_POS': round(throttle, 1),
+            'ENGINE_LOAD': round(min(100.0, max(0.0, rng.gauss(*load))), 2),
+            'COOLANT_TEMP': round(rng.gauss(*coolant), 1),
+            'INTAKE_TEMP': round(rng.gauss(*intake), 1),
+            'MAF': round(max(0.0, rng.gauss(*maf)), 2)
+        }
+        for key in list(point):
+            if rng.random() < gaps:
+                point[key] = None
+        points.append(point)
+    return points
+
+RECORDED_TRIPS = {
+    "ciudad": _trip(1, 900, (1800, 400), (35, 10), (88, 3), (30, 5), (12, 4)),
+    "autopista": _trip(2, 2400, (2900, 300), (55, 8), (91, 2), (35, 4), (28, 6)),
+    "motor_exigido": _trip(3, 600, (4600, 900), (84, 6), (98, 2), (52, 3), (85, 10), throttle_jump=0.1),
+    "sobrecalentamiento": _trip(4, 500, (2200, 300), (45, 5), (103, 2), (40, 3), (20, 5)),
+    "conduccion_agresiva": _trip(5, 700, (3000, 1200), (60, 20), (92, 4), (38, 6), (6, 3), throttle_jump=0.12),
+    "lecturas_incompletas": _trip(6, 400, (2100, 600), (50, 15), (96, 3), (49, 4), (40, 20), gaps=0.3),
+    "ralenti": _trip(7, 300, (0, 0), (15, 3), (85, 2), (25, 2), (0, 0)),
+    "muy_corto": _trip(8, 9, (2000, 100), (40, 5), (90, 1), (30, 1), (15, 2))
+}
+
+# =============================================================================
+# TESTS
+# =============================================================================
+
+@pytest.mark.parametrize("name", sorted(RECORDED_TRIPS))
+def test_streaming_matches_reference(name):
+    points = RECORDED_TRIPS[name]
+    assert evaluate_points(points) == reference_health(points)
+
+@pytest.mark.parametrize("name", sorted(RECORDED_TRIPS))
+def test_snapshot_at_every_sample_matches_reference(name):
+    points = RECORDED_TRIPS[name][:300]
+    analyzer = HealthAnalyzer()
+    for i, point in enumerate(points, 1):
+        analyzer.add_sample(point)
+        expected = reference_health(points[:i])
+        assert (analyzer.evaluate() if analyzer.has_enough_data() else None) == expected
+
+def test_trips_cover_every_rule():
+    """Los viajes grabados disparan todas las advertencias (si no, la comparación no prueba nada)"""
+    warnings = set()
+    for points in RECORDED_TRIPS.values():
+        result = reference_health(points)
+        if result:
+            warnings.update(result["warnings"])
+    assert len(warnings) == 8
+
+def _state(analyzer):
+    """Acumulados del analizador comparables entre sí"""
+    return {key: (value.count, value.total, value.max) if isinstance(value, RunningStat) else value
+            for key, value in vars(analyzer).items()}
+
+@pytest.mark.parametrize("name", sorted(RECORDED_TRIPS))
+def test_live_score_matches_recorded_points(name):
+    """Con un plan que aplaza PIDs, la salud en vivo coincide con la de los puntos grabados del viaje"""
+    schedule = [("RPM", 0, 0), ("SPEED", 0, 0), ("THROTTLE_POS", 0, 1), ("ENGINE_LOAD", 0, 1),
+                ("MAF", 0, 1), ("COOLANT_TEMP", 10, 2), ("INTAKE_TEMP", 10, 2)]
+    scheduler = PIDScheduler([PIDSpec(obd.commands[pid], period, priority=priority)
+                              for pid, period, priority in schedule],
+                             cycle_interval=3.0, initial_pid_cost=0.4)
+    analyzer = HealthAnalyzer()
+    points = TripBuffer()
+
+    # Igual que acquire_sample: se leen los PIDs del plan y se publica la lectura del planificador
+    for i, recorded in enumerate(RECORDED_TRIPS[name]):
+        now = i * scheduler.cycle_interval
+        commands = scheduler.plan(now)
+        values = {cmd.name: recorded.get(cmd.name) for cmd in commands}
+        scheduler.record(commands, values, 0, now)
+        results = scheduler.sample(values)
+        points.append(results, timestamp=now)
+        analyzer.add_sample(results)
+
+    if len(points) > 20:
+        assert any(spec.reads < len(points) for spec in scheduler.specs.values())
+    recorded_points = list(points)
+    replay = HealthAnalyzer()
+    for point in recorded_points:
+        replay.add_sample(point)
+    assert _state(analyzer) == _state(replay)
+
+    expected = evaluate_points(recorded_points)
+    assert (analyzer.evaluate() if analyzer.has_enough_data() else None) == expected
+    assert expected == reference_health(recorded_points)
+
+def test_running_mean_is_exact():
+    rng = random.Random(42)
+    for _ in range(200):
+        values = [rng.uniform(-1e6, 1e6) for _ in range(rng.randint(1, 50))]
+        stat = RunningStat()
+        for value in values:
+            stat.add(value)
+        assert stat.mean() == statistics.mean(values)
+        assert stat.max == max(values)
+
+def test_exact_mean_on_threshold_boundary():
+    """Media exacta 80 (no supera el umbral) aunque la suma en float dé 80.00000000000001"""
+    loads = [80.1] + [79.98] * 5
+    assert sum(loads) / len(loads) > 80
+    assert statistics.mean(loads) == 80
+
+    points = [{'RPM': 2000, 'ENGINE_LOAD': load} for load in loads]
+    points += [{'RPM': 2000} for _ in range(10 - len(points))]
+    result = evaluate_points(points)
+    assert result == reference_health(points)
+    assert result["engine_health"] == 100
+
+def _write_csv(path, points):
+    """CSV con las columnas de csv_logger, una muestra cada 3 s (repr conserva cada float)"""
+    columns = [('rpm', 'RPM'), ('speed_kmh', 'SPEED'), ('throttle_pos', 'THROTTLE_POS'),
+               ('engine_load', 'ENGINE_LOAD'), ('maf', 'MAF'), ('coolant_temp', 'COOLANT_TEMP'),
+               ('intake_temp', 'INTAKE_TEMP')]
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['timestamp'] + [header for header, _ in columns])
+        for i, point in enumerate(points):
+            writer.writerow([1700000000 + 3 * i] +
+                            ['' if point.get(key) is None else repr(point[key]) for _, key in columns])
+
+BOUNDARY_TRIP = [{'RPM': 2000, 'ENGINE_LOAD': load} for load in [80.1] + [79.98] * 5] + \
+    [{'RPM': 2000} for _ in range(4)]
+
+@pytest.mark.parametrize("name", sorted(RECORDED_TRIPS) + ["limite_carga"])
+def test_offline_csv_matches_streaming(name, tmp_path, monkeypatch):
+    """analyze_csv (vectorizado y por bloques) puntúa igual que evaluate_points"""
+    points = BOUNDARY_TRIP if name == "limite_carga" else RECORDED_TRIPS[name]
+    path = tmp_path / "viaje.csv"
+    _write_csv(path, points)
+    monkeypatch.setattr(offline_analysis, 'CHUNK_SIZE', 97)  # Varios bloques por viaje
+
+    results, rows = offline_analysis.analyze_csv(str(path), assume_utc=True, group_by='all')
+    assert rows == len(points)
+
+    expected = evaluate_points(points)
+    if expected is None:
+        assert results == []
+        return
+    assert len(results) == 1
+    result = results[0]
+    assert {
+        "overall_score": result["health_score"],
+        "engine_health": result["engine_health"],
+        "thermal_health": result["thermal_health"],
+        "efficiency_health": result["efficiency_health"],
+        "warnings": result["warnings"],
+        "predictions": result["predictions"]
+    } == expected
+
+def test_exact_sum_matches_fractions():
+    rng = np.random.default_rng(7)
+    for values in (rng.normal(90, 5, 1000).round(1), rng.uniform(-1e6, 1e6, 1000),
+                   np.array([80.1] + [79.98] * 5), np.array([0.0, -0.0, 1e-300, 3.5])):
+        assert offline_analysis.exact_sum(values) == sum(map(Fraction, values.tolist()), Fraction(0))
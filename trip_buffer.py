@@ -0,0 +1,156 @@
+# =============================================================================
+# SENTINEL PRO - BUFFER COLUMNAR DE PUNTOS DE VIAJE
+# Una columna array('d') por PID en lugar de un dict por lectura
+# =============================================================================
+
+import math
+import time
+import statistics
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Columnas que se guardan por cada punto del viaje (claves de los comandos OBD)
+TRIP_COLUMNS = (
+    'RPM', 'SPEED', 'THROTTLE_POS', 'ENGINE_LOAD', 'MAF',
+    'COOLANT_TEMP', 'INTAKE_TEMP', 'total_distance'
+)
+
+NAN = float('nan')
+
+def _to_float(value):
+    if value is None:
+        return NAN
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return NAN
+
+def _from_float(value):
+    return None if math.isnan(value) else value
+
+class TripBuffer:
+    """
+    Puntos del viaje almacenados por columnas (8 bytes por valor).
+
+    Los valores ausentes se guardan como NaN y se devuelven como None. Si se
+    indica `capacity` el buffer actúa como anillo y conserva solo los últimos
+    `capacity` puntos; `appended` cuenta todos los puntos añadidos.
+    """
+
+    def __init__(self, columns=TRIP_COLUMNS, capacity=None):
+        self.columns = tuple(columns)
+        self.capacity = capacity
+        self.timestamps = array('d')
+        self._data = {name: array('d') for name in self.columns}
+        self.appended = 0
+
+    # -------------------------------------------------------------------------
+    # Escritura
+    # -------------------------------------------------------------------------
+
+    def append(self, point, timestamp=None):
+        """Añade un punto (dict con claves de TRIP_COLUMNS)"""
+        self.timestamps.append(time.time() if timestamp is None else timestamp)
+        for name in self.columns:
+            self._data[name].append(_to_float(point.get(name)))
+        self.appended += 1
+
+        # Recorte por bloques para que el anillo no desplace memoria en cada muestra
+        if self.capacity and len(self.timestamps) > self.capacity + max(1, self.capacity // 8):
+            excess = len(self.timestamps) - self.capacity
+            del self.timestamps[:excess]
+            for column in self._data.values():
+                del column[:excess]
+
+    def clear(self):
+        del self.timestamps[:]
+        for column in self._data.values():
+            del column[:]
+        self.appended = 0
+
+    # -------------------------------------------------------------------------
+    # Lectura
+    # -------------------------------------------------------------------------
+
+    def _offset(self):
+        if self.capacity and len(self.timestamps) > self.capacity:
+            return len(self.timestamps) - self.capacity
+        return 0
+
+    def __len__(self):
+        return len(self.timestamps) - self._offset()
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.point(i)
+
+    def point(self, index):
+        """Devuelve el punto `index` como dict (acepta índices negativos)"""
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("índice de punto fuera de rango")
+        i = index + self._offset()
+        point = {name: _from_float(self._data[name][i]) for name in self.columns}
+        point['timestamp'] = self.timestamps[i]
+        return point
+
+    def last(self):
+        """Último punto o None si el buffer está vacío"""
+        return self.point(-1) if len(self) else None
+
+    def column(self, name):
+        """Vista de solo lectura de una columna (NaN = valor ausente)"""
+        offset = self._offset()
+        return memoryview(self._data[name])[offset:]
+
+    def time_column(self):
+        return memoryview(self.timestamps)[self._offset():]
+
+    def index_range(self, start=None, end=None):
+        """Índices [i, j) de los puntos con start <= timestamp <= end"""
+        times = self.time_column()
+        i = 0 if start is None else bisect_left(times, start)
+        j = len(times) if end is None else bisect_right(times, end)
+        return i, j
+
+    def slice_by_time(self, start=None, end=None):
+        """Copia compacta de los puntos dentro del intervalo de tiempo"""
+        i, j = self.index_range(start, end)
+        offset = self._offset()
+        result = TripBuffer(self.columns)
+        result.timestamps = self.timestamps[offset + i:offset + j]
+        result._data = {name: column[offset + i:offset + j] for name, column in self._data.items()}
+        result.appended = j - i
+        return result
+
+    def values(self, name, nonzero=False, positive=False):
+        """Valores presentes de una columna, con el mismo filtrado que `if p.get(...)`"""
+        for value in self.column(name):
+            if math.isnan(value):
+                continue
+            if nonzero and value == 0:
+                continue
+            if positive and value <= 0:
+                continue
+            yield value
+
+    def stats(self, name, nonzero=False, positive=False):
+        """Conteo, media y máximo de una columna calculados directamente sobre el array"""
+        values = list(self.values(name, nonzero=nonzero, positive=positive))
+        if not values:
+            return {"count": 0, "mean": None, "max": None}
+        return {
+            "count": len(values),
+            "mean": statistics.fmean(values),
+            "max": max(values)
+        }
+
+    def memory_bytes(self):
+        """Memoria aproximada ocupada por las columnas"""
+        itemsize = self.timestamps.itemsize
+        return itemsize * len(self.timestamps) * (len(self.columns) + 1)
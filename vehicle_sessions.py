@@ -0,0 +1,128 @@
+# =============================================================================
+# SENTINEL PRO - SESIONES DE ADQUISICIÓN POR VEHÍCULO
+# Cada adaptador OBD-II tiene su propia conexión, viaje y estado de salud
+# =============================================================================
+
+import threading
+import time
+
+from health_analyzer import HealthAnalyzer
+from trip_buffer import TripBuffer
+
+def default_health():
+    """Estado de salud inicial de una sesión"""
+    return {
+        "overall_score": 100,
+        "engine_health": 100,
+        "thermal_health": 100,
+        "efficiency_health": 100,
+        "warnings": [],
+        "predictions": [],
+        "last_update": None
+    }
+
+class VehicleSession:
+    """
+    Estado de adquisición de un adaptador conectado a un vehículo.
+
+    Solo el worker de la sesión toca `connection`; `lock` protege `trip` y el
+    analizador de salud frente a los endpoints que los leen.
+    """
+
+    def __init__(self, port, vehicle_id=None, trip_capacity=None, primary=False):
+        self.port = port
+        self.vehicle_id = vehicle_id
+        self.primary = primary
+        self.trip_capacity = trip_capacity
+        self.created_at = time.time()
+
+        self.connection = None
+        self.supported_commands = set()
+        self.last_connection_attempt = 0
+        self.pid_reader = None
+        self.pid_scheduler = None
+        self.worker = None
+
+        self.lock = threading.RLock()
+        self.health_analyzer = HealthAnalyzer()
+        self.health = default_health()
+        self.trip = {}
+        self.reset_trip()
+
+    def reset_trip(self):
+        """Empieza un viaje vacío y reinicia los acumulados de salud"""
+        with self.lock:
+            self.trip = {
+                "active": False,
+                "start_time": None,
+                "last_read_time": None,
+                "distance_km": 0.0,
+                "idle_since": None,
+                "points": TripBuffer(capacity=self.trip_capacity)
+            }
+            self.health_analyzer.reset()
+
+    def is_connected(self):
+        return bool(self.connection and self.connection.is_connected())
+
+    def describe(self):
+        """Resumen de la sesión para la API"""
+        with self.lock:
+            trip_active = self.trip["active"]
+            trip_points = self.trip["points"].appended
+        return {
+            "port": self.port,
+            "vehicle_id": self.vehicle_id,
+            "primary": self.primary,
+            "connected": self.is_connected(),
+            "running": bool(self.worker and self.worker.is_running()),
+            "trip_active": trip_active,
+            "trip_points": trip_points,
+            "overall_score": self.health["overall_score"],
+            "created_at": self.created_at
+        }
+
+class SessionManager:
+    """Registro de sesiones indexado por puerto (un adaptador = una sesión)"""
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def add(self, session):
+        """Registra una sesión; falla si el puerto o el vehículo ya tienen una"""
+        with self._lock:
+            if session.port in self._sessions:
+                raise ValueError(f"El puerto {session.port} ya tiene una sesión")
+            if session.vehicle_id is not None and any(
+                    s.vehicle_id == session.vehicle_id for s in self._sessions.values()):
+                raise ValueError(f"El vehículo {session.vehicle_id} ya tiene una sesión")
+            self._sessions[session.port] = session
+        return session
+
+    def remove(self, port):
+        with self._lock:
+            return self._sessions.pop(port, None)
+
+    def get(self, port):
+        with self._lock:
+            return self._sessions.get(port)
+
+    def find_vehicle(self, vehicle_id):
+        """Sesión que está registrando un vehículo (o None)"""
+        with self._lock:
+            for session in self._sessions.values():
+                if session.vehicle_id == vehicle_id:
+                    return session
+        return None
+
+    def primary(self):
+        with self._lock:
+            for session in self._sessions.values():
+                if session.primary:
+                    return session
+        return None
+
+    def all(self):
+        with self._lock:
+            return list(self._sessions.values())